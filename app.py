@@ -3,24 +3,56 @@ Hejbot - A Python Slack App Boilerplate
 Built with Slack Bolt framework for Python
 """
 
+from config import Config
+
+if __name__ == "__main__" and Config.RUNTIME == "async":
+    # Hand over before the sync app below is imported and built
+    import async_app
+
+    async_app.main()
+    raise SystemExit
+
 from datetime import datetime
+import json
 import logging
+import re
+import signal
+import sys
 import uuid
-from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
-from openai import OpenAI
 
 from scheduler.scheduler import (
-    PostTypes,
     Scheduler,
     consume_scheduled_post,
-    get_post_type_display_text,
+    get_scheduled_posts_page,
 )
 
-from config import Config
-from db import setup_db, query
-
-client = OpenAI(api_key=Config.OPEN_AI_KEY)
+from chat_helper import get_user_directory
+from cv_cache import cv_cache
+from cv_generator import delete_summary
+from cv_ingest import CvEntryBuffer, message_key
+from cv_jobs import CvJobQueue
+from db import ConnectionPool, pool_metrics, setup_db, query
+from fast_ack import (
+    TimedApp,
+    dedupe_event_retries,
+    event_ids,
+    listener_executor,
+    use_instrumented_client,
+)
+from instrumentation import instrument_listener, start_metrics_server
+from leader import LeaderElector
+from metrics import register_collector
+from prompt_templates import prompts
+from slack_client import InstrumentedWebClient
+from views import (
+    create_post_modal,
+    demo_button_blocks,
+    home_view,
+    parse_post_filters,
+    posts_page_size,
+    scheduled_posts_message,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -29,8 +61,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+cv_entry_buffer = CvEntryBuffer(logger=logger)
+
 # Initialize the Slack app
-app = App(token=Config.SLACK_BOT_TOKEN, signing_secret=Config.SLACK_SIGNING_SECRET)
+app = TimedApp(
+    name="hejbot",  # otherwise Bolt inspects the call stack to make one up
+    signing_secret=Config.SLACK_SIGNING_SECRET,
+    client=InstrumentedWebClient(
+        token=Config.SLACK_BOT_TOKEN, base_url=Config.SLACK_API_URL
+    ),
+    listener_executor=listener_executor,
+    token_verification_enabled=False,  # checked in main(), not on import
+)
+app.middleware(dedupe_event_retries)
+app.middleware(use_instrumented_client)
+
+cv_job_queue = CvJobQueue(logger=logger, app=app)
 
 command_prefix = "dev-" if Config.DEV else ""
 
@@ -40,6 +86,7 @@ command_prefix = "dev-" if Config.DEV else ""
 
 
 @app.event("app_mention")
+@instrument_listener
 def handle_app_mention(event, say, logger):
     """
     Respond when the bot is mentioned in a channel.
@@ -61,6 +108,7 @@ def handle_app_mention(event, say, logger):
 
 
 @app.event("message")
+@instrument_listener
 def handle_message_events(event, logger):
     """
     Handle message events (logged but not responded to automatically).
@@ -73,15 +121,31 @@ def handle_message_events(event, logger):
     if event.get("subtype") == "bot_message" or "text" not in event:
         return
 
-    logger.info(f"Message event: {event}")
-
-    # Add CV entry to database
+    # Queue CV entry for the next bulk insert
     user_id = event.get("user")
+    logger.debug(f"Message from {user_id} in {event.get('channel')}")
     text = event.get("text")
-    query(
-        "INSERT INTO cv_entries (user_id,text,timestamp) VALUES (%s,%s,%s)",
-        (user_id, text, datetime.now()),
-    )
+    if not cv_entry_buffer.add(
+        user_id, text, datetime.now(), event_key=message_key(event)
+    ):
+        logger.warning(f"CV entry buffer full, dropped message from {user_id}")
+    cv_cache.invalidate_user(user_id)
+
+
+@app.event("user_change")
+@app.event("team_join")
+@instrument_listener
+def handle_user_directory_events(event, logger):
+    """
+    Keep the user directory current between full refreshes.
+
+    Args:
+        event: The event data from Slack
+        logger: Logger instance
+    """
+    user = event["user"]
+    logger.debug(f"Updating user directory for {user['id']}")
+    get_user_directory(app).apply_user(user)
 
 
 # ============================================================================
@@ -90,6 +154,7 @@ def handle_message_events(event, logger):
 
 
 @app.command("/hello")
+@instrument_listener
 def handle_hello_command(ack, command, say, logger):
     """
     Handle the /hello slash command.
@@ -114,6 +179,7 @@ def handle_hello_command(ack, command, say, logger):
 
 
 @app.action("button_click")
+@instrument_listener
 def handle_button_click(ack, body, say, logger):
     """
     Handle button click interactions.
@@ -133,6 +199,7 @@ def handle_button_click(ack, body, say, logger):
 
 
 @app.command("/demo-button")
+@instrument_listener
 def handle_demo_button_command(ack, command, say):
     """
     Demo command that shows an interactive button.
@@ -144,171 +211,78 @@ def handle_demo_button_command(ack, command, say):
     """
     ack()
 
-    say(
-        blocks=[
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": "Click the button below to see an interactive response!",
-                },
-            },
-            {
-                "type": "actions",
-                "elements": [
-                    {
-                        "type": "button",
-                        "text": {"type": "plain_text", "text": "Click Me"},
-                        "action_id": "button_click",
-                        "style": "primary",
-                    }
-                ],
-            },
-        ]
-    )
+    say(blocks=demo_button_blocks())
 
 
-@app.command(f"/{command_prefix}cv")
-def handle_cv_command(ack, command, say, logger):
+@instrument_listener
+def acknowledge(ack):
+    """Ack function for handlers that do all their work in lazy listeners."""
     ack()
-    if not command.get("text"):
-        ack("Please provide a query text. Usage: /cv <your text>")
-        return
-    text = command.get("text")
-    user_id = command.get("user_id")
 
-    if text.lower() == "generate":
-        ack("Genererar din CV post...")
-        logger.info("Generating CV...")
-
-        user_info = app.client.users_info(user=user_id)
-        first_name = user_info["user"]["profile"]["first_name"]
 
-        entries = query(
-            "SELECT user_id,text,timestamp FROM cv_entries WHERE user_id=%s", (user_id,)
-        )
-        entries_text = "\n-----------\n".join(
-            [
-                f"Text: {entry['text']}\nTimestamp: {entry['timestamp']}"
-                for entry in entries
-            ]
-        )
+@instrument_listener
+def ack_cv_command(ack, command):
+    text = (command.get("text") or "").lower()
+    if not text:
+        ack("Please provide a query text. Usage: /cv <your text>")
+    elif text == "generate":
+        ack("Genererar din CV post...")
+    elif text == "delete":
+        ack("Raderar dina CV poster")
+    else:
+        ack()
 
-        with open("cv_example.txt", "r") as f:
-            cv_example = f.read()
 
-        input = (
-            f"Create a CV post for {first_name} based on the following entries:\n\n"
-            f"{entries_text}"
-        )
-        instructions = (
-            "You are a senior consultant profile writer at a tech consulting company.\n"
-            "Your task is to generate a high-quality CV assignment description based on short notes collected from internal updates (Slack messages, meeting notes, project logs, etc.).\n"
-            "Guidelines: Write in past tense and in third person (he/she/they).\n"
-            "The text must read as a coherent narrative, not bullet points.\n"
-            "Tone: professional, factual, while emphasizing impact, collaboration and problem-solving.\n"
-            "Do not invent details, but you may logically combine and interpret provided notes to form a cohesive story.\n"
-            "Highlight the consultant’s role, client context, challenges, contributions, collaboration, and results — even if only partially implied.\n"
-            "Do not include dates or timestamps. Max 10 lines of text.\n"
-            "Include: Who the client is (describe based on context, e.g., “a leading streaming provider” or “a major public service media company”), the consultant’s role and responsibilities, the client’s challenges and what needed improvement, actions taken including both technical and collaborative contributions, and outcomes and impact (quality improvements, new features, better processes, increased engagement, smoother releases, etc.).\n"
-            "Write in a style similar to a modern consulting CV, concise but substantial, flowing naturally.\n"
-            "Write in the same format and style as the following CV examples:\n\n"
-            f"{cv_example}"
-        )
+@instrument_listener
+def handle_cv_command(command, say, logger):
+    text = command.get("text")
+    if not text:
+        return
+    user_id = command.get("user_id")
 
-        response = client.responses.create(
-            model="gpt-5-nano", input=input, instructions=instructions
-        )
-        say(text=response.output_text)
+    if text.lower() == "generate":
+        job_id = cv_job_queue.submit(user_id, response_url=command.get("response_url"))
+        if job_id is None:
+            say("Det är många som genererar CV just nu, försök igen om en stund.")
+            return
+        logger.info(f"Queued CV job {job_id} for {user_id}")
 
     if text.lower() == "delete":
-        ack("Raderar dina CV poster")
         query("DELETE FROM cv_entries WHERE user_id=%s", (user_id,))
-        logger.info(f"Deleted entries for{user_id} ")
+        delete_summary(user_id)
+        cv_cache.invalidate_user(user_id)
+        logger.info(f"Deleted entries for {user_id}")
 
 
-@app.command(f"/{command_prefix}admin")
-def handle_admin_command(ack, command, say):
-    ack()
+app.command(f"/{command_prefix}cv")(ack=ack_cv_command, lazy=[handle_cv_command])
+
+
+@instrument_listener
+def handle_admin_command(command, say, client):
     text = command.get("text").lower()
 
-    if text == "list posts":
-        posts = query(
-            "SELECT post_id,type,text,added_by FROM scheduled_posts LIMIT 999"
-        )
+    if text.startswith("list posts"):
+        try:
+            filters = parse_post_filters(
+                command.get("text")[len("list posts") :],
+                get_user_directory(app).get_by_name,
+            )
+        except ValueError as e:
+            say(f"Okänt filter: {e}")
+            return
 
+        posts, _, has_next = get_scheduled_posts_page(
+            limit=posts_page_size(), **filters
+        )
         if len(posts) == 0:
             say("Det finns inga schemalagda poster")
             return
 
-        say(
-            text="Schemalagda poster:",
-            attachments=[
-                {
-                    "fallback": post["text"],
-                    "blocks": [
-                        {
-                            "type": "section",
-                            "text": {
-                                "type": "mrkdwn",
-                                "text": post["text"],
-                            },
-                        },
-                        {
-                            "type": "context",
-                            "elements": [
-                                {
-                                    "type": "mrkdwn",
-                                    "text": f"Skapad av: <@{post['added_by']}>\nTidpunkt: {get_post_type_display_text(PostTypes[post['type']])}\nId: {post['post_id']}",
-                                }
-                            ],
-                        },
-                    ],
-                }
-                for post in posts
-            ],
-        )
+        say(**scheduled_posts_message(posts, filters, False, has_next))
         return
     elif text == "create post":
-        app.client.views_open(
-            trigger_id=command.get("trigger_id"),
-            view={
-                "type": "modal",
-                "callback_id": "create_post_dialog",
-                "title": {"type": "plain_text", "text": "Skapa en ny post"},
-                "submit": {"type": "plain_text", "text": "Skapa"},
-                "blocks": [
-                    {
-                        "type": "input",
-                        "block_id": "text_block",
-                        "element": {
-                            "type": "plain_text_input",
-                            "action_id": "text",
-                            "multiline": True,
-                        },
-                        "label": {"type": "plain_text", "text": "Meddelande"},
-                    },
-                    {
-                        "type": "input",
-                        "block_id": "type_block",
-                        "element": {
-                            "type": "static_select",
-                            "action_id": "type",
-                            "options": [
-                                {
-                                    "text": {
-                                        "type": "plain_text",
-                                        "text": get_post_type_display_text(post_type),
-                                    },
-                                    "value": post_type.value,
-                                }
-                                for post_type in PostTypes
-                            ],
-                        },
-                        "label": {"type": "plain_text", "text": "Tidpunkt"},
-                    },
-                ],
-            },
+        client.views_open(
+            trigger_id=command.get("trigger_id"), view=create_post_modal()
         )
         return
     elif text.startswith("delete post"):
@@ -321,9 +295,11 @@ def handle_admin_command(ack, command, say):
         return
 
 
-@app.view("create_post_dialog")
-def handle_modal_submission(ack, body, logger):
-    ack()
+app.command(f"/{command_prefix}admin")(ack=acknowledge, lazy=[handle_admin_command])
+
+
+@instrument_listener
+def handle_modal_submission(body, logger):
     user = body["user"]
     state = body["view"]["state"]["values"]
     text = state["text_block"]["text"]["value"]
@@ -335,12 +311,34 @@ def handle_modal_submission(ack, body, logger):
     )
 
 
+app.view("create_post_dialog")(ack=acknowledge, lazy=[handle_modal_submission])
+
+
+@instrument_listener
+def handle_posts_page(body, respond):
+    page = json.loads(body["actions"][0]["value"])
+    filters = page.pop("filters")
+    posts, has_previous, has_next = get_scheduled_posts_page(
+        limit=posts_page_size(), **page, **filters
+    )
+    respond(
+        replace_original=True,
+        **scheduled_posts_message(posts, filters, has_previous, has_next),
+    )
+
+
+app.action(re.compile("^list_posts_(previous|next)$"))(
+    ack=acknowledge, lazy=[handle_posts_page]
+)
+
+
 # ============================================================================
 # Home Tab
 # ============================================================================
 
 
 @app.event("app_home_opened")
+@instrument_listener
 def update_home_tab(client, event, logger):
     """
     Update the App Home tab when a user opens it.
@@ -353,21 +351,7 @@ def update_home_tab(client, event, logger):
     try:
         user_id = event["user"]
 
-        client.views_publish(
-            user_id=user_id,
-            view={
-                "type": "home",
-                "blocks": [
-                    {
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": "Hej hej! Jag är HejBot :hej: :robot_face:\n\nJag kommer hjälpa dig med lite smått o gott. Mer info kommer! :star-struck:\n\nOm du är nyfiken kan du prata med @jennifer, @malin, @ellen, @kevin eller @john .",
-                        },
-                    }
-                ],
-            },
-        )
+        client.views_publish(user_id=user_id, view=home_view())
     except Exception as e:
         logger.error(f"Error updating home tab: {e}")
 
@@ -380,10 +364,46 @@ def update_home_tab(client, event, logger):
 def main():
     """Start the Slack bot application."""
     try:
+        Config.validate()
+        app.verify_token()
         setup_db()
+        prompts.load()
+        prompts.start_watching()
 
         scheduler = Scheduler(logger=logger, app=app)
-        scheduler.start()
+        scheduler.register_default_jobs()
+        if Config.LEADER_ELECTION:
+            # Every replica serves Slack events; only the leader runs jobs
+            LeaderElector(
+                logger=logger,
+                on_elected=scheduler.start,
+                on_demoted=lambda: scheduler.stop(timeout=5),
+            ).start()
+        else:
+            scheduler.start()
+
+        # Every replica serves directory lookups and receives its events
+        get_user_directory(app).start()
+
+        # Flush buffered CV entries on Ctrl+C and on container stop
+        cv_entry_buffer.start()
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+        register_collector("hejbot_db_pool", pool_metrics, ConnectionPool.COUNTERS)
+        register_collector(
+            "hejbot_cv_entry_buffer", cv_entry_buffer.metrics, cv_entry_buffer.COUNTERS
+        )
+        register_collector(
+            "hejbot_cv_jobs", cv_job_queue.metrics, cv_job_queue.COUNTERS
+        )
+        register_collector("hejbot_cv_cache", cv_cache.metrics, cv_cache.COUNTERS)
+        register_collector("hejbot_event_dedup", event_ids.metrics, event_ids.COUNTERS)
+        register_collector(
+            "hejbot_listener_executor",
+            listener_executor.metrics,
+            listener_executor.COUNTERS,
+        )
+        start_metrics_server()
 
         # google_api = GoogleApi(logger)
         # events = google_api.get_events()
@@ -401,6 +421,8 @@ def main():
     except Exception as e:
         logger.error(f"Error starting application: {e}")
         raise
+    finally:
+        cv_entry_buffer.stop()
 
 
 if __name__ == "__main__":
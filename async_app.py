@@ -0,0 +1,410 @@
+"""
+Hejbot on the async runtime (RUNTIME=async)
+
+The same listeners as app.py on AsyncApp, asyncpg and the async OpenAI and
+Web API clients, so slow Slack and LLM calls wait on the event loop instead of
+holding a thread each. The scheduler, leader election and CV entry buffer are
+shared with the sync runtime and keep running on their own threads, with a
+sync Web API client.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import signal
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from slack_bolt import App, BoltResponse
+from slack_bolt.async_app import AsyncApp
+from slack_sdk.web.async_client import AsyncWebClient
+
+import async_db
+from chat_helper import get_user_directory
+from config import Config
+from cv_cache import cv_cache
+from cv_generator import delete_summary_async
+from cv_ingest import CvEntryBuffer, message_key
+from cv_jobs import AsyncCvJobQueue
+from db import setup_db
+from fast_ack import (
+    CLIENT_BOUND_UTILITIES,
+    event_ids,
+    is_duplicate_delivery,
+    record_ack,
+    request_name,
+)
+from instrumentation import instrument_listener, span, start_metrics_server
+from leader import LeaderElector
+from metrics import register_collector
+from prompt_templates import prompts
+from scheduler.scheduler import Scheduler, get_scheduled_posts_page_async
+from slack_client import InstrumentedWebClient, client_settings, slack_api
+from views import (
+    create_post_modal,
+    demo_button_blocks,
+    home_view,
+    parse_post_filters,
+    posts_page_size,
+    scheduled_posts_message,
+)
+
+logging.basicConfig(
+    level=getattr(logging, Config.LOG_LEVEL),
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# The async counterparts of fast_ack's TimedApp and slack_client's
+# InstrumentedWebClient live here, so the sync runtime never imports aiohttp.
+
+
+class AsyncInstrumentedWebClient(AsyncWebClient):
+    async def api_call(self, api_method, **kwargs):
+        with slack_api.track(api_method):
+            return await super().api_call(api_method, **kwargs)
+
+
+async def async_dedupe_event_retries(body, request, next):
+    if is_duplicate_delivery(body, request):
+        return BoltResponse(status=200, body="")
+    await next()
+
+
+async def async_use_instrumented_client(context, next):
+    client = context.client
+    context["client"] = AsyncInstrumentedWebClient(
+        **client_settings(client),
+        team_id=context.team_id,
+        session=client.session,
+        trust_env_in_session=client.trust_env_in_session,
+    )
+    for name in CLIENT_BOUND_UTILITIES:
+        context.pop(name, None)
+    await next()
+
+
+class AsyncTimedApp(AsyncApp):
+    async def async_dispatch(self, req):
+        started = time.monotonic()
+        try:
+            with span(f"slack {request_name(req.body)}"):
+                return await super().async_dispatch(req)
+        finally:
+            record_ack(req.body, time.monotonic() - started)
+
+
+cv_entry_buffer = CvEntryBuffer(logger=logger)
+
+app = AsyncTimedApp(
+    name="hejbot",  # otherwise Bolt inspects the call stack to make one up
+    signing_secret=Config.SLACK_SIGNING_SECRET,
+    client=AsyncInstrumentedWebClient(
+        token=Config.SLACK_BOT_TOKEN, base_url=Config.SLACK_API_URL
+    ),
+)
+app.middleware(async_dedupe_event_retries)
+app.middleware(async_use_instrumented_client)
+
+# Web API client for the threaded parts (scheduler, user directory)
+sync_app = App(
+    name="hejbot",
+    signing_secret=Config.SLACK_SIGNING_SECRET,
+    client=InstrumentedWebClient(
+        token=Config.SLACK_BOT_TOKEN, base_url=Config.SLACK_API_URL
+    ),
+    token_verification_enabled=False,
+)
+
+cv_job_queue = AsyncCvJobQueue(logger=logger, app=app)
+
+command_prefix = "dev-" if Config.DEV else ""
+
+# ============================================================================
+# Event Listeners
+# ============================================================================
+
+
+@app.event("app_mention")
+@instrument_listener
+async def handle_app_mention(event, say, logger):
+    user = event.get("user")
+    text = event.get("text", "")
+
+    logger.info(f"App mentioned by user {user}: {text}")
+
+    await say(
+        text=f"Hello <@{user}>! You mentioned me. How can I help you today?",
+        thread_ts=event.get("ts"),
+    )
+
+
+@app.event("message")
+@instrument_listener
+async def handle_message_events(event, logger):
+    if event.get("subtype") == "bot_message" or "text" not in event:
+        return
+
+    # add() only appends to the in-memory queue, so it is safe on the loop
+    user_id = event.get("user")
+    logger.debug(f"Message from {user_id} in {event.get('channel')}")
+    text = event.get("text")
+    if not cv_entry_buffer.add(
+        user_id, text, datetime.now(), event_key=message_key(event)
+    ):
+        logger.warning(f"CV entry buffer full, dropped message from {user_id}")
+    cv_cache.invalidate_user(user_id)
+
+
+@app.event("user_change")
+@app.event("team_join")
+@instrument_listener
+async def handle_user_directory_events(event, logger):
+    user = event["user"]
+    logger.debug(f"Updating user directory for {user['id']}")
+    get_user_directory(sync_app).apply_user(user)
+
+
+# ============================================================================
+# Slash Commands
+# ============================================================================
+
+
+@app.command("/hello")
+@instrument_listener
+async def handle_hello_command(ack, command, say, logger):
+    await ack()
+
+    user_id = command.get("user_id")
+    logger.info(f"/hello command received from user {user_id}")
+
+    await say(f"Hello <@{user_id}>! 👋 This is a sample slash command response.")
+
+
+# ============================================================================
+# Interactive Components (Buttons, Modals, etc.)
+# ============================================================================
+
+
+@app.action("button_click")
+@instrument_listener
+async def handle_button_click(ack, body, say, logger):
+    await ack()
+
+    user = body["user"]["id"]
+    logger.info(f"Button clicked by user {user}")
+
+    await say(f"<@{user}> clicked the button! 🎉")
+
+
+@app.command("/demo-button")
+@instrument_listener
+async def handle_demo_button_command(ack, command, say):
+    await ack()
+
+    await say(blocks=demo_button_blocks())
+
+
+@instrument_listener
+async def acknowledge(ack):
+    await ack()
+
+
+@instrument_listener
+async def ack_cv_command(ack, command):
+    text = (command.get("text") or "").lower()
+    if not text:
+        await ack("Please provide a query text. Usage: /cv <your text>")
+    elif text == "generate":
+        await ack("Genererar din CV post...")
+    elif text == "delete":
+        await ack("Raderar dina CV poster")
+    else:
+        await ack()
+
+
+@instrument_listener
+async def handle_cv_command(command, say, logger):
+    text = (command.get("text") or "").lower()
+    user_id = command.get("user_id")
+
+    if text == "generate":
+        job_id = await cv_job_queue.submit(
+            user_id, response_url=command.get("response_url")
+        )
+        if job_id is None:
+            await say("Det är många som genererar CV just nu, försök igen om en stund.")
+            return
+        logger.info(f"Queued CV job {job_id} for {user_id}")
+    elif text == "delete":
+        await async_db.query("DELETE FROM cv_entries WHERE user_id=%s", (user_id,))
+        await delete_summary_async(user_id)
+        cv_cache.invalidate_user(user_id)
+        logger.info(f"Deleted entries for {user_id}")
+
+
+app.command(f"/{command_prefix}cv")(ack=ack_cv_command, lazy=[handle_cv_command])
+
+
+@instrument_listener
+async def handle_admin_command(command, say, client):
+    text = command.get("text").lower()
+
+    if text.startswith("list posts"):
+        try:
+            # A name lookup may refresh the directory with the sync client
+            filters = await asyncio.to_thread(
+                parse_post_filters,
+                command.get("text")[len("list posts") :],
+                get_user_directory(sync_app).get_by_name,
+            )
+        except ValueError as e:
+            await say(f"Okänt filter: {e}")
+            return
+
+        posts, _, has_next = await get_scheduled_posts_page_async(
+            limit=posts_page_size(), **filters
+        )
+        if len(posts) == 0:
+            await say("Det finns inga schemalagda poster")
+            return
+
+        await say(**scheduled_posts_message(posts, filters, False, has_next))
+    elif text == "create post":
+        await client.views_open(
+            trigger_id=command.get("trigger_id"), view=create_post_modal()
+        )
+    elif text.startswith("delete post"):
+        try:
+            [_, post_id] = text.split("delete post ")
+
+            await async_db.query(
+                "DELETE FROM scheduled_posts WHERE post_id=%s", (post_id,)
+            )
+        except Exception:
+            await say("Ogiltigt post-id")
+
+
+app.command(f"/{command_prefix}admin")(ack=acknowledge, lazy=[handle_admin_command])
+
+
+@instrument_listener
+async def handle_modal_submission(body, logger):
+    user = body["user"]
+    state = body["view"]["state"]["values"]
+    text = state["text_block"]["text"]["value"]
+    post_type = state["type_block"]["type"]["selected_option"]["value"]
+
+    await async_db.query(
+        "INSERT INTO scheduled_posts (post_id,type,text,added_by) VALUES (%s,%s,%s,%s)",
+        (str(uuid.uuid4()), post_type, text, user["id"]),
+    )
+
+
+app.view("create_post_dialog")(ack=acknowledge, lazy=[handle_modal_submission])
+
+
+@instrument_listener
+async def handle_posts_page(body, respond):
+    page = json.loads(body["actions"][0]["value"])
+    filters = page.pop("filters")
+    posts, has_previous, has_next = await get_scheduled_posts_page_async(
+        limit=posts_page_size(), **page, **filters
+    )
+    await respond(
+        replace_original=True,
+        **scheduled_posts_message(posts, filters, has_previous, has_next),
+    )
+
+
+app.action(re.compile("^list_posts_(previous|next)$"))(
+    ack=acknowledge, lazy=[handle_posts_page]
+)
+
+
+# ============================================================================
+# Home Tab
+# ============================================================================
+
+
+@app.event("app_home_opened")
+@instrument_listener
+async def update_home_tab(client, event, logger):
+    try:
+        await client.views_publish(user_id=event["user"], view=home_view())
+    except Exception as e:
+        logger.error(f"Error updating home tab: {e}")
+
+
+# ============================================================================
+# Application Entry Point
+# ============================================================================
+
+
+async def serve_socket_mode():
+    # Pulls in aiohttp's websocket client, so only Socket Mode pays for it
+    from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+
+    try:
+        await AsyncSocketModeHandler(app, Config.SLACK_APP_TOKEN).start_async()
+    finally:
+        await cv_job_queue.shutdown()
+        await async_db.close()
+
+
+def main():
+    """Start the Slack bot application on the async runtime."""
+    try:
+        Config.validate()
+        setup_db()
+        prompts.load()
+        prompts.start_watching()
+
+        scheduler = Scheduler(logger=logger, app=sync_app)
+        scheduler.register_default_jobs()
+        if Config.LEADER_ELECTION:
+            LeaderElector(
+                logger=logger,
+                on_elected=scheduler.start,
+                on_demoted=lambda: scheduler.stop(timeout=5),
+            ).start()
+        else:
+            scheduler.start()
+
+        # Every replica serves directory lookups and receives its events
+        get_user_directory(sync_app).start()
+
+        cv_entry_buffer.start()
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+        register_collector("hejbot_db_pool", async_db.pool_metrics)
+        register_collector(
+            "hejbot_cv_entry_buffer", cv_entry_buffer.metrics, cv_entry_buffer.COUNTERS
+        )
+        register_collector(
+            "hejbot_cv_jobs", cv_job_queue.metrics, cv_job_queue.COUNTERS
+        )
+        register_collector("hejbot_cv_cache", cv_cache.metrics, cv_cache.COUNTERS)
+        register_collector("hejbot_event_dedup", event_ids.metrics, event_ids.COUNTERS)
+        start_metrics_server()
+
+        if Config.SOCKET_MODE:
+            logger.info("Starting Hejbot (async) in Socket Mode...")
+            asyncio.run(serve_socket_mode())
+        else:
+            logger.info(
+                f"Starting Hejbot (async) in HTTP Mode on port {Config.PORT}..."
+            )
+            app.start(port=Config.PORT)
+    except Exception as e:
+        logger.error(f"Error starting application: {e}")
+        raise
+    finally:
+        cv_entry_buffer.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import asyncio
+import re
+
+from config import Config
+from db import PoolTimeout
+from instrumentation import db_queries, sql_labels
+
+# psycopg2-style placeholders, so the sync and async runtimes share their SQL
+_PLACEHOLDER = re.compile(r"%%|%s")
+
+_pool = None
+_pool_lock = None
+
+
+def to_asyncpg(query_text):
+    """Rewrite `%s` placeholders as asyncpg's `$1, $2, ...` (and `%%` as `%`)."""
+    counter = iter(range(1, query_text.count("%s") + 1))
+    return _PLACEHOLDER.sub(
+        lambda m: "%" if m.group() == "%%" else f"${next(counter)}", query_text
+    )
+
+
+async def get_pool():
+    """Return this process' asyncpg pool, creating it on first use.
+
+    The pool is bound to the event loop it was created on, which is the one
+    the async runtime serves Slack requests from. asyncpg is imported here so
+    that only the async runtime loads it.
+    """
+    global _pool, _pool_lock
+    if _pool is not None:
+        return _pool
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            import asyncpg
+
+            _pool = await asyncpg.create_pool(
+                host=Config.DB_HOST,
+                port=Config.DB_PORT,
+                database=Config.DB_DATABASE,
+                user=Config.DB_USERNAME,
+                password=Config.DB_PASSWORD,
+                ssl=Config.DB_SSL_MODE,
+                min_size=Config.DB_POOL_MIN_SIZE,
+                max_size=Config.DB_POOL_MAX_SIZE,
+                max_inactive_connection_lifetime=Config.DB_POOL_RECYCLE,
+            )
+    return _pool
+
+
+def pool_metrics():
+    pool = _pool
+    if pool is None:
+        return {}
+    return {
+        "size": pool.get_size(),
+        "idle": pool.get_idle_size(),
+        "in_use": pool.get_size() - pool.get_idle_size(),
+    }
+
+
+async def close():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def query(query_text, parameters=()):
+    """Execute a database query and return its rows as a list of dicts."""
+    with db_queries.track(*sql_labels(query_text)):
+        pool = await get_pool()
+        try:
+            conn = await pool.acquire(timeout=Config.DB_POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(
+                f"No database connection available within {Config.DB_POOL_TIMEOUT}s"
+            )
+        try:
+            rows = await conn.fetch(to_asyncpg(query_text), *parameters)
+        finally:
+            await pool.release(conn)
+    return [dict(row) for row in rows]
@@ -0,0 +1,131 @@
+"""
+Benchmark business-calendar lookups against the per-call holiday rebuild
+they replaced, and check both agree on every day of the benchmarked years.
+
+The old check built holidays.country_holidays("SE") and walked back from the
+end of the month on every call. The calendar answers from a precomputed year
+table, built once and then loaded from its cache file on later runs. The
+known Swedish edge cases (Midsommarafton, Julafton, Nyårsafton, Easter and
+months ending on a weekend) are asserted before timing anything.
+
+    python -m benchmarks.business_calendar --years 2020-2035 --repeat 3
+"""
+
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+import holidays
+from dateutil import relativedelta
+
+from scheduler.business_calendar import BusinessCalendar
+
+CATEGORIES = ("public", "de_facto")
+
+# (day, working day?, last working day of its month?)
+EDGE_CASES = [
+    (date(2026, 6, 19), False, False),  # Midsommarafton
+    (date(2026, 6, 20), False, False),  # Midsommardagen (Saturday)
+    (date(2026, 6, 30), True, True),
+    (date(2026, 12, 24), False, False),  # Julafton
+    (date(2026, 12, 25), False, False),  # Juldagen
+    (date(2026, 12, 30), True, True),  # Nyårsafton is the 31st
+    (date(2026, 12, 31), False, False),
+    (date(2027, 12, 31), False, False),  # Nyårsafton on a Friday
+    (date(2027, 12, 30), True, True),
+    (date(2024, 3, 29), False, False),  # Långfredagen, last weekday of March
+    (date(2024, 3, 28), True, True),
+    (date(2024, 6, 30), False, False),  # Sunday
+    (date(2024, 6, 28), True, True),
+    (date(2025, 5, 1), False, False),  # Första maj
+    (date(2025, 5, 2), True, False),
+    (date(2028, 2, 29), True, True),  # leap day
+]
+
+
+def old_is_last_day_of_month(day):
+    """The replaced implementation, with the same holiday categories."""
+    se_holidays = holidays.country_holidays("SE", categories=CATEGORIES)
+    date_last = day + relativedelta.relativedelta(day=31)
+    while True:
+        if date_last.weekday() < 5 and date_last not in se_holidays:
+            break
+        date_last = date_last + relativedelta.relativedelta(days=-1)
+    return day == date_last
+
+
+def days_of(years):
+    day = date(years[0], 1, 1)
+    while day.year <= years[-1]:
+        yield day
+        day += timedelta(days=1)
+
+
+def check(calendar, years):
+    for day, working, last in EDGE_CASES:
+        assert calendar.is_working_day(day) == working, day
+        assert calendar.is_last_working_day(day) == last, day
+        if last:
+            assert calendar.last_working_day(day.year, day.month) == day, day
+    mismatches = [
+        day
+        for day in days_of(years)
+        if calendar.is_last_working_day(day) != old_is_last_day_of_month(day)
+    ]
+    assert not mismatches, f"Calendar disagrees with the old check on {mismatches}"
+    for year in years:
+        for month in range(1, 13):
+            count = calendar.working_days_in_month(year, month)
+            for n in range(1, count + 1):
+                day = calendar.nth_working_day(year, month, n)
+                assert calendar.working_day_ordinal(day) == n, (year, month, n)
+                assert calendar.is_nth_working_day(day, n - count - 1), day
+
+
+def timed(func, days, repeat):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for day in days:
+            func(day)
+        runs.append(time.perf_counter() - started)
+    return statistics.median(runs)
+
+
+def run(years, repeat):
+    logger = logging.getLogger(__name__)
+    days = list(days_of(years))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        started = time.perf_counter()
+        calendar = BusinessCalendar(logger, categories=CATEGORIES, cache_dir=cache_dir)
+        for year in years:
+            calendar.table(year)
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        cached = BusinessCalendar(logger, categories=CATEGORIES, cache_dir=cache_dir)
+        for year in years:
+            cached.table(year)
+        load = time.perf_counter() - started
+
+        check(cached, years)
+
+    old = timed(old_is_last_day_of_month, days, 1)
+    new = timed(calendar.is_last_working_day, days, repeat)
+    print(f"{len(days)} days, {years[0]}-{years[-1]}; edge cases and old check agree")
+    print(f"  build tables:    {build * 1000:9.1f} ms")
+    print(f"  load from cache: {load * 1000:9.1f} ms")
+    print(f"  old check:       {old / len(days) * 1e6:9.1f} µs/day")
+    print(f"  calendar lookup: {new / len(days) * 1e6:9.3f} µs/day")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", default="2020-2035")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    first, _, last = args.years.partition("-")
+    run(list(range(int(first), int(last or first) + 1)), args.repeat)
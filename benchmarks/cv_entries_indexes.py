@@ -0,0 +1,145 @@
+"""
+Benchmark the hot cv_entries and scheduled_posts queries with and without
+the indexes added in migration 2.
+
+Builds throwaway copies of the tables in a temporary schema, fills them with
+generate_series (1M CV entries by default), and reports the median execution
+time reported by EXPLAIN ANALYZE for each query before and after indexing.
+
+    python -m benchmarks.cv_entries_indexes --rows 1000000 --users 500
+"""
+
+import argparse
+import statistics
+import time
+
+from db import get_db_connection
+
+SCHEMA = "bench_indexes"
+
+QUERIES = {
+    "cv entries for user": (
+        "SELECT id,user_id,text,timestamp FROM cv_entries WHERE user_id=%s "
+        "ORDER BY timestamp,id",
+        lambda users: ("U%05d" % (users // 2),),
+    ),
+    "cv entries since id": (
+        "SELECT id,user_id,text,timestamp FROM cv_entries WHERE user_id=%s AND id>%s "
+        "ORDER BY timestamp,id",
+        lambda users: ("U%05d" % (users // 2), 900000),
+    ),
+    "posts by type": (
+        "SELECT post_id,type,text,added_by FROM scheduled_posts WHERE type=%s",
+        lambda users: ("MondayMorning",),
+    ),
+    "delete post by id": (
+        "DELETE FROM scheduled_posts WHERE post_id=%s",
+        lambda users: ("post-00000042",),
+    ),
+}
+
+INDEXES = [
+    "CREATE INDEX ON cv_entries (user_id, timestamp, id)",
+    "CREATE INDEX ON cv_entries USING brin (timestamp)",
+    "ALTER TABLE scheduled_posts ADD CONSTRAINT bench_post_id_key UNIQUE (post_id)",
+    "CREATE INDEX ON scheduled_posts (type)",
+]
+
+
+def create_tables(cur, rows, users, posts):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(f"SET search_path TO {SCHEMA}")
+    cur.execute(
+        """
+        CREATE TABLE cv_entries (
+            id SERIAL PRIMARY KEY,
+            user_id VARCHAR(255) NOT NULL,
+            text TEXT NOT NULL,
+            timestamp TIMESTAMP NOT NULL
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE scheduled_posts (
+            id SERIAL PRIMARY KEY,
+            post_id VARCHAR(255) NOT NULL,
+            type VARCHAR(255) NOT NULL,
+            text TEXT NOT NULL,
+            added_by VARCHAR(255) NOT NULL
+        )
+        """
+    )
+    cur.execute(
+        """
+        INSERT INTO cv_entries (user_id,text,timestamp)
+        SELECT 'U' || lpad((i %% %s)::text, 5, '0'),
+               'Worked on feature ' || i || ' together with the client team',
+               now() - (%s - i) * interval '30 seconds'
+        FROM generate_series(1, %s) AS i
+        """,
+        (users, rows, rows),
+    )
+    cur.execute(
+        """
+        INSERT INTO scheduled_posts (post_id,type,text,added_by)
+        SELECT 'post-' || lpad(i::text, 8, '0'),
+               CASE WHEN i %% 2 = 0 THEN 'MondayMorning' ELSE 'FridayMorning' END,
+               'Scheduled post ' || i,
+               'U00001'
+        FROM generate_series(1, %s) AS i
+        """,
+        (posts,),
+    )
+    cur.execute("ANALYZE")
+
+
+def time_query(cur, sql, parameters, repeat):
+    timings = []
+    for _ in range(repeat):
+        cur.execute("SAVEPOINT bench")
+        cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", parameters)
+        plan = cur.fetchone()[0][0]
+        cur.execute("ROLLBACK TO SAVEPOINT bench")
+        timings.append(plan["Execution Time"])
+    return statistics.median(timings), plan["Plan"]["Node Type"]
+
+
+def run(rows, users, posts, repeat):
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            started = time.monotonic()
+            create_tables(cur, rows, users, posts)
+            print(f"Seeded {rows} cv_entries and {posts} posts in {time.monotonic() - started:.1f}s\n")
+
+            results = {}
+            for name, (sql, parameters) in QUERIES.items():
+                results[name] = [time_query(cur, sql, parameters(users), repeat)]
+
+            for statement in INDEXES:
+                cur.execute(statement)
+            cur.execute("ANALYZE")
+            for name, (sql, parameters) in QUERIES.items():
+                results[name].append(time_query(cur, sql, parameters(users), repeat))
+
+            print(f"{'query':<22} {'no index (ms)':>14} {'indexed (ms)':>13}  plan")
+            for name, ((before, plan_before), (after, plan_after)) in results.items():
+                print(
+                    f"{name:<22} {before:>14.2f} {after:>13.2f}  {plan_before} -> {plan_after}"
+                )
+            cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--posts", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.rows, args.users, args.posts, args.repeat)
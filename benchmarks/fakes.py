@@ -0,0 +1,418 @@
+"""
+Local stand-ins for the services Hejbot talks to, for benchmarks and load
+tests: a Slack Web API, an OpenAI Responses endpoint and a scratch Postgres
+database.
+
+The fakes are plain ThreadingHTTPServers on 127.0.0.1 with a configurable
+latency per call. They count calls per method so a benchmark can report
+round trips per operation. Point the app at them with SLACK_API_URL and
+OPENAI_BASE_URL (the OpenAI SDK reads the latter itself).
+"""
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import psycopg2
+from psycopg2 import sql
+
+CV_TEXT = (
+    "Under året har {name} lett införandet av en ny leveranskedja, "
+    "coachat två juniora utvecklare och drivit arbetet med observability. "
+) * 8
+
+
+class LocalHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer with a listen backlog for concurrent clients.
+
+    The default backlog of 5 makes the kernel drop connections from a
+    fan-out's workers, which then wait about a second to retry, so latency
+    would measure the fake rather than the code under test.
+    """
+
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class FakeServer:
+    """An HTTP server on 127.0.0.1 that answers from `handle()`.
+
+    The port is picked by the OS unless `port` is given, e.g. when the app
+    runs in another process and is configured with the fake's URL.
+    """
+
+    def handle(self, method, path, headers, body):
+        """Return (status, headers, body bytes or an iterator of chunks)."""
+        raise NotImplementedError
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return Counter(self.calls)
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._respond()
+
+            def do_POST(self):
+                self._respond()
+
+            def _respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if server.latency:
+                    time.sleep(server.latency)
+                status, headers, payload = server.handle(
+                    self.command, self.path, self.headers, body
+                )
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if isinstance(payload, bytes):
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                # Streamed response: no length, so the connection ends it
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                for chunk in payload:
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = LocalHTTPServer(("127.0.0.1", self.port), Handler)
+        threading.Thread(
+            target=self._server.serve_forever,
+            name=type(self).__name__,
+            daemon=True,
+        ).start()
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def __init__(self, latency=0.0, port=0):
+        self.latency = latency
+        self.port = port
+        self.url = None
+        self.calls = Counter()
+        self._server = None
+        self._lock = threading.Lock()
+
+
+def json_response(data, status=200):
+    return status, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+
+class FakeSlack(FakeServer):
+    """Slack Web API at `<url>/api/<method>` plus response_url webhooks.
+
+    The workspace has `users` ordinary members (U0000000, U0000001, ...). Webhooks
+    posted to `<url>/response/<id>` are recorded with their arrival time in
+    `responses`, so a benchmark can time `/cv generate` end to end.
+    """
+
+    def handle(self, method, path, headers, body):
+        if path.startswith("/response/"):
+            self.count("response_url")
+            with self._lock:
+                self.responses[path[len("/response/") :]] = time.monotonic()
+            return 200, {"Content-Type": "text/plain"}, b"ok"
+        if not path.startswith("/api/"):
+            return json_response({"ok": False, "error": "unknown_method"}, 404)
+
+        api_method = path[len("/api/") :].split("?", 1)[0]
+        self.count(api_method)
+        params = self._params(headers, body)
+        handler = getattr(self, "api_" + api_method.replace(".", "_"), None)
+        if handler is None:
+            return json_response({"ok": True})
+        return json_response({"ok": True, **handler(params)})
+
+    def response_url(self, name):
+        return f"{self.url}/response/{name}"
+
+    def member(self, index):
+        user_id = f"U{index:07d}"
+        return {
+            "id": user_id,
+            "name": f"user{index}",
+            "is_bot": False,
+            "deleted": False,
+            "profile": {"first_name": f"Anna{index}", "real_name": f"Anna {index}"},
+        }
+
+    def api_auth_test(self, params):
+        return {
+            "url": "https://bench.slack.com/",
+            "team": "Bench",
+            "team_id": "T0000001",
+            "user": "hejbot",
+            "user_id": "UBOT00001",
+            "bot_id": "BBOT00001",
+        }
+
+    def api_users_list(self, params):
+        start = int(params.get("cursor") or 0)
+        limit = int(params.get("limit") or 200)
+        end = min(start + limit, self.users)
+        return {
+            "members": [self.member(index) for index in range(start, end)],
+            "response_metadata": {"next_cursor": str(end) if end < self.users else ""},
+        }
+
+    def api_users_info(self, params):
+        return {"user": self.member(int(params["user"][1:]))}
+
+    def api_conversations_open(self, params):
+        return {"channel": {"id": "D" + params["users"][1:]}}
+
+    def api_chat_postMessage(self, params):
+        return {"channel": params.get("channel"), "ts": f"{time.time():.6f}"}
+
+    def api_chat_update(self, params):
+        return {"channel": params.get("channel"), "ts": params.get("ts")}
+
+    def _params(self, headers, body):
+        if not body:
+            return {}
+        if "json" in (headers.get("Content-Type") or ""):
+            return json.loads(body)
+        return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+
+    def __init__(self, users=200, latency=0.0, port=0):
+        super().__init__(latency, port)
+        self.users = users
+        self.responses = {}
+
+
+class FakeOpenAI(FakeServer):
+    """OpenAI Responses API at `<url>/v1/responses`, plain or streamed (SSE).
+
+    Every response takes `latency` seconds before the first byte; streamed
+    responses then send one delta per word every `token_interval` seconds.
+    """
+
+    def handle(self, method, path, headers, body):
+        if not path.startswith("/v1/responses"):
+            return json_response({"error": {"message": "not found"}}, 404)
+        request = json.loads(body or b"{}")
+        self.count("responses.stream" if request.get("stream") else "responses")
+        text = CV_TEXT.format(name="du")
+        if not request.get("stream"):
+            return json_response(self._response(request, text))
+        return 200, {"Content-Type": "text/event-stream"}, self._stream(request, text)
+
+    def _response(self, request, text, status="completed"):
+        return {
+            "id": "resp_bench",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": request.get("model", "bench"),
+            "status": status,
+            "output": [
+                {
+                    "id": "msg_bench",
+                    "type": "message",
+                    "role": "assistant",
+                    "status": status,
+                    "content": [
+                        {"type": "output_text", "text": text, "annotations": []}
+                    ],
+                }
+            ],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": len(request.get("input", "")) // 4,
+                "output_tokens": len(text) // 4,
+                "total_tokens": (len(request.get("input", "")) + len(text)) // 4,
+            },
+        }
+
+    def _stream(self, request, text):
+        sequence = 0
+
+        def event(data):
+            nonlocal sequence
+            sequence += 1
+            data["sequence_number"] = sequence
+            return f"event: {data['type']}\ndata: {json.dumps(data)}\n\n".encode()
+
+        yield event(
+            {
+                "type": "response.created",
+                "response": self._response(request, "", "in_progress"),
+            }
+        )
+        for word in text.split(" "):
+            if self.token_interval:
+                time.sleep(self.token_interval)
+            yield event(
+                {
+                    "type": "response.output_text.delta",
+                    "item_id": "msg_bench",
+                    "output_index": 0,
+                    "content_index": 0,
+                    "delta": word + " ",
+                    "logprobs": [],
+                }
+            )
+        yield event(
+            {"type": "response.completed", "response": self._response(request, text)}
+        )
+
+    def __init__(self, latency=0.5, token_interval=0.0, port=0):
+        super().__init__(latency, port)
+        self.token_interval = token_interval
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def scratch_postgres():
+    """Yield DB_* settings for a database that is removed afterwards.
+
+    With Postgres' server binaries on PATH (or in PG_BIN), a throwaway cluster
+    is created in a temporary directory and stopped at the end. Otherwise a
+    scratch database is created on the server in the DB_* environment
+    variables (the user needs CREATEDB) and dropped at the end.
+    """
+    pg_bin = os.environ.get("PG_BIN")
+    initdb = os.path.join(pg_bin, "initdb") if pg_bin else shutil.which("initdb")
+    if initdb and os.path.exists(initdb):
+        with _temporary_cluster(os.path.dirname(initdb)) as settings:
+            yield settings
+        return
+
+    settings = {
+        "DB_HOST": os.environ.get("DB_HOST", "localhost"),
+        "DB_PORT": os.environ.get("DB_PORT", "5432"),
+        "DB_USERNAME": os.environ.get("DB_USERNAME", "postgres"),
+        "DB_PASSWORD": os.environ.get("DB_PASSWORD", ""),
+        "DB_SSL_MODE": os.environ.get("DB_SSL_MODE", "prefer"),
+        "DB_DATABASE": f"hejbot_bench_{os.getpid()}",
+    }
+    admin = _connect(settings, "postgres")
+    admin.autocommit = True
+    try:
+        with admin.cursor() as cur:
+            cur.execute(
+                sql.SQL("CREATE DATABASE {}").format(
+                    sql.Identifier(settings["DB_DATABASE"])
+                )
+            )
+        yield settings
+    finally:
+        with admin.cursor() as cur:
+            cur.execute(
+                sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(
+                    sql.Identifier(settings["DB_DATABASE"])
+                )
+            )
+        admin.close()
+
+
+@contextmanager
+def _temporary_cluster(bin_dir):
+    data_dir = tempfile.mkdtemp(prefix="hejbot-pg-")
+    port = free_port()
+    try:
+        subprocess.run(
+            [
+                os.path.join(bin_dir, "initdb"),
+                "-D",
+                data_dir,
+                "-U",
+                "postgres",
+                "-A",
+                "trust",
+                "--no-sync",
+            ],
+            check=True,
+            capture_output=True,
+        )
+        subprocess.run(
+            [
+                os.path.join(bin_dir, "pg_ctl"),
+                "-D",
+                data_dir,
+                "-l",
+                os.path.join(data_dir, "server.log"),
+                "-o",
+                f"-p {port} -k {data_dir} -c listen_addresses='' -F",
+                "-w",
+                "start",
+            ],
+            check=True,
+            capture_output=True,
+        )
+        try:
+            yield {
+                "DB_HOST": data_dir,
+                "DB_PORT": str(port),
+                "DB_USERNAME": "postgres",
+                "DB_PASSWORD": "",
+                "DB_SSL_MODE": "disable",
+                "DB_DATABASE": "postgres",
+            }
+        finally:
+            subprocess.run(
+                [
+                    os.path.join(bin_dir, "pg_ctl"),
+                    "-D",
+                    data_dir,
+                    "-m",
+                    "immediate",
+                    "stop",
+                ],
+                capture_output=True,
+            )
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def _connect(settings, database):
+    return psycopg2.connect(
+        host=settings["DB_HOST"],
+        port=settings["DB_PORT"],
+        user=settings["DB_USERNAME"],
+        password=settings["DB_PASSWORD"],
+        sslmode=settings["DB_SSL_MODE"],
+        database=database,
+    )
@@ -0,0 +1,268 @@
+"""
+Benchmark Google Calendar polling against a local fake Calendar API, and check
+that incremental sync keeps the local store identical to the calendar.
+
+The old client rebuilt its credentials and service and listed the next ten
+events on every poll. GoogleApi builds its service once and, after the first
+full listing, only asks for changes with the previous poll's sync token. The
+fake serves events.list with paging, syncToken, updatedMin and 410 Gone for
+expired tokens, so expiry and restarts from the saved store are exercised
+too.
+
+    python -m benchmarks.google_calendar --events 2000 --polls 50
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import httplib2
+from apiclient import discovery
+
+from benchmarks.fakes import LocalHTTPServer
+from google_api import GoogleApi, event_start
+
+CALENDAR_ID = "bench@group.calendar.google.com"
+
+
+def rfc3339(moment):
+    return moment.astimezone(timezone.utc).isoformat(timespec="milliseconds")[:-6] + "Z"
+
+
+class FakeCalendar:
+    """In-memory calendar with a change sequence backing its sync tokens."""
+
+    def add(self, count):
+        now = datetime.now(timezone.utc)
+        for _ in range(count):
+            event_id = f"event{self._next_id:06d}"
+            start = now + timedelta(hours=self._next_id % 2000 + 1)
+            self._next_id += 1
+            self.update(
+                event_id,
+                summary=f"Event {event_id}",
+                start={"dateTime": start.isoformat()},
+                end={"dateTime": (start + timedelta(hours=1)).isoformat()},
+                status="confirmed",
+            )
+
+    def update(self, event_id, **fields):
+        with self._lock:
+            self._sequence += 1
+            event = self._events.setdefault(event_id, {"id": event_id})
+            event.update(fields, updated=rfc3339(datetime.now(timezone.utc)))
+            self._changed[event_id] = self._sequence
+
+    def cancel(self, event_id):
+        self.update(event_id, status="cancelled")
+
+    def expire_sync_tokens(self):
+        with self._lock:
+            self._oldest_token = self._sequence
+
+    def upcoming(self, count):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            events = [
+                dict(event)
+                for event in self._events.values()
+                if event["status"] != "cancelled"
+                and datetime.fromisoformat(event["end"]["dateTime"]) > now
+            ]
+        events.sort(key=event_start)
+        return events[:count]
+
+    def list_events(self, params):
+        """Return (status, body) for an events.list request."""
+        with self._lock:
+            if "syncToken" in params:
+                since = int(params["syncToken"].split("-")[1])
+                if since < self._oldest_token:
+                    return 410, {"error": {"code": 410, "message": "Gone"}}
+                items = [
+                    self._events[event_id]
+                    for event_id, sequence in self._changed.items()
+                    if sequence > since
+                ]
+            elif "updatedMin" in params:
+                items = [
+                    event
+                    for event in self._events.values()
+                    if event["updated"] >= params["updatedMin"]
+                ]
+            else:
+                time_min = datetime.fromisoformat(params["timeMin"])
+                items = [
+                    event
+                    for event in self._events.values()
+                    if event["status"] != "cancelled"
+                    and datetime.fromisoformat(event["end"]["dateTime"]) > time_min
+                ]
+                if params.get("orderBy") == "startTime":
+                    items.sort(key=event_start)
+            sequence = self._sequence
+            items = [dict(event) for event in items]
+
+        offset = int(params.get("pageToken", 0))
+        limit = int(params.get("maxResults", 250))
+        page = items[offset : offset + limit]
+        body = {"kind": "calendar#events", "items": page}
+        if offset + limit < len(items):
+            if "orderBy" not in params:
+                body["nextPageToken"] = str(offset + limit)
+        else:
+            body["nextSyncToken"] = f"seq-{sequence}"
+        self.requests += 1
+        self.items_served += len(page)
+        return 200, body
+
+    def serve(self):
+        calendar = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if not url.path.endswith("/events"):
+                    status, body = 404, {"error": {"code": 404}}
+                else:
+                    status, body = calendar.list_events(params)
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = LocalHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, f"http://127.0.0.1:{server.server_port}/calendar/v3/"
+
+    def __init__(self):
+        self._events = {}
+        self._changed = {}
+        self._sequence = 0
+        self._oldest_token = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.items_served = 0
+
+
+def old_get_events(endpoint):
+    """The replaced client: build the service and list the next 10 events."""
+    service = discovery.build(
+        "calendar",
+        "v3",
+        http=httplib2.Http(),
+        client_options={"api_endpoint": endpoint},
+    )
+    now = datetime.now(tz=timezone.utc).isoformat()
+    return (
+        service.events()
+        .list(
+            calendarId=CALENDAR_ID,
+            timeMin=now,
+            maxResults=10,
+            singleEvents=True,
+            orderBy="startTime",
+        )
+        .execute()
+        .get("items", [])
+    )
+
+
+def ids(events):
+    return [event["id"] for event in events]
+
+
+def timed_polls(poll, polls, fake):
+    requests, served = fake.requests, fake.items_served
+    runs = []
+    for _ in range(polls):
+        started = time.perf_counter()
+        poll()
+        runs.append(time.perf_counter() - started)
+    return (
+        statistics.median(runs),
+        (fake.requests - requests) / polls,
+        (fake.items_served - served) / polls,
+    )
+
+
+def run(event_count, polls):
+    logger = logging.getLogger(__name__)
+    fake = FakeCalendar()
+    fake.add(event_count)
+    server, endpoint = fake.serve()
+    try:
+        with tempfile.TemporaryDirectory() as store_dir:
+
+            def client():
+                return GoogleApi(
+                    logger,
+                    calendar_id=CALENDAR_ID,
+                    key_file=None,
+                    api_endpoint=endpoint,
+                    store_dir=store_dir,
+                )
+
+            calendar = client()
+            started = time.perf_counter()
+            assert calendar.sync() == event_count
+            full = time.perf_counter() - started
+            assert ids(calendar.upcoming_events(10)) == ids(fake.upcoming(10))
+
+            # Changes arrive as deltas: 3 edits, 1 cancellation, 2 new events
+            upcoming = ids(fake.upcoming(4))
+            for event_id in upcoming[1:4]:
+                fake.update(event_id, summary="Moved")
+            fake.cancel(upcoming[0])
+            fake.add(2)
+            assert calendar.sync() == 6
+            assert calendar.upcoming_events(10) == fake.upcoming(10)
+
+            # An expired sync token is caught up with updatedMin, not a full list
+            fake.expire_sync_tokens()
+            fake.update(upcoming[1], summary="Moved again")
+            served = fake.items_served
+            calendar.sync()
+            assert fake.items_served - served < event_count
+            assert calendar.upcoming_events(10) == fake.upcoming(10)
+
+            # A restart continues from the saved store and token
+            fake.cancel(upcoming[2])
+            restarted = client()
+            assert restarted.sync() == 1
+            assert restarted.upcoming_events(10) == fake.upcoming(10)
+
+            old = timed_polls(lambda: old_get_events(endpoint), polls, fake)
+            new = timed_polls(calendar.get_events, polls, fake)
+    finally:
+        server.shutdown()
+
+    print(f"{event_count} events; deltas, token expiry and restart agree with fake")
+    print(f"  full sync:  {full * 1000:8.1f} ms")
+    for name, (median, requests, items) in (("old poll", old), ("new poll", new)):
+        print(
+            f"  {name}:   {median * 1000:8.2f} ms median, "
+            f"{requests:.1f} requests, {items:.1f} events/poll"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--polls", type=int, default=50)
+    args = parser.parse_args()
+    run(args.events, args.polls)
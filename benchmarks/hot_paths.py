@@ -0,0 +1,441 @@
+"""
+Benchmark Hejbot's hot paths against a fake Slack Web API, a fake OpenAI
+endpoint and a scratch Postgres database, and compare with a saved baseline.
+
+Each operation reports throughput, p50/p99 latency and the database round
+trips and Slack/OpenAI calls it made per operation:
+
+    message_ingest         handle_message_events, until the buffer has flushed
+    fanout_send_message    Scheduler._send_message to every workspace member
+    fanout_scheduled_post  a scheduled post through the delivery ledger (and its insert)
+    cv_generate            /cv generate jobs, from submit to the response_url post
+    cv_generate_cached     the same jobs again, answered from the CV cache
+    admin_list_posts       /admin list posts, first page
+    admin_list_posts_next  the "next page" button
+
+Before them, benchmarks.startup profiles how long importing each runtime
+takes in a fresh interpreter; the run fails when that exceeds its cold-start
+budget or importing the sync app loads a package that is meant to be imported on first use.
+
+The database is a throwaway cluster when Postgres' server binaries are on
+PATH (or in PG_BIN), otherwise a scratch database on the server in the DB_*
+environment variables; see benchmarks.fakes.scratch_postgres.
+
+    python -m benchmarks.hot_paths --save-baseline
+    python -m benchmarks.hot_paths --openai-latency 1.0 --tolerance 0.2
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks import startup
+from benchmarks.fakes import FakeOpenAI, FakeSlack, scratch_postgres
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "hot_paths.json")
+
+# Rates high enough that the fan-out limiter never waits
+UNLIMITED_RATES = {"chat.postMessage": 10**9, "conversations.open": 10**9}
+
+# p99 changes smaller than this are timer noise, whatever their relative size
+NOISE_FLOOR_MS = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of `values` (0 < q <= 1)."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q * len(ordered)) - 1))]
+
+
+def user_id(index):
+    return f"U{index:07d}"
+
+
+class Counters:
+    """Database, Slack and OpenAI call counts, to diff around an operation."""
+
+    def take(self):
+        from instrumentation import db_queries
+
+        return (
+            sum(child["count"] for child in db_queries.duration.snapshot().values()),
+            sum(self.slack.snapshot().values()),
+            sum(self.openai.snapshot().values()),
+        )
+
+    def __init__(self, slack, openai):
+        self.slack = slack
+        self.openai = openai
+
+
+class Result:
+    def as_dict(self):
+        ops = len(self.latencies)
+        return {
+            "ops": ops,
+            "throughput": ops / self.seconds if self.seconds else 0.0,
+            "p50_ms": percentile(self.latencies, 0.5) * 1000,
+            "p99_ms": percentile(self.latencies, 0.99) * 1000,
+            "db_round_trips": self.calls[0] / ops,
+            "slack_calls": self.calls[1] / ops,
+            "openai_calls": self.calls[2] / ops,
+        }
+
+    def __init__(self, latencies, seconds, before, after):
+        self.latencies = latencies
+        self.seconds = seconds
+        self.calls = [b - a for a, b in zip(before, after)]
+
+
+def measure(counters, run):
+    """Run `run()`, which returns per-operation latencies, and count its calls."""
+    before = counters.take()
+    started = time.perf_counter()
+    latencies = run()
+    seconds = time.perf_counter() - started
+    return Result(latencies, seconds, before, counters.take())
+
+
+def wait_for(condition, timeout, what):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out waiting for {what}")
+        time.sleep(0.001)
+
+
+def configure(slack, openai, database, args):
+    """Point the app's configuration at the stand-ins; must precede importing it."""
+    os.environ.update(
+        {
+            "SLACK_BOT_TOKEN": "xoxb-bench",
+            "SLACK_SIGNING_SECRET": "bench-signing-secret",
+            "SLACK_API_URL": f"{slack.url}/api/",
+            "SOCKET_MODE": "false",
+            "OPEN_AI_KEY": "bench",
+            "OPENAI_BASE_URL": f"{openai.url}/v1",
+            "METRICS_PORT": "0",
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+            "CV_INGEST_MAX_AGE": str(args.ingest_max_age),
+            **database,
+        }
+    )
+
+
+def seed(args):
+    from db import insert_many
+
+    now = datetime.now()
+    insert_many(
+        "INSERT INTO cv_entries (user_id,text,timestamp,event_key) VALUES %s",
+        [
+            (
+                user_id(user),
+                f"Entry {entry}: levererade en del av projekt {entry % 7} i tid.",
+                now - timedelta(days=entry),
+                f"seed:{user}:{entry}",
+            )
+            for user in range(args.cv_users)
+            for entry in range(args.cv_entries)
+        ],
+    )
+    insert_many(
+        "INSERT INTO scheduled_posts (post_id,type,text,added_by) VALUES %s",
+        [
+            (str(uuid.uuid4()), "FridayMorning", f"Fredagspost {i}", user_id(i % 5))
+            for i in range(args.posts)
+        ],
+    )
+
+
+def message_ingest(hejbot, args):
+    buffer = hejbot.cv_entry_buffer
+    buffer.start()
+    target = buffer.metrics()["flushed"] + args.messages
+    latencies = []
+    for i in range(args.messages):
+        event = {
+            "type": "message",
+            "user": user_id(i % args.users),
+            "text": f"Idag fixade jag bugg {i} i betalflödet.",
+            "channel": "C0000001",
+            "ts": f"{time.time():.6f}",
+            "client_msg_id": str(uuid.uuid4()),
+        }
+        started = time.perf_counter()
+        hejbot.handle_message_events(event=event, logger=logger)
+        latencies.append(time.perf_counter() - started)
+    wait_for(lambda: buffer.metrics()["flushed"] >= target, 60, "CV entry flush")
+    return latencies
+
+
+def fanout_send_message(scheduler, args):
+    latencies = []
+    for i in range(args.broadcasts):
+        started = time.perf_counter()
+        scheduler._send_message(text=f"Benchmark broadcast {i}")
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def fanout_scheduled_post(scheduler, args):
+    from db import query
+    from scheduler.scheduler import PostTypes
+
+    latencies = []
+    for i in range(args.broadcasts):
+        query(
+            "INSERT INTO scheduled_posts (post_id,type,text,added_by) VALUES (%s,%s,%s,%s)",
+            (str(uuid.uuid4()), "MondayMorning", f"Måndagspost {i}", user_id(0)),
+        )
+        started = time.perf_counter()
+        scheduler._send_scheduled_post(PostTypes.MondayMorning)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def cv_generate(hejbot, slack, args, round_name):
+    submitted = {}
+    for user in range(args.cv_users):
+        name = f"{round_name}-{user}"
+        submitted[name] = time.monotonic()
+        job_id = hejbot.cv_job_queue.submit(
+            user_id(user), response_url=slack.response_url(name)
+        )
+        if job_id is None:
+            raise RuntimeError("CV job queue rejected a benchmark job")
+    wait_for(
+        lambda: all(name in slack.responses for name in submitted),
+        300,
+        "CV job responses",
+    )
+    # Jobs are released just after their response is posted
+    wait_for(
+        lambda: hejbot.cv_job_queue.metrics()["running"] == 0, 10, "CV job workers"
+    )
+    return [slack.responses[name] - started for name, started in submitted.items()]
+
+
+def admin_list_posts(hejbot, args, pages):
+    command = {"text": "list posts", "user_id": user_id(0), "trigger_id": "bench"}
+    latencies = []
+    for _ in range(args.iterations):
+        said = []
+        started = time.perf_counter()
+        hejbot.handle_admin_command(command=command, say=capture(said), client=None)
+        latencies.append(time.perf_counter() - started)
+        pages.append(said[-1])
+    return latencies
+
+
+def admin_list_posts_next(hejbot, args, pages):
+    latencies = []
+    for message in pages:
+        body = {
+            "actions": [
+                {"value": find_action(message.get("blocks"), "list_posts_next")}
+            ]
+        }
+        responded = []
+        started = time.perf_counter()
+        hejbot.handle_posts_page(body=body, respond=capture(responded))
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def capture(messages):
+    """A say/respond stand-in that records each message's arguments."""
+    return lambda text=None, **message: messages.append({"text": text, **message})
+
+
+def find_action(blocks, action_id):
+    for block in blocks or []:
+        for element in block.get("elements", []):
+            if element.get("action_id") == action_id:
+                return element["value"]
+    raise ValueError(f"No {action_id} button in the message")
+
+
+def run(args):
+    with FakeSlack(users=args.users, latency=args.slack_latency) as slack, FakeOpenAI(
+        latency=args.openai_latency
+    ) as openai, scratch_postgres() as database:
+        configure(slack, openai, database, args)
+
+        import app as hejbot
+        from db import get_pool, setup_db
+        from scheduler.fanout import FanOut
+        from scheduler.scheduler import Scheduler
+
+        hejbot.app.verify_token()
+        setup_db()
+        seed(args)
+        counters = Counters(slack, openai)
+        scheduler = Scheduler(logger=logger, app=hejbot.app)
+        if not args.slack_rate_limits:
+            scheduler.fanout = FanOut(
+                logger=logger, app=hejbot.app, rates=UNLIMITED_RATES
+            )
+        scheduler._send_message(text="Warm-up")  # loads users and DM channels
+
+        pages = []
+        operations = [
+            ("message_ingest", lambda: message_ingest(hejbot, args)),
+            ("fanout_send_message", lambda: fanout_send_message(scheduler, args)),
+            ("fanout_scheduled_post", lambda: fanout_scheduled_post(scheduler, args)),
+            ("cv_generate", lambda: cv_generate(hejbot, slack, args, "cold")),
+            ("cv_generate_cached", lambda: cv_generate(hejbot, slack, args, "cached")),
+            ("admin_list_posts", lambda: admin_list_posts(hejbot, args, pages)),
+            (
+                "admin_list_posts_next",
+                lambda: admin_list_posts_next(hejbot, args, pages),
+            ),
+        ]
+        try:
+            return {
+                name: measure(counters, operation).as_dict()
+                for name, operation in operations
+                if not args.only or name in args.only
+            }
+        finally:
+            hejbot.cv_entry_buffer.stop()
+            hejbot.cv_job_queue.shutdown()
+            get_pool().close()
+
+
+def compare(results, baseline, tolerance):
+    """Print results next to the baseline; return the names that regressed."""
+    regressions = []
+    print(
+        f"{'operation':24}{'ops':>6}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'db/op':>8}{'slack/op':>10}{'openai/op':>10}  vs baseline"
+    )
+    for name, result in results.items():
+        line = (
+            f"{name:24}{result['ops']:>6}{result['throughput']:>10.1f}"
+            f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+            f"{result['db_round_trips']:>8.2f}{result['slack_calls']:>10.2f}"
+            f"{result['openai_calls']:>10.2f}"
+        )
+        before = baseline.get(name)
+        if before:
+            p99 = result["p99_ms"] / before["p99_ms"] - 1 if before["p99_ms"] else 0
+            throughput = (
+                result["throughput"] / before["throughput"] - 1
+                if before["throughput"]
+                else 0
+            )
+            trips = result["db_round_trips"] - before["db_round_trips"]
+            line += f"  p99 {p99:+.0%}, ops/s {throughput:+.0%}, db/op {trips:+.2f}"
+            slower = p99 > tolerance and (
+                result["p99_ms"] - before["p99_ms"] > NOISE_FLOOR_MS
+            )
+            if slower or throughput < -tolerance or trips > 0.01:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--broadcasts", type=int, default=5)
+    parser.add_argument("--cv-users", type=int, default=20)
+    parser.add_argument("--cv-entries", type=int, default=50)
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--slack-latency", type=float, default=0.005)
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--ingest-max-age", type=float, default=0.05)
+    parser.add_argument(
+        "--slack-rate-limits",
+        action="store_true",
+        help="keep the fan-out's Slack rate limits (broadcasts then take minutes)",
+    )
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument(
+        "--cold-start-budget-ms",
+        type=float,
+        default=startup.COLD_START_BUDGET_MS,
+        help="median `import app` time above which the run fails",
+    )
+    parser.add_argument(
+        "--async-cold-start-budget-ms",
+        type=float,
+        default=startup.ASYNC_COLD_START_BUDGET_MS,
+        help="median `import async_app` time above which the run fails",
+    )
+    parser.add_argument(
+        "--only", nargs="*", help="operations to run (`startup` for the import profile)"
+    )
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="relative p99/throughput change reported as a regression",
+    )
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    startup_results, problems = {}, []
+    if not args.only or "startup" in args.only:
+        startup_results = startup.profile(runs=args.startup_runs)
+        problems = startup.print_report(
+            startup_results,
+            args.cold_start_budget_ms,
+            baseline.get("startup"),
+            args.async_cold_start_budget_ms,
+        )
+        print()
+
+    results = {}
+    if not args.only or set(args.only) - {"startup"}:
+        results = run(args)
+    regressions = compare(results, baseline.get("results", {}), args.tolerance)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "recorded_at": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "settings": {
+                        key: value
+                        for key, value in vars(args).items()
+                        if key not in ("baseline", "save_baseline", "only")
+                    },
+                    "results": results,
+                    "startup": {
+                        target: result["median_ms"]
+                        for target, result in startup_results.items()
+                    },
+                },
+                f,
+                indent=2,
+            )
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions or problems:
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Run several schedulers as separate processes against one local Postgres
+database and check that only one of them runs jobs at any time.
+
+Each worker process runs a LeaderElector whose leader starts a JobEngine with
+a job that fires every `--tick` seconds, and a Daily job whose wall-clock time
+falls a few seconds into the run. Workers report when they are elected,
+demoted and run a job. The controller repeatedly takes the current leader
+down, alternately with SIGKILL (its session dies with the process) and
+SIGTERM (it steps down and unlocks), starts a replacement worker, and
+afterwards checks that
+
+    - no two workers were leader at the same time,
+    - every job run came from the worker leading at that moment,
+    - the daily job ran exactly once, at its time, and not again when a
+      follower that was waiting at that time became leader,
+    - a follower took over within LEADER_RETRY_INTERVAL plus a margin.
+
+The database is a throwaway cluster when Postgres' server binaries are on
+PATH (or in PG_BIN), otherwise a scratch database on the server in the DB_*
+environment variables; see benchmarks.fakes.scratch_postgres.
+
+    python -m benchmarks.leader_election --workers 3 --rounds 6
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pytz
+
+from benchmarks.fakes import scratch_postgres
+from scheduler.engine import Daily, Every
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Slack for process start-up and scheduling on a loaded machine
+TAKEOVER_MARGIN = 2.0
+
+
+class DailyAt(Daily):
+    """Daily rule at a UTC wall-clock time given to the second."""
+
+    def __init__(self, timestamp):
+        super().__init__("00:00", tz=pytz.utc)
+        self.at = datetime.fromtimestamp(timestamp, pytz.utc).time()
+
+
+def report(worker, event):
+    print(json.dumps({"worker": worker, "event": event, "at": time.time()}), flush=True)
+
+
+def worker(args):
+    """One replica: elect, run the tick job while leading, step down on SIGTERM."""
+    from leader import LeaderElector
+    from scheduler.engine import JobEngine
+
+    logging.basicConfig(level=logging.WARNING)
+    logger = logging.getLogger(f"worker{args.worker}")
+    engine = JobEngine(logger=logger)
+    engine.register("tick", Every(args.tick), lambda: report(args.worker, "tick"))
+    engine.register(
+        "daily", DailyAt(args.daily_at), lambda: report(args.worker, "daily")
+    )
+
+    def on_elected():
+        report(args.worker, "elected")
+        engine.start()
+
+    def on_demoted():
+        engine.stop()
+        report(args.worker, "demoted")
+
+    elector = LeaderElector(
+        logger=logger,
+        on_elected=on_elected,
+        on_demoted=on_demoted,
+        lease_timeout=args.lease_timeout,
+        retry_interval=args.retry_interval,
+    )
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    elector.start()
+    report(args.worker, "started")
+    stopping.wait()
+    elector.stop()
+    report(args.worker, "exited")
+
+
+class Cluster:
+    """Worker processes and the events they report, in arrival order."""
+
+    def spawn(self):
+        index = len(self.processes)
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.leader_election",
+                "--worker",
+                str(index),
+                "--tick",
+                str(self.args.tick),
+                "--lease-timeout",
+                str(self.args.lease_timeout),
+                "--retry-interval",
+                str(self.args.retry_interval),
+                "--daily-at",
+                str(self.daily_at),
+            ],
+            cwd=ROOT,
+            env=self.env,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        self.processes.append(process)
+        threading.Thread(target=self._read, args=(process,), daemon=True).start()
+        return index
+
+    def leader(self):
+        """Return the worker currently leading, by the events so far, or None."""
+        with self._lock:
+            leaders = set()
+            for event in self.events:
+                if event["event"] == "elected":
+                    leaders.add(event["worker"])
+                elif event["event"] in ("demoted", "killed"):
+                    leaders.discard(event["worker"])
+            return next(iter(leaders)) if len(leaders) == 1 else None
+
+    def wait_for_leader(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            leader = self.leader()
+            if leader is not None:
+                return leader
+            time.sleep(0.05)
+        raise TimeoutError("No leader was elected")
+
+    def kill(self, index):
+        self.processes[index].kill()
+        self.processes[index].wait()
+        # The controller notes the end of the killed worker's leadership
+        with self._lock:
+            self.events.append({"worker": index, "event": "killed", "at": time.time()})
+
+    def terminate(self, index, timeout):
+        self.processes[index].terminate()
+        self.processes[index].wait(timeout)
+
+    def stop(self, timeout):
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def _read(self, process):
+        for line in process.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            with self._lock:
+                self.events.append(event)
+
+    def __init__(self, args, env, daily_at):
+        self.args = args
+        self.env = env
+        self.daily_at = daily_at
+        self.processes = []
+        self.events = []
+        self._lock = threading.Lock()
+
+
+def terms(events):
+    """Return (worker, elected_at, ended_at) for every leadership term."""
+    open_terms, result = {}, []
+    for event in sorted(events, key=lambda event: event["at"]):
+        worker = event["worker"]
+        if event["event"] == "elected":
+            open_terms[worker] = event["at"]
+        elif event["event"] in ("demoted", "killed") and worker in open_terms:
+            result.append((worker, open_terms.pop(worker), event["at"]))
+    result += [(worker, at, float("inf")) for worker, at in open_terms.items()]
+    return sorted(result, key=lambda term: term[1])
+
+
+def check(events, max_takeover, daily_at):
+    """Return (problems, takeover times) for the events of a run."""
+    problems = []
+    leadership = terms(events)
+    latest = None  # the term that ends last among those started so far
+    for term in leadership:
+        worker, elected, ended = term
+        if latest is not None and elected < latest[2]:
+            problems.append(
+                f"workers {latest[0]} and {worker} were both leader "
+                f"for {min(ended, latest[2]) - elected:.3f}s"
+            )
+        if latest is None or ended > latest[2]:
+            latest = term
+    for event in events:
+        if event["event"] in ("tick", "daily") and not any(
+            worker == event["worker"] and elected <= event["at"] <= ended
+            for worker, elected, ended in leadership
+        ):
+            problems.append(f"worker {event['worker']} ran a job without leading")
+
+    daily = [event["at"] for event in events if event["event"] == "daily"]
+    if len(daily) != 1:
+        problems.append(f"the daily job ran {len(daily)} times (expected once)")
+    for at in daily:
+        if not daily_at <= at <= daily_at + TAKEOVER_MARGIN:
+            problems.append(f"the daily job ran {at - daily_at:.1f}s after its time")
+
+    takeovers = [
+        elected - ended
+        for (_, _, ended), (_, elected, _) in zip(leadership, leadership[1:])
+    ]
+    for takeover in takeovers:
+        if takeover > max_takeover:
+            problems.append(f"takeover took {takeover:.1f}s (limit {max_takeover}s)")
+    return problems, takeovers
+
+
+def run(args):
+    with scratch_postgres() as database:
+        env = {
+            **os.environ,
+            **database,
+            "LOG_LEVEL": "WARNING",
+            "PYTHONUNBUFFERED": "1",
+        }
+        # Every first-generation worker registers the daily job before its
+        # time; the first leader must run it and its successors must not.
+        daily_at = time.time() + args.daily_delay
+        cluster = Cluster(args, env, daily_at)
+        for _ in range(args.workers):
+            cluster.spawn()
+        try:
+            for round_number in range(args.rounds):
+                leader = cluster.wait_for_leader(args.lease_timeout * 2 + 10)
+                time.sleep(max(args.tick * 4, daily_at + args.tick * 4 - time.time()))
+                if round_number % 2 == 0:
+                    cluster.kill(leader)
+                else:
+                    cluster.terminate(leader, args.lease_timeout + 10)
+                cluster.spawn()
+            cluster.wait_for_leader(args.lease_timeout * 2 + 10)
+            time.sleep(args.tick * 4)
+        finally:
+            cluster.stop(args.lease_timeout + 10)
+
+    problems, takeovers = check(
+        cluster.events, args.retry_interval + TAKEOVER_MARGIN, daily_at
+    )
+    ticks = sum(1 for event in cluster.events if event["event"] == "tick")
+    print(
+        f"{len(cluster.processes)} workers, {len(terms(cluster.events))} leadership "
+        f"terms, {ticks} job runs"
+    )
+    if takeovers:
+        print(
+            f"  takeover: {min(takeovers):.2f}s min, {max(takeovers):.2f}s max "
+            f"(retry interval {args.retry_interval}s)"
+        )
+    for problem in problems:
+        print(f"  {problem}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=6)
+    parser.add_argument("--tick", type=float, default=0.2)
+    parser.add_argument("--lease-timeout", type=float, default=6)
+    parser.add_argument("--retry-interval", type=float, default=1)
+    parser.add_argument(
+        "--daily-delay",
+        type=float,
+        default=5,
+        help="seconds from start to the daily job's wall-clock time",
+    )
+    parser.add_argument("--daily-at", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        worker(args)
+    elif run(args):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
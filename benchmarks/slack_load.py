@@ -0,0 +1,595 @@
+"""
+Replay recorded or synthetic Slack requests against the app in HTTP mode.
+
+Every request is signed with SLACK_SIGNING_SECRET exactly like Slack signs
+it (v0 HMAC-SHA256 of `v0:<timestamp>:<body>`), so it passes Bolt's request
+verification. A run is made of streams that each send one kind of request:
+
+    message:rate=500            open loop, 500 requests per second
+    cv_generate:concurrency=20  closed loop, 20 requests always in flight
+    replay:file=events.jsonl,rate=50
+
+Synthetic kinds are message, app_mention, hello, cv_generate and
+admin_list_posts. A replay file holds one recorded payload per line: an
+Events API envelope, a slash command's form fields or an interactive
+payload. With `speed=` instead of `rate=`, lines that have an "offset"
+(seconds from the start) are sent at their recorded times, scaled by speed.
+Event ids and message ids are replaced with fresh ones unless
+`--keep-ids` is given, so the app's retry dedupe does not drop the replay.
+
+Per stream, the report shows ack latency as seen by the sender
+(p50/p99/max), HTTP errors and timeouts. A timeout is a request that took
+longer than Slack's 3 s ack limit. It also counts sends that started late
+because the open-loop schedule fell behind. While the load runs, the app's
+/metrics page is scraped, and the report shows the peak listener, CV job,
+ingest buffer and pool queue depths and the app's own ack latency.
+
+Point the app at a fake Slack so its replies go nowhere, for example:
+
+    python -m benchmarks.slack_load --fake-slack 8090 --fake-openai 8091 &
+    SOCKET_MODE=false SLACK_API_URL=http://127.0.0.1:8090/api/ \\
+        OPENAI_BASE_URL=http://127.0.0.1:8091/v1 python app.py
+
+Then send the load:
+
+    python -m benchmarks.slack_load --scenario burst
+    python -m benchmarks.slack_load --stream message:rate=500 \\
+        --stream cv_generate:concurrency=20 --duration 30
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import urlencode
+
+import aiohttp
+
+from benchmarks.fakes import FakeOpenAI, FakeSlack
+
+# Slack retries a request it did not see acknowledged within this many seconds
+SLACK_ACK_TIMEOUT = 3.0
+
+# A send that starts this much after its scheduled time counts as late
+LATE_AFTER = 0.05
+
+SCENARIOS = {
+    "steady": ["message:rate=50", "app_mention:rate=2", "admin_list_posts:rate=1"],
+    "burst": ["message:rate=500", "cv_generate:concurrency=20"],
+    "commands": [
+        "hello:rate=20",
+        "admin_list_posts:rate=10",
+        "cv_generate:concurrency=5",
+    ],
+}
+
+# /metrics series whose peaks show how far work backs up behind the ack
+WATCHED = (
+    "hejbot_listener_executor_queued",
+    "hejbot_listener_in_flight",
+    "hejbot_cv_jobs_queue_depth",
+    "hejbot_cv_jobs_running",
+    "hejbot_cv_jobs_rejected_total",
+    "hejbot_cv_entry_buffer_queued",
+    "hejbot_cv_entry_buffer_dropped_total",
+    "hejbot_db_pool_in_use",
+    "hejbot_db_pool_waiting",
+)
+
+ACK_HISTOGRAM = "hejbot_slack_ack_latency_seconds"
+
+# Synthetic request kinds (methods of Synthetic)
+KINDS = ("message", "app_mention", "hello", "cv_generate", "admin_list_posts")
+
+
+def sign(secret, timestamp, body):
+    """Slack's v0 request signature for `body` sent at `timestamp`."""
+    base = b"v0:" + str(timestamp).encode() + b":" + body
+    return "v0=" + hmac.new(secret.encode(), base, hashlib.sha256).hexdigest()
+
+
+def encode(payload):
+    """Return (content type, body) the way Slack would send `payload`."""
+    if payload.get("type") in ("event_callback", "url_verification"):
+        return "application/json", json.dumps(payload).encode()
+    if "command" in payload:
+        return "application/x-www-form-urlencoded", urlencode(payload).encode()
+    return (
+        "application/x-www-form-urlencoded",
+        urlencode({"payload": json.dumps(payload)}).encode(),
+    )
+
+
+def freshen(payload):
+    """Give a recorded event new ids so the app treats it as a new delivery."""
+    if payload.get("type") != "event_callback":
+        return payload
+    payload = {**payload, "event_id": f"Ev{uuid.uuid4().hex[:16].upper()}"}
+    event = dict(payload.get("event", {}))
+    if "client_msg_id" in event:
+        event["client_msg_id"] = str(uuid.uuid4())
+    if "ts" in event:
+        event["ts"] = f"{time.time():.6f}"
+    payload["event"] = event
+    return payload
+
+
+class Synthetic:
+    """Builds synthetic payloads for a workspace of `users` members."""
+
+    def user(self):
+        return f"U{random.randrange(self.users):07d}"
+
+    def envelope(self, event):
+        return {
+            "token": "loadtest",
+            "team_id": self.team_id,
+            "api_app_id": "ALOADTEST",
+            "type": "event_callback",
+            "event_id": f"Ev{uuid.uuid4().hex[:16].upper()}",
+            "event_time": int(time.time()),
+            "event": event,
+        }
+
+    def message(self):
+        return self.envelope(
+            {
+                "type": "message",
+                "user": self.user(),
+                "text": "Idag fixade jag en bugg i betalflödet och parade med ett nytt team.",
+                "channel": "C0LOADTEST",
+                "channel_type": "channel",
+                "ts": f"{time.time():.6f}",
+                "client_msg_id": str(uuid.uuid4()),
+            }
+        )
+
+    def app_mention(self):
+        return self.envelope(
+            {
+                "type": "app_mention",
+                "user": self.user(),
+                "text": "<@UBOT00001> hej!",
+                "channel": "C0LOADTEST",
+                "ts": f"{time.time():.6f}",
+            }
+        )
+
+    def command(self, command, text):
+        user = self.user()
+        return {
+            "token": "loadtest",
+            "team_id": self.team_id,
+            "channel_id": "C0LOADTEST",
+            "user_id": user,
+            "user_name": user.lower(),
+            "command": self.command_prefix + command,
+            "text": text,
+            "response_url": f"{self.response_url}/{uuid.uuid4().hex}",
+            "trigger_id": f"{random.randrange(10**12)}.loadtest",
+        }
+
+    def hello(self):
+        return self.command("/hello", "")
+
+    def cv_generate(self):
+        return self.command("/cv", "generate")
+
+    def admin_list_posts(self):
+        return self.command("/admin", "list posts")
+
+    def __init__(self, users, response_url, command_prefix=""):
+        self.users = users
+        self.response_url = response_url.rstrip("/")
+        self.command_prefix = command_prefix
+        self.team_id = "T0000001"
+
+
+class Stream:
+    """One kind of request sent at a rate (open loop) or a concurrency (closed loop)."""
+
+    def next_payload(self):
+        if self.records is None:
+            return getattr(self.synthetic, self.kind)()
+        payload = self.records[self._position % len(self.records)]["payload"]
+        self._position += 1
+        return payload if self.keep_ids else freshen(payload)
+
+    def record(self, latency=None, status=None, error=None):
+        self.sent += 1
+        if error is not None:
+            self.errors[error] += 1
+            return
+        self.latencies.append(latency)
+        self.statuses[status] += 1
+
+    def report(self, duration):
+        latencies = sorted(self.latencies)
+        row = {
+            "stream": self.spec,
+            "sent": self.sent,
+            "rate": self.sent / duration if duration else 0.0,
+            "ok": self.statuses.get(200, 0),
+            "errors": sum(self.errors.values())
+            + sum(n for status, n in self.statuses.items() if status != 200),
+            "timeouts": self.errors.get("timeout", 0),
+            "late": self.late,
+        }
+        for name, q in (("p50_ms", 0.5), ("p99_ms", 0.99)):
+            row[name] = percentile(latencies, q) * 1000 if latencies else None
+        row["max_ms"] = latencies[-1] * 1000 if latencies else None
+        row["detail"] = {
+            **{str(status): n for status, n in self.statuses.items() if status != 200},
+            **self.errors,
+        }
+        return row
+
+    def __init__(self, spec, synthetic, keep_ids=False):
+        kind, _, options = spec.partition(":")
+        options = dict(option.split("=", 1) for option in options.split(",") if option)
+        self.spec = spec
+        self.kind = kind
+        self.rate = float(options["rate"]) if "rate" in options else None
+        self.concurrency = int(options.get("concurrency", 0))
+        self.speed = float(options["speed"]) if "speed" in options else None
+        self.synthetic = synthetic
+        self.keep_ids = keep_ids
+        self.records = None
+        if kind == "replay":
+            self.records = load_records(options["file"])
+        elif kind not in KINDS:
+            raise ValueError(f"Unknown request kind {kind!r} in {spec!r}")
+        if not (self.rate or self.concurrency or self.speed):
+            raise ValueError(f"{spec!r} needs rate=, concurrency= or speed=")
+        if self.speed and (
+            self.records is None
+            or any("offset" not in record for record in self.records)
+        ):
+            raise ValueError(f"{spec!r}: speed= needs a replay file with offsets")
+        self.sent = 0
+        self.late = 0
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+        self._position = 0
+
+
+def load_records(path):
+    """Read a replay file; each line is a payload or {"offset": s, "payload": ...}."""
+    records = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "payload" not in record:
+                record = {"payload": record}
+            records.append(record)
+    if not records:
+        raise ValueError(f"{path} has no payloads")
+    return records
+
+
+def percentile(ordered, q):
+    return ordered[max(0, min(len(ordered) - 1, round(q * len(ordered)) - 1))]
+
+
+class LoadGenerator:
+    async def send(self, session, stream):
+        payload = stream.next_payload()
+        content_type, body = encode(payload)
+        timestamp = int(time.time())
+        headers = {
+            "Content-Type": content_type,
+            "X-Slack-Request-Timestamp": str(timestamp),
+            "X-Slack-Signature": sign(self.signing_secret, timestamp, body),
+        }
+        started = time.perf_counter()
+        try:
+            async with session.post(self.url, data=body, headers=headers) as response:
+                await response.read()
+                stream.record(time.perf_counter() - started, response.status)
+        except asyncio.TimeoutError:
+            stream.record(error="timeout")
+        except aiohttp.ClientError as e:
+            stream.record(error=type(e).__name__)
+
+    async def open_loop(self, session, stream, deadline):
+        """Send at the stream's rate (or recorded offsets) whatever the responses do."""
+        tasks = set()
+        started = time.monotonic()
+        for n in range(sys.maxsize):
+            if stream.speed:
+                if n >= len(stream.records):
+                    break
+                due = started + stream.records[n]["offset"] / stream.speed
+            else:
+                due = started + n / stream.rate
+            if due >= deadline:
+                break
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay > LATE_AFTER:
+                stream.late += 1
+            await self._slots.acquire()  # waiting for a free slot makes sends late
+            task = asyncio.create_task(self._send_and_release(session, stream))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def closed_loop(self, session, stream, deadline):
+        async def worker():
+            while time.monotonic() < deadline:
+                await self._send_in_slot(session, stream)
+
+        await asyncio.gather(*(worker() for _ in range(stream.concurrency)))
+
+    async def scrape(self, session, deadline):
+        """Track peak queue gauges and the app's ack latency histogram."""
+        first = last = None
+        while True:
+            samples = await self._scrape_once(session)
+            if samples is not None:
+                first = first or samples
+                last = samples
+                for name in WATCHED:
+                    values = [v for (sample, _), v in samples.items() if sample == name]
+                    if values:
+                        self.peaks[name] = max(self.peaks.get(name, 0), sum(values))
+            if time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(self.scrape_interval)
+        if first is not None:
+            self.server_ack = ack_latency_delta(first, last)
+
+    async def _scrape_once(self, session):
+        try:
+            async with session.get(self.metrics_url) as response:
+                return parse_metrics(await response.text())
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.scrape_errors += 1
+            return None
+
+    async def _send_in_slot(self, session, stream):
+        async with self._slots:
+            await self.send(session, stream)
+
+    async def _send_and_release(self, session, stream):
+        try:
+            await self.send(session, stream)
+        finally:
+            self._slots.release()
+
+    async def run(self, streams, duration):
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight)
+        async with aiohttp.ClientSession(
+            timeout=timeout, connector=connector
+        ) as session:
+            deadline = time.monotonic() + duration
+            jobs = [
+                (
+                    self.open_loop(session, stream, deadline)
+                    if stream.rate or stream.speed
+                    else self.closed_loop(session, stream, deadline)
+                )
+                for stream in streams
+            ]
+            scraper = None
+            if self.metrics_url:
+                # The final scrape comes after the load, once queues have drained
+                scraper = asyncio.create_task(
+                    self.scrape(session, deadline + self.drain)
+                )
+            started = time.monotonic()
+            await asyncio.gather(*jobs)
+            elapsed = time.monotonic() - started
+            if scraper is not None:
+                await scraper
+            return elapsed
+
+    def __init__(
+        self,
+        url,
+        signing_secret,
+        metrics_url=None,
+        timeout=SLACK_ACK_TIMEOUT,
+        max_in_flight=1000,
+        scrape_interval=1.0,
+        drain=5.0,
+    ):
+        self.url = url
+        self.signing_secret = signing_secret
+        self.metrics_url = metrics_url
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.scrape_interval = scrape_interval
+        self.drain = drain
+        self.peaks = {}
+        self.server_ack = {}
+        self.scrape_errors = 0
+        self._slots = None
+
+
+def parse_metrics(text):
+    """Parse the Prometheus text format into {(name, labels): value}."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        head, _, value = line.rpartition(" ")
+        name, _, labels = head.partition("{")
+        samples[(name, labels.rstrip("}"))] = float(value)
+    return samples
+
+
+def ack_latency_delta(first, last):
+    """Per-handler request count, mean and p99 of the app's ack latency during the run."""
+    buckets = defaultdict(list)
+    counts, sums = {}, {}
+    for (name, labels), value in last.items():
+        delta = value - first.get((name, labels), 0)
+        if name == ACK_HISTOGRAM + "_bucket":
+            handler, bound = _label(labels, "handler"), _label(labels, "le")
+            buckets[handler].append((float(bound), delta))
+        elif name == ACK_HISTOGRAM + "_count":
+            counts[_label(labels, "handler")] = delta
+        elif name == ACK_HISTOGRAM + "_sum":
+            sums[_label(labels, "handler")] = delta
+    result = {}
+    for handler, count in counts.items():
+        if not count:
+            continue
+        p99 = next(
+            bound for bound, seen in sorted(buckets[handler]) if seen >= 0.99 * count
+        )
+        result[handler] = {
+            "requests": int(count),
+            "mean_ms": sums[handler] / count * 1000,
+            "p99_ms_le": p99 * 1000,
+        }
+    return result
+
+
+def _label(labels, key):
+    for pair in labels.split(","):
+        name, _, value = pair.partition("=")
+        if name == key:
+            return value.strip('"')
+    return ""
+
+
+def print_report(rows, generator, duration):
+    print(f"{duration:.1f}s against {generator.url}")
+    print(
+        f"{'stream':34}{'sent':>7}{'req/s':>8}{'ok':>7}{'errors':>7}{'timeouts':>9}"
+        f"{'late':>6}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    )
+    for row in rows:
+        latencies = "".join(
+            f"{row[key]:>9.1f}" if row[key] is not None else f"{'-':>9}"
+            for key in ("p50_ms", "p99_ms", "max_ms")
+        )
+        print(
+            f"{row['stream']:34}{row['sent']:>7}{row['rate']:>8.1f}{row['ok']:>7}"
+            f"{row['errors']:>7}{row['timeouts']:>9}{row['late']:>6}{latencies}"
+        )
+        if row["detail"]:
+            print(f"{'':34}{row['detail']}")
+    if generator.metrics_url:
+        if generator.scrape_errors:
+            print(f"/metrics scrapes failed: {generator.scrape_errors}")
+        if generator.peaks:
+            print("Peak values on /metrics:")
+            for name, value in generator.peaks.items():
+                print(f"  {name:40}{value:>10.0f}")
+        if generator.server_ack:
+            print("Ack latency measured by the app:")
+            for handler, ack in sorted(generator.server_ack.items()):
+                print(
+                    f"  {handler:40}{ack['requests']:>8} requests, "
+                    f"mean {ack['mean_ms']:.1f} ms, p99 <= {ack['p99_ms_le']:.0f} ms"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="Built-in scenarios:\n"
+        + "\n".join(f"  {name}: {' '.join(s)}" for name, s in SCENARIOS.items()),
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:3000/slack/events")
+    parser.add_argument("--metrics-url", default="http://127.0.0.1:9464/metrics")
+    parser.add_argument("--no-metrics", action="store_true")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--stream", action="append", default=[])
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=SLACK_ACK_TIMEOUT)
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument(
+        "--drain", type=float, default=5, help="seconds to keep scraping after"
+    )
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--command-prefix", default="", help="e.g. dev- with DEV=true")
+    parser.add_argument("--response-url", help="base URL for commands' response_url")
+    parser.add_argument("--keep-ids", action="store_true")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument(
+        "--fake-slack", type=int, metavar="PORT", help="serve a fake Slack API"
+    )
+    parser.add_argument(
+        "--fake-openai", type=int, metavar="PORT", help="serve a fake OpenAI API"
+    )
+    parser.add_argument("--openai-latency", type=float, default=2.0)
+    args = parser.parse_args()
+
+    fakes = []
+    if args.fake_slack:
+        fakes.append(FakeSlack(users=args.users, port=args.fake_slack).start())
+    if args.fake_openai:
+        fakes.append(
+            FakeOpenAI(latency=args.openai_latency, port=args.fake_openai).start()
+        )
+    specs = SCENARIOS.get(args.scenario, []) + args.stream
+    if not specs:
+        if not fakes:
+            parser.error("give --scenario or --stream (or --fake-slack/--fake-openai)")
+        for fake in fakes:
+            print(f"{type(fake).__name__} listening on {fake.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return
+
+    signing_secret = os.environ.get("SLACK_SIGNING_SECRET")
+    if not signing_secret:
+        parser.error("SLACK_SIGNING_SECRET must be set to the app's signing secret")
+    response_url = args.response_url or (
+        f"{fakes[0].url}/response" if args.fake_slack else "http://127.0.0.1:9/response"
+    )
+    synthetic = Synthetic(args.users, response_url, args.command_prefix)
+    streams = [Stream(spec, synthetic, args.keep_ids) for spec in specs]
+    generator = LoadGenerator(
+        args.url,
+        signing_secret,
+        metrics_url=None if args.no_metrics else args.metrics_url,
+        timeout=args.timeout,
+        max_in_flight=args.max_in_flight,
+        drain=args.drain,
+    )
+    try:
+        duration = asyncio.run(generator.run(streams, args.duration))
+    finally:
+        for fake in fakes:
+            fake.stop()
+
+    rows = [stream.report(duration) for stream in streams]
+    print_report(rows, generator, duration)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "duration": duration,
+                    "streams": rows,
+                    "peaks": generator.peaks,
+                    "server_ack": generator.server_ack,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Profile Hejbot's cold start: how long a fresh interpreter takes to import the
+app, and the modules tools such as seeder.py import on their own, and which
+packages the time goes to.
+
+Every target is imported `--runs` times, each in a new interpreter with
+placeholder credentials and a fake Slack Web API, so nothing reaches the
+network. The medians of `app` and `async_app` are compared with their
+cold-start budgets; one more run under
+`python -X importtime` shows the slowest imports and flags heavy packages that
+are meant to load on first use but were imported anyway.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --budget-ms 250 --runs 10 --top 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.fakes import FakeSlack
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Median import times of each runtime's entrypoint in a fresh interpreter, on
+# a warm bytecode cache. `app` measures 150-250 ms and `async_app` 320-400 ms
+# on a developer machine; the rest is headroom for slower CI runners, so a
+# failure means an import regression rather than noise. `async_app` costs more
+# because AsyncApp imports aiohttp, which also builds its default SSL contexts
+# on import; Socket Mode's websocket client is left to serve_socket_mode().
+COLD_START_BUDGET_MS = 300
+ASYNC_COLD_START_BUDGET_MS = 500
+
+TARGETS = ("config", "db", "app", "async_app")
+
+# Imported on first use; none of them should appear when importing `app`
+DEFERRED = (
+    "openai",
+    "googleapiclient",
+    "oauth2client",
+    "asyncpg",
+    "aiohttp",
+    "holidays",
+)
+
+TIMED = (
+    "import time; started = time.perf_counter(); import {target}; "
+    "print((time.perf_counter() - started) * 1000)"
+)
+
+
+def child_env(slack_url):
+    env = dict(os.environ)
+    env.update(
+        {
+            "SLACK_BOT_TOKEN": "xoxb-bench",
+            "SLACK_SIGNING_SECRET": "bench-signing-secret",
+            "SLACK_APP_TOKEN": "xapp-bench",
+            "SLACK_API_URL": f"{slack_url}/api/",
+            "OPEN_AI_KEY": "bench",
+        }
+    )
+    return env
+
+
+def import_ms(target, env):
+    """Import `target` in a new interpreter; return the milliseconds it took."""
+    result = subprocess.run(
+        [sys.executable, "-c", TIMED.format(target=target)],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{result.stderr}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def import_profile(target, env):
+    """Return {module: (self_us, cumulative_us)} from `python -X importtime`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{result.stderr}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def by_package(modules):
+    """Sum self time per top-level package, e.g. everything under `openai.`."""
+    packages = {}
+    for name, (self_us, _) in modules.items():
+        package = name.split(".", 1)[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return packages
+
+
+def profile(targets=TARGETS, runs=5, top=10):
+    """Time each target's import; returns {target: result dict}."""
+    # The app verifies its token on first use, but keep any call local
+    with FakeSlack() as slack:
+        env = child_env(slack.url)
+        import_ms("config", env)  # compile bytecode outside the timed runs
+        results = {}
+        for target in targets:
+            samples = [import_ms(target, env) for _ in range(runs)]
+            modules = import_profile(target, env)
+            packages = by_package(modules)
+            results[target] = {
+                "samples_ms": samples,
+                "median_ms": statistics.median(samples),
+                "max_ms": max(samples),
+                "modules": len(modules),
+                "slowest_packages_ms": {
+                    package: self_us / 1000
+                    for package, self_us in sorted(
+                        packages.items(), key=lambda item: -item[1]
+                    )[:top]
+                },
+                "deferred_imported": [
+                    package for package in DEFERRED if package in packages
+                ],
+            }
+        return results
+
+
+def print_report(
+    results,
+    budget_ms=COLD_START_BUDGET_MS,
+    baseline=None,
+    async_budget_ms=ASYNC_COLD_START_BUDGET_MS,
+):
+    """Print the profile; return a list of problems (over budget, eager imports).
+
+    `baseline` maps targets to earlier median times, e.g. from the
+    benchmarks.hot_paths baseline, and is shown for comparison.
+    """
+    problems = []
+    baseline = baseline or {}
+    print(f"{'import':12}{'median ms':>11}{'max ms':>9}{'modules':>9}  vs baseline")
+    for target, result in results.items():
+        line = (
+            f"{target:12}{result['median_ms']:>11.1f}{result['max_ms']:>9.1f}"
+            f"{result['modules']:>9}"
+        )
+        if baseline.get(target):
+            line += f"  {result['median_ms'] / baseline[target] - 1:+.0%}"
+        print(line)
+    for target, result in results.items():
+        packages = ", ".join(
+            f"{package} {ms:.1f}"
+            for package, ms in result["slowest_packages_ms"].items()
+        )
+        print(f"  {target}: slowest packages (ms, own time): {packages}")
+
+    for target, budget in (("app", budget_ms), ("async_app", async_budget_ms)):
+        result = results.get(target)
+        if result is not None and result["median_ms"] > budget:
+            problems.append(
+                f"import {target} took {result['median_ms']:.0f} ms, "
+                f"over the {budget} ms cold-start budget"
+            )
+    app = results.get("app")
+    if app is not None:
+        if app["deferred_imported"]:
+            problems.append(
+                f"import app loaded {', '.join(app['deferred_imported'])}, "
+                "which should load on first use"
+            )
+    for problem in problems:
+        print(f"  {problem}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=COLD_START_BUDGET_MS)
+    parser.add_argument(
+        "--async-budget-ms", type=float, default=ASYNC_COLD_START_BUDGET_MS
+    )
+    parser.add_argument("--targets", nargs="*", default=list(TARGETS))
+    args = parser.parse_args()
+
+    results = profile(args.targets, args.runs, args.top)
+    if print_report(results, args.budget_ms, async_budget_ms=args.async_budget_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
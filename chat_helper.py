@@ -1,13 +1,28 @@
+import logging
+import threading
+import time
+
 from slack_bolt import App
 
-excluded_users = [
+from db import query
+from user_directory import UserDirectory
+
+excluded_users = {
     "USLACKBOT",  # slackbot
     "U3XHXNE9X",  # ludde
     "U3Y6GK2UT",  # henrik
     "U7TTAP649",  # bernhard
     "UH8HFCQ6M",  # damien
     "U03JRG1L2BD",  # sara
-]
+}
+
+# One directory per Bolt app (and per process, since each builds its own app)
+_directories = {}
+_directories_lock = threading.Lock()
+
+# user id -> DM channel id, mirrored from the dm_channels table
+_private_chats = None
+_private_chats_lock = threading.Lock()
 
 
 def is_valid_user(user):
@@ -16,13 +31,94 @@ def is_valid_user(user):
     )
 
 
+def get_user_directory(app: App) -> UserDirectory:
+    with _directories_lock:
+        if id(app) not in _directories:
+            _directories[id(app)] = UserDirectory(
+                logger=logging.getLogger(__name__), app=app
+            )
+        return _directories[id(app)]
+
+
 def all_users(app: App, include_users=None):
-    users = filter(is_valid_user, app.client.users_list()["members"])
+    users = filter(is_valid_user, get_user_directory(app).members())
     if include_users != None:
+        include_users = set(include_users)
         return [u for u in users if u["name"] in include_users]
-    return users
+    return list(users)
 
 
 def get_private_chat(app: App, user):
-    conv = app.client.conversations_open(users=user["id"])
-    return conv["channel"]["id"]
+    channel_id = get_cached_private_chat(user["id"])
+    if channel_id is None:
+        conv = app.client.conversations_open(users=user["id"])
+        channel_id = conv["channel"]["id"]
+        remember_private_chat(user["id"], channel_id)
+    return channel_id
+
+
+def get_cached_private_chat(user_id):
+    """Return the cached DM channel id for a user, or None on a miss."""
+    global _private_chats
+    if _private_chats is None:
+        with _private_chats_lock:
+            if _private_chats is None:
+                rows = query("SELECT user_id,channel_id FROM dm_channels")
+                _private_chats = {row["user_id"]: row["channel_id"] for row in rows}
+    return _private_chats.get(user_id)
+
+
+def remember_private_chat(user_id, channel_id):
+    if _private_chats is not None:
+        _private_chats[user_id] = channel_id
+    query(
+        "INSERT INTO dm_channels (user_id,channel_id) VALUES (%s,%s) "
+        "ON CONFLICT (user_id) DO UPDATE SET channel_id=EXCLUDED.channel_id",
+        (user_id, channel_id),
+    )
+
+
+def forget_private_chat(user_id):
+    """Invalidate a cached DM channel, e.g. after a channel_not_found error."""
+    if _private_chats is not None:
+        _private_chats.pop(user_id, None)
+    query("DELETE FROM dm_channels WHERE user_id=%s", (user_id,))
+
+
+class StreamingMessage:
+    """A Slack message that is posted once and then edited as text streams in.
+
+    `update()` calls chat.update at most once per `interval` seconds (the
+    method is rate-limited to Tier 3), always with the full text so far.
+    """
+
+    app: App
+
+    def post(self, text):
+        response = self.app.client.chat_postMessage(channel=self.channel, text=text)
+        self.channel = response["channel"]
+        self.ts = response["ts"]
+        self._updated_at = time.monotonic()
+
+    def update(self, text):
+        if time.monotonic() - self._updated_at >= self.interval:
+            self._send(text)
+
+    def finish(self, text):
+        """Publish the final text regardless of the throttle."""
+        self._send(text)
+
+    def _send(self, text):
+        if not text or text == self._sent:
+            return
+        self.app.client.chat_update(channel=self.channel, ts=self.ts, text=text)
+        self._sent = text
+        self._updated_at = time.monotonic()
+
+    def __init__(self, app: App, channel, interval):
+        self.app = app
+        self.channel = channel
+        self.interval = interval
+        self.ts = None
+        self._sent = None
+        self._updated_at = 0.0
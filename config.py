@@ -18,6 +18,7 @@ class Config:
     SLACK_APP_TOKEN = os.environ.get("SLACK_APP_TOKEN")
     SLACK_SIGNING_SECRET = os.environ.get("SLACK_SIGNING_SECRET")
     SLACK_USER_ID = os.environ.get("SLACK_USER_ID")
+    SLACK_API_URL = os.environ.get("SLACK_API_URL", "https://slack.com/api/")
 
     # Open AI Credentials
     OPEN_AI_KEY = os.environ.get("OPEN_AI_KEY")
@@ -27,6 +28,19 @@ class Config:
     LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
     SOCKET_MODE = os.environ.get("SOCKET_MODE", "True").lower() == "true"
     DEV = os.environ.get("DEV", "False").lower() == "true"
+    RUNTIME = os.environ.get("RUNTIME", "sync").lower()  # sync | async
+
+    # Slack Request Handling (fast ack, lazy listeners and retry dedupe)
+    LISTENER_WORKERS = int(os.environ.get("LISTENER_WORKERS", 10))
+    EVENT_DEDUP_MAX_KEYS = int(os.environ.get("EVENT_DEDUP_MAX_KEYS", 10000))
+    EVENT_DEDUP_TTL = float(os.environ.get("EVENT_DEDUP_TTL", 900))
+
+    # Admin Commands
+    ADMIN_POSTS_PAGE_SIZE = int(os.environ.get("ADMIN_POSTS_PAGE_SIZE", 10))
+
+    # Observability
+    METRICS_PORT = int(os.environ.get("METRICS_PORT", 9464))  # 0 disables /metrics
+    TRACING = os.environ.get("TRACING", "False").lower() == "true"
 
     # Database Settings (PostgreSQL)
     DB_HOST = os.environ.get("DB_HOST", "localhost")
@@ -36,9 +50,94 @@ class Config:
     DB_PASSWORD = os.environ.get("DB_PASSWORD", "")
     DB_SSL_MODE = os.environ.get("DB_SSL_MODE", "prefer")
 
+    # Connection Pool Settings (one pool per process)
+    DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 1))
+    DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+    DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+    DB_POOL_RECYCLE = float(os.environ.get("DB_POOL_RECYCLE", 300))
+
+    # CV Entry Ingestion (write-behind buffer)
+    CV_INGEST_BATCH_SIZE = int(os.environ.get("CV_INGEST_BATCH_SIZE", 100))
+    CV_INGEST_MAX_AGE = float(os.environ.get("CV_INGEST_MAX_AGE", 2))
+    CV_INGEST_MAX_QUEUE = int(os.environ.get("CV_INGEST_MAX_QUEUE", 10000))
+    CV_INGEST_RETRY_INTERVAL = float(os.environ.get("CV_INGEST_RETRY_INTERVAL", 5))
+    CV_INGEST_DEDUP_MAX_KEYS = int(os.environ.get("CV_INGEST_DEDUP_MAX_KEYS", 10000))
+    CV_INGEST_DEDUP_TTL = float(os.environ.get("CV_INGEST_DEDUP_TTL", 3600))
+
+    # Scheduled DM Fan-out
+    FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", 8))
+    FANOUT_MAX_RETRIES = int(os.environ.get("FANOUT_MAX_RETRIES", 3))
+
+    # Leader Election (only the leader replica runs scheduled jobs)
+    LEADER_ELECTION = os.environ.get("LEADER_ELECTION", "False").lower() == "true"
+    LEADER_LOCK_ID = int(os.environ.get("LEADER_LOCK_ID", 72346))
+    LEADER_LEASE_TIMEOUT = float(os.environ.get("LEADER_LEASE_TIMEOUT", 30))
+    LEADER_RETRY_INTERVAL = float(os.environ.get("LEADER_RETRY_INTERVAL", 5))
+
+    # Scheduled Post Delivery Ledger
+    DELIVERY_BATCH_SIZE = int(os.environ.get("DELIVERY_BATCH_SIZE", 50))
+    DELIVERY_LEASE_SECONDS = int(os.environ.get("DELIVERY_LEASE_SECONDS", 300))
+    DELIVERY_MAX_ATTEMPTS = int(os.environ.get("DELIVERY_MAX_ATTEMPTS", 3))
+    DELIVERY_RETRY_BACKOFF = float(os.environ.get("DELIVERY_RETRY_BACKOFF", 30))
+
+    # CV Generation Jobs
+    CV_JOB_WORKERS = int(os.environ.get("CV_JOB_WORKERS", 4))
+    CV_JOB_MAX_QUEUED = int(os.environ.get("CV_JOB_MAX_QUEUED", 50))
+    CV_STREAMING = os.environ.get("CV_STREAMING", "False").lower() == "true"
+    CV_STREAM_UPDATE_INTERVAL = float(os.environ.get("CV_STREAM_UPDATE_INTERVAL", 1.5))
+    CV_CACHE_MAX_ENTRIES = int(os.environ.get("CV_CACHE_MAX_ENTRIES", 500))
+    CV_CACHE_TTL = float(os.environ.get("CV_CACHE_TTL", 86400))
+    CV_INCREMENTAL = os.environ.get("CV_INCREMENTAL", "False").lower() == "true"
+    CV_PROMPT_TOKEN_BUDGET = int(os.environ.get("CV_PROMPT_TOKEN_BUDGET", 8000))
+    CV_SUMMARY_FOLD_TOKENS = int(os.environ.get("CV_SUMMARY_FOLD_TOKENS", 2000))
+
+    # CV Entry Compaction and Retention
+    CV_COMPACTION_BATCH_SIZE = int(os.environ.get("CV_COMPACTION_BATCH_SIZE", 1000))
+    CV_MIN_ENTRY_LENGTH = int(os.environ.get("CV_MIN_ENTRY_LENGTH", 10))
+    CV_DIGEST_AFTER_DAYS = int(os.environ.get("CV_DIGEST_AFTER_DAYS", 180))
+    CV_RETENTION_DAYS = int(os.environ.get("CV_RETENTION_DAYS", 0))
+
+    # Prompt Assets (prompts/<name>[.<variant>].txt)
+    CV_PROMPT_VARIANT = os.environ.get("CV_PROMPT_VARIANT", "")
+    PROMPT_RELOAD_INTERVAL = float(os.environ.get("PROMPT_RELOAD_INTERVAL", 10))
+
+    # Business Calendar (working days for scheduler date rules)
+    BUSINESS_CALENDAR_CATEGORIES = tuple(
+        os.environ.get("BUSINESS_CALENDAR_CATEGORIES", "public,de_facto").split(",")
+    )
+    BUSINESS_CALENDAR_CACHE_DIR = os.environ.get(
+        "BUSINESS_CALENDAR_CACHE_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "calendar"),
+    )
+
+    # Google Calendar
+    GOOGLE_CALENDAR_ID = os.environ.get(
+        "GOOGLE_CALENDAR_ID",
+        "hejare.se_jp7m0s7indk7f68rlotj5s9lg0@group.calendar.google.com",
+    )
+    GOOGLE_SERVICE_ACCOUNT_KEY_FILE = os.environ.get(
+        "GOOGLE_SERVICE_ACCOUNT_KEY_FILE", "service_account_key.json"
+    )
+    GOOGLE_CALENDAR_API_ENDPOINT = os.environ.get("GOOGLE_CALENDAR_API_ENDPOINT")
+    GOOGLE_CALENDAR_STORE_DIR = os.environ.get(
+        "GOOGLE_CALENDAR_STORE_DIR",
+        os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), ".cache", "google_calendar"
+        ),
+    )
+
+    # Workspace User Directory
+    USER_DIRECTORY_REFRESH_INTERVAL = float(
+        os.environ.get("USER_DIRECTORY_REFRESH_INTERVAL", 3600)
+    )
+
     @classmethod
     def validate(cls):
-        """Validate that required configuration values are set."""
+        """Validate that required configuration values are set.
+
+        Called by the entrypoints (app.main and async_app.main), not on import,
+        so tools that import config or db only need the settings they use.
+        """
         required_vars = {
             "SLACK_BOT_TOKEN": cls.SLACK_BOT_TOKEN,
             "SLACK_SIGNING_SECRET": cls.SLACK_SIGNING_SECRET,
@@ -47,6 +146,9 @@ class Config:
         if cls.SOCKET_MODE:
             required_vars["SLACK_APP_TOKEN"] = cls.SLACK_APP_TOKEN
 
+        if cls.RUNTIME not in ("sync", "async"):
+            raise ValueError(f"RUNTIME must be 'sync' or 'async', not {cls.RUNTIME!r}")
+
         missing_vars = [var for var, value in required_vars.items() if not value]
 
         if missing_vars:
@@ -56,7 +158,3 @@ class Config:
             )
 
         return True
-
-
-# Validate configuration on import
-Config.validate()
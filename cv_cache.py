@@ -0,0 +1,92 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+def cache_key(model, instructions, input):
+    """Hash everything that determines a generated CV text."""
+    digest = hashlib.sha256()
+    for part in (model, instructions, input):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class CvCache:
+    """LRU cache of generated CV texts keyed on the hash of their prompt.
+
+    Because the key covers the entries, the CV example, the instructions and
+    the model, a changed prompt can never hit a stale text. Entries are still
+    dropped per user when their CV entries change so stale texts do not take
+    up room until they expire after `ttl` seconds or are evicted by size.
+    """
+
+    COUNTERS = ("hits", "misses", "evictions", "invalidations")
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._misses += 1
+                return None
+            user_id, text, stored_at = item
+            if time.monotonic() - stored_at > self.ttl:
+                self._remove(key)
+                self._misses += 1
+                return None
+            self._items.move_to_end(key)
+            self._hits += 1
+            return text
+
+    def put(self, key, user_id, text):
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = (user_id, text, time.monotonic())
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._items) > self.max_entries:
+                self._remove(next(iter(self._items)))
+                self._evictions += 1
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in self._keys_by_user.pop(user_id, ()):
+                self._items.pop(key, None)
+                self._invalidations += 1
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._items),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
+
+    def _remove(self, key):
+        user_id, _, _ = self._items.pop(key)
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+    def __init__(self, max_entries=Config.CV_CACHE_MAX_ENTRIES, ttl=Config.CV_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items = OrderedDict()  # key -> (user_id, text, stored_at)
+        self._keys_by_user = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+
+cv_cache = CvCache()
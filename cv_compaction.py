@@ -0,0 +1,141 @@
+import time
+from datetime import datetime, timedelta
+from logging import Logger
+
+from config import Config
+from cv_cache import cv_cache
+from db import query
+
+DELETE_DUPLICATES = """
+    DELETE FROM cv_entries WHERE id IN (
+        SELECT a.id FROM cv_entries a
+        WHERE NOT a.digest AND EXISTS (
+            SELECT 1 FROM cv_entries b
+            WHERE b.user_id = a.user_id AND b.text = a.text
+              AND b.id < a.id AND NOT b.digest
+        )
+        LIMIT %(limit)s
+    )
+    RETURNING user_id
+"""
+
+DELETE_TRIVIAL = """
+    DELETE FROM cv_entries WHERE id IN (
+        SELECT id FROM cv_entries
+        WHERE NOT digest AND length(btrim(text)) < %(min_length)s
+        LIMIT %(limit)s
+    )
+    RETURNING user_id
+"""
+
+DELETE_EXPIRED = """
+    DELETE FROM cv_entries WHERE id IN (
+        SELECT id FROM cv_entries WHERE timestamp < %(before)s LIMIT %(limit)s
+    )
+    RETURNING user_id
+"""
+
+# In incremental mode only entries already folded into the user's summary are
+# rolled up, and a digest of folded entries is itself folded.
+ROLLUP_CANDIDATE = "(NOT %(incremental)s OR e.folded)"
+
+SELECT_ROLLUP_GROUPS = f"""
+    SELECT e.user_id, date_trunc('month', e.timestamp) AS month
+    FROM cv_entries e
+    WHERE NOT e.digest AND e.timestamp < %(before)s AND {ROLLUP_CANDIDATE}
+    GROUP BY 1, 2
+    LIMIT %(limit)s
+"""
+
+# Replaces a user's month of entries (and any earlier digest of that month)
+# with a single digest row in one statement.
+ROLLUP_GROUP = f"""
+    WITH moved AS (
+        DELETE FROM cv_entries e
+        WHERE e.user_id = %(user_id)s
+          AND e.timestamp >= %(month)s
+          AND e.timestamp < LEAST(%(month)s + interval '1 month', %(before)s)
+          AND {ROLLUP_CANDIDATE}
+        RETURNING e.text, e.timestamp, e.folded
+    )
+    INSERT INTO cv_entries (user_id, text, timestamp, digest, folded)
+    SELECT %(user_id)s, string_agg(text, E'\\n' ORDER BY timestamp), min(timestamp), TRUE,
+        bool_and(folded)
+    FROM moved
+    HAVING count(*) > 0
+"""
+
+
+class CvCompactor:
+    """Keeps cv_entries from growing without bound.
+
+    Each run removes exact duplicates and trivially short messages, rolls
+    entries older than `digest_after_days` into one digest row per user and
+    month, and deletes everything older than `retention_days` (0 keeps all).
+    Work is done in batches of `batch_size` rows, each in its own short
+    transaction, with a pause in between so no lock is held for long.
+    """
+
+    logger: Logger
+
+    def run(self):
+        started = time.monotonic()
+        now = datetime.now()
+        counts = {
+            "duplicates": self._delete_in_batches(DELETE_DUPLICATES, {}),
+            "trivial": self._delete_in_batches(
+                DELETE_TRIVIAL, {"min_length": self.min_length}
+            ),
+            "rolled_up": self._roll_up(now - timedelta(days=self.digest_after_days)),
+            "expired": 0,
+        }
+        if self.retention_days > 0:
+            counts["expired"] = self._delete_in_batches(
+                DELETE_EXPIRED, {"before": now - timedelta(days=self.retention_days)}
+            )
+        self.logger.info(
+            f"CV entry compaction finished in {time.monotonic() - started:.1f}s: {counts}"
+        )
+        return counts
+
+    def _delete_in_batches(self, sql, parameters):
+        total = 0
+        while True:
+            rows = query(sql, {**parameters, "limit": self.batch_size})
+            for user_id in {row["user_id"] for row in rows}:
+                cv_cache.invalidate_user(user_id)
+            total += len(rows)
+            if len(rows) < self.batch_size:
+                return total
+            time.sleep(self.pause)
+
+    def _roll_up(self, before):
+        parameters = {"before": before, "incremental": Config.CV_INCREMENTAL}
+        groups = 0
+        while True:
+            batch = query(
+                SELECT_ROLLUP_GROUPS, {**parameters, "limit": self.batch_size}
+            )
+            for group in batch:
+                query(ROLLUP_GROUP, {**parameters, **group})
+                cv_cache.invalidate_user(group["user_id"])
+            groups += len(batch)
+            if len(batch) < self.batch_size:
+                return groups
+            time.sleep(self.pause)
+
+    def __init__(
+        self,
+        logger: Logger,
+        batch_size=Config.CV_COMPACTION_BATCH_SIZE,
+        min_length=Config.CV_MIN_ENTRY_LENGTH,
+        digest_after_days=Config.CV_DIGEST_AFTER_DAYS,
+        retention_days=Config.CV_RETENTION_DAYS,
+        pause=0.1,
+    ):
+        self.logger = logger
+        self.batch_size = batch_size
+        self.min_length = min_length
+        self.digest_after_days = digest_after_days
+        self.retention_days = retention_days
+        self.pause = pause
@@ -0,0 +1,324 @@
+import threading
+
+import async_db
+from config import Config
+from cv_cache import cache_key, cv_cache
+from db import query
+from instrumentation import openai_calls
+from prompt_templates import prompts
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+MODEL = "gpt-5-nano"
+
+SELECT_CV_ENTRIES = (
+    "SELECT id,user_id,text,timestamp FROM cv_entries WHERE user_id=%s "
+    "ORDER BY timestamp,id"
+)
+
+# Entries are marked `folded` in the same statement that stores the summary
+# they went into. An id watermark is not enough: a concurrent flush can commit
+# a lower id after a higher one was folded, and that entry would be skipped.
+SELECT_UNFOLDED_ENTRIES = (
+    "SELECT id,user_id,text,timestamp FROM cv_entries WHERE user_id=%s "
+    "AND NOT folded ORDER BY timestamp,id"
+)
+
+SELECT_SUMMARY = "SELECT summary,updated_at FROM cv_summaries WHERE user_id=%s"
+
+# Stores the summary only if it is still the one the fold started from
+# (`updated_at` is its version), and then marks the folded entries.
+SAVE_FOLD = """
+    WITH saved AS (
+        INSERT INTO cv_summaries (user_id,summary,last_entry_id,updated_at)
+        VALUES (%s,%s,%s,clock_timestamp()) ON CONFLICT (user_id) DO UPDATE SET
+            summary=EXCLUDED.summary,
+            last_entry_id=GREATEST(cv_summaries.last_entry_id,EXCLUDED.last_entry_id),
+            updated_at=EXCLUDED.updated_at
+        WHERE cv_summaries.updated_at IS NOT DISTINCT FROM %s
+        RETURNING user_id
+    )
+    UPDATE cv_entries SET folded=TRUE
+    WHERE id=ANY(%s) AND EXISTS (SELECT 1 FROM saved)
+    RETURNING id
+"""
+
+# Entries (and digests) folded into a deleted summary count as new again
+DELETE_SUMMARY = """
+    WITH deleted AS (DELETE FROM cv_summaries WHERE user_id=%s RETURNING user_id)
+    UPDATE cv_entries SET folded=FALSE WHERE user_id=%s AND folded
+"""
+
+
+def get_client():
+    """Return the OpenAI client, creating it on first use.
+
+    The openai package takes longer to import than the rest of the app, so
+    it is only loaded once a CV is actually generated.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+
+                _client = OpenAI(api_key=Config.OPEN_AI_KEY)
+    return _client
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                from openai import AsyncOpenAI
+
+                _async_client = AsyncOpenAI(api_key=Config.OPEN_AI_KEY)
+    return _async_client
+
+
+def get_cv_entries(user_id):
+    return query(SELECT_CV_ENTRIES, (user_id,))
+
+
+def get_unfolded_entries(user_id):
+    return query(SELECT_UNFOLDED_ENTRIES, (user_id,))
+
+
+def format_entries(entries):
+    return "\n-----------\n".join(
+        [f"Text: {entry['text']}\nTimestamp: {entry['timestamp']}" for entry in entries]
+    )
+
+
+def build_input(first_name, entries, summary=None):
+    if not summary:
+        return (
+            f"Create a CV post for {first_name} based on the following entries:\n\n"
+            f"{format_entries(entries)}"
+        )
+    text = (
+        f"Create a CV post for {first_name} based on the following summary of their work"
+    )
+    if not entries:
+        return f"{text}:\n\n{summary}"
+    return (
+        f"{text} and the entries added since it was written:\n\n"
+        f"Summary:\n{summary}\n\nNew entries:\n{format_entries(entries)}"
+    )
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English and Swedish)."""
+    return len(text) // 4 + 1
+
+
+def get_summary(user_id):
+    return _summary_row(query(SELECT_SUMMARY, (user_id,)))
+
+
+def delete_summary(user_id):
+    query(DELETE_SUMMARY, (user_id, user_id))
+
+
+def _summary_row(rows):
+    """Return (summary, version); the version is None before the first fold."""
+    if not rows:
+        return "", None
+    return rows[0]["summary"], rows[0]["updated_at"]
+
+
+def save_fold_parameters(user_id, summary, version, entries):
+    ids = [entry["id"] for entry in entries]
+    return (user_id, summary, max(ids), version, ids)
+
+
+def chunk_entries(entries, budget):
+    """Split entries into chunks of at most `budget` estimated tokens.
+
+    A single entry longer than the budget is truncated to fit on its own.
+    """
+    chunks, chunk, used = [], [], 0
+    for entry in entries:
+        tokens = estimate_tokens(format_entries([entry]))
+        if tokens > budget:
+            entry = {**entry, "text": entry["text"][: budget * 4 - 100]}
+            tokens = budget
+        if chunk and used + tokens > budget:
+            chunks.append(chunk)
+            chunk, used = [], 0
+        chunk.append(entry)
+        used += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def fold_chunks(summary, entries):
+    return chunk_entries(
+        entries, max(Config.CV_PROMPT_TOKEN_BUDGET - estimate_tokens(summary), 500)
+    )
+
+
+def build_fold_request(summary, chunk):
+    return {
+        "model": MODEL,
+        "instructions": prompts.get(
+            "cv_summary_instructions", Config.CV_PROMPT_VARIANT, MODEL
+        ),
+        "input": (
+            f"Existing summary:\n{summary or '(none yet)'}\n\n"
+            f"New notes:\n{format_entries(chunk)}"
+        ),
+    }
+
+
+def fold_entries(user_id, summary, version, entries):
+    """Merge entries into the user's rolling summary and store it.
+
+    If another fold stored a newer summary meanwhile, this one is only used
+    for the current CV; its entries stay unfolded and are folded next time.
+    """
+    for chunk in fold_chunks(summary, entries):
+        with openai_calls.track("cv_summary"):
+            response = get_client().responses.create(
+                **build_fold_request(summary, chunk)
+            )
+        summary = response.output_text
+
+    query(SAVE_FOLD, save_fold_parameters(user_id, summary, version, entries))
+    return summary
+
+
+def build_incremental_input(user_id, first_name):
+    """Build the CV input from the rolling summary and the entries added since.
+
+    New entries are sent as they are while they fit in CV_SUMMARY_FOLD_TOKENS;
+    beyond that they are folded into the summary first, so the prompt stays
+    roughly the same size however long the history grows.
+    """
+    summary, version = get_summary(user_id)
+    entries = get_unfolded_entries(user_id)
+    if needs_fold(entries):
+        summary = fold_entries(user_id, summary, version, entries)
+        entries = []
+    return build_input(first_name, entries, summary=summary)
+
+
+def needs_fold(entries):
+    return bool(entries) and (
+        estimate_tokens(format_entries(entries)) > Config.CV_SUMMARY_FOLD_TOKENS
+    )
+
+
+def build_instructions():
+    return prompts.get("cv_instructions", Config.CV_PROMPT_VARIANT, MODEL)
+
+
+def build_request(input):
+    return {"model": MODEL, "input": input, "instructions": build_instructions()}
+
+
+def generate_cv(user_id, first_name, on_text=None):
+    """Generate a CV post from all of a user's CV entries.
+
+    With `on_text`, the response is streamed and `on_text` is called with the
+    text generated so far after every delta. Texts are cached on a hash of the
+    full prompt, so an unchanged entry set is answered without an API call.
+    """
+    if Config.CV_INCREMENTAL:
+        input = build_incremental_input(user_id, first_name)
+    else:
+        input = build_input(first_name, get_cv_entries(user_id))
+    request = build_request(input)
+    key = cache_key(request["model"], request["instructions"], request["input"])
+    text = cv_cache.get(key)
+    if text is None:
+        text = _create(request, on_text)
+        cv_cache.put(key, user_id, text)
+    elif on_text is not None:
+        on_text(text)
+    return text
+
+
+def _create(request, on_text):
+    if on_text is None:
+        with openai_calls.track("cv"):
+            return get_client().responses.create(**request).output_text
+
+    parts = []
+    with openai_calls.track("cv_stream"):
+        for event in get_client().responses.create(**request, stream=True):
+            if event.type == "response.output_text.delta":
+                parts.append(event.delta)
+                on_text("".join(parts))
+            elif event.type == "response.failed":
+                raise RuntimeError(f"CV generation failed: {event.response.error}")
+            elif event.type == "error":
+                raise RuntimeError(f"CV generation failed: {event.message}")
+    return "".join(parts)
+
+
+# ============================================================================
+# Async runtime
+#
+# The same flow on asyncpg and the async OpenAI client, sharing the SQL,
+# prompt building and cache with the functions above.
+# ============================================================================
+
+
+async def get_cv_entries_async(user_id):
+    return await async_db.query(SELECT_CV_ENTRIES, (user_id,))
+
+
+async def get_unfolded_entries_async(user_id):
+    return await async_db.query(SELECT_UNFOLDED_ENTRIES, (user_id,))
+
+
+async def get_summary_async(user_id):
+    return _summary_row(await async_db.query(SELECT_SUMMARY, (user_id,)))
+
+
+async def delete_summary_async(user_id):
+    await async_db.query(DELETE_SUMMARY, (user_id, user_id))
+
+
+async def fold_entries_async(user_id, summary, version, entries):
+    for chunk in fold_chunks(summary, entries):
+        with openai_calls.track("cv_summary"):
+            response = await get_async_client().responses.create(
+                **build_fold_request(summary, chunk)
+            )
+        summary = response.output_text
+
+    await async_db.query(
+        SAVE_FOLD, save_fold_parameters(user_id, summary, version, entries)
+    )
+    return summary
+
+
+async def build_incremental_input_async(user_id, first_name):
+    summary, version = await get_summary_async(user_id)
+    entries = await get_unfolded_entries_async(user_id)
+    if needs_fold(entries):
+        summary = await fold_entries_async(user_id, summary, version, entries)
+        entries = []
+    return build_input(first_name, entries, summary=summary)
+
+
+async def generate_cv_async(user_id, first_name):
+    """Async counterpart of generate_cv (without streaming)."""
+    if Config.CV_INCREMENTAL:
+        input = await build_incremental_input_async(user_id, first_name)
+    else:
+        input = build_input(first_name, await get_cv_entries_async(user_id))
+    request = build_request(input)
+    key = cache_key(request["model"], request["instructions"], request["input"])
+    text = cv_cache.get(key)
+    if text is None:
+        with openai_calls.track("cv"):
+            text = (await get_async_client().responses.create(**request)).output_text
+        cv_cache.put(key, user_id, text)
+    return text
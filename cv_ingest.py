@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import deque
+from logging import Logger
+
+from config import Config
+from db import insert_many
+from dedup import RecentKeys
+
+
+def message_key(event):
+    """Identify a Slack message across event deliveries and retries."""
+    return event.get("client_msg_id") or f"{event.get('channel')}:{event.get('ts')}"
+
+
+class CvEntryBuffer:
+    """Write-behind buffer for cv_entries rows.
+
+    Message handlers call `add()`, which only appends to an in-memory queue and
+    never touches the database. A background thread flushes the queue with
+    multi-row inserts once `batch_size` entries are waiting or the oldest one
+    is `max_age` seconds old. The queue holds at most `max_queue` entries;
+    anything beyond that is dropped and counted so a slow database can neither
+    block Slack event handling nor grow memory without limit.
+
+    Entries carry an event key (see `message_key`) so the same Slack message
+    is stored once: keys seen in the last `dedup_ttl` seconds are skipped in
+    memory, and the unique index on cv_entries.event_key drops duplicates
+    that reach the database from another replica or after a restart.
+    """
+
+    logger: Logger
+
+    COUNTERS = (
+        "enqueued",
+        "flushed",
+        "flushes",
+        "dropped",
+        "failed_flushes",
+        "duplicates_in_memory",
+        "duplicates_in_database",
+    )
+
+    INSERT_QUERY = (
+        "INSERT INTO cv_entries (user_id,text,timestamp,event_key) VALUES %s "
+        "ON CONFLICT (event_key) DO NOTHING RETURNING id"
+    )
+
+    def add(self, user_id, text, timestamp, event_key=None):
+        """Queue an entry for insertion. Returns False if it was dropped.
+
+        An entry whose `event_key` was already added is skipped (and counted)
+        but not reported as dropped. A dropped entry's key is forgotten, so
+        Slack's retry of the event can still be stored.
+        """
+        if event_key is not None and not self._recent_keys.add(event_key):
+            return True
+        with self._cond:
+            if len(self._entries) >= self.max_queue:
+                self._dropped += 1
+                self._forget([(user_id, text, timestamp, event_key)])
+                return False
+            if not self._entries:
+                self._oldest_at = time.monotonic()
+            self._entries.append((user_id, text, timestamp, event_key))
+            self._enqueued += 1
+            if len(self._entries) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="cv-entry-buffer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Flush everything that is queued and stop the background thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def metrics(self):
+        with self._cond:
+            return {
+                "queued": len(self._entries),
+                "enqueued": self._enqueued,
+                "flushed": self._flushed,
+                "flushes": self._flushes,
+                "dropped": self._dropped,
+                "failed_flushes": self._failed_flushes,
+                "duplicates_in_memory": self._recent_keys.metrics()["duplicates"],
+                "duplicates_in_database": self._duplicates,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and not self._is_due():
+                    self._cond.wait(self._time_until_due())
+                if not self._entries:
+                    return
+                batch = [
+                    self._entries.popleft()
+                    for _ in range(min(self.batch_size, len(self._entries)))
+                ]
+                self._oldest_at = time.monotonic()
+                stopping = self._stopping
+
+            if not self._write(batch):
+                if stopping:
+                    with self._cond:
+                        self._dropped += len(batch)
+                        self._forget(batch)
+                    self.logger.error(
+                        f"Dropped {len(batch)} CV entries that could not be flushed on shutdown"
+                    )
+                    continue
+                self._requeue(batch)
+                time.sleep(self.retry_interval)
+
+    def _is_due(self):
+        if len(self._entries) >= self.batch_size:
+            return True
+        return bool(self._entries) and self._time_until_due() <= 0
+
+    def _time_until_due(self):
+        if not self._entries:
+            return None
+        return self.max_age - (time.monotonic() - self._oldest_at)
+
+    def _write(self, batch):
+        try:
+            inserted = len(insert_many(self.INSERT_QUERY, batch, fetch=True))
+        except Exception as e:
+            with self._cond:
+                self._failed_flushes += 1
+            self.logger.error(f"Error flushing {len(batch)} CV entries: {e}")
+            return False
+        with self._cond:
+            self._flushed += inserted
+            self._duplicates += len(batch) - inserted
+            self._flushes += 1
+        return True
+
+    def _requeue(self, batch):
+        """Put a failed batch back at the front, dropping what no longer fits."""
+        with self._cond:
+            room = self.max_queue - len(self._entries)
+            keep = batch[:room] if room > 0 else []
+            self._dropped += len(batch) - len(keep)
+            self._forget(batch[len(keep) :])
+            self._entries.extendleft(reversed(keep))
+            self._oldest_at = time.monotonic()
+
+    def _forget(self, entries):
+        """Forget the event keys of dropped entries."""
+        for _, _, _, event_key in entries:
+            if event_key is not None:
+                self._recent_keys.discard(event_key)
+
+    def __init__(
+        self,
+        logger: Logger,
+        batch_size=Config.CV_INGEST_BATCH_SIZE,
+        max_age=Config.CV_INGEST_MAX_AGE,
+        max_queue=Config.CV_INGEST_MAX_QUEUE,
+        retry_interval=Config.CV_INGEST_RETRY_INTERVAL,
+        dedup_max_keys=Config.CV_INGEST_DEDUP_MAX_KEYS,
+        dedup_ttl=Config.CV_INGEST_DEDUP_TTL,
+    ):
+        self.logger = logger
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.max_queue = max_queue
+        self.retry_interval = retry_interval
+
+        self._entries = deque()
+        self._oldest_at = time.monotonic()
+        self._enqueued = 0
+        self._flushed = 0
+        self._flushes = 0
+        self._dropped = 0
+        self._failed_flushes = 0
+        self._duplicates = 0
+        self._recent_keys = RecentKeys(max_size=dedup_max_keys, ttl=dedup_ttl)
+        self._stopping = False
+        self._thread = None
+        self._cond = threading.Condition()
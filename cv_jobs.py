@@ -0,0 +1,360 @@
+import asyncio
+import threading
+import time
+import uuid
+from datetime import datetime
+from enum import Enum
+from logging import Logger
+from typing import TYPE_CHECKING
+
+from slack_bolt import App
+from slack_sdk.webhook import WebhookClient
+
+import async_db
+from chat_helper import StreamingMessage, get_private_chat
+from config import Config
+from cv_generator import generate_cv, generate_cv_async
+from db import query
+from instrumentation import ContextThreadPoolExecutor
+
+if TYPE_CHECKING:  # aiohttp-based; only the async runtime loads it
+    from slack_bolt.async_app import AsyncApp
+
+FAILED_TEXT = "Något gick fel när din CV post skulle genereras."
+
+UPDATE_STATUS = "UPDATE cv_jobs SET status=%s{columns} WHERE job_id=%s"
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class CvJobQueue:
+    """Runs `/cv generate` requests on a dedicated worker pool.
+
+    Each job is recorded in the cv_jobs table as it moves from queued to
+    running to done or failed. At most `workers` jobs run at once and at most
+    `max_queued` wait behind them; a user who already has a job waiting or
+    running gets that job back instead of a new one. The result is posted
+    through the command's response_url, or as a DM when there is none. In
+    streaming mode a placeholder DM is posted instead and edited as the text
+    arrives.
+    """
+
+    logger: Logger
+    app: App
+
+    COUNTERS = ("done", "failed", "rejected")
+
+    def submit(self, user_id, response_url=None):
+        """Queue a CV generation job and return its id, or None if the queue is full."""
+        with self._lock:
+            if user_id in self._active_by_user:
+                return self._active_by_user[user_id]
+            if self._queued >= self.max_queued:
+                self._rejected += 1
+                return None
+            job_id = str(uuid.uuid4())
+            self._active_by_user[user_id] = job_id
+            self._queued += 1
+
+        try:
+            query(
+                "INSERT INTO cv_jobs (job_id,user_id,status,created_at) VALUES (%s,%s,%s,%s)",
+                (job_id, user_id, JobStatus.QUEUED.value, datetime.now()),
+            )
+        except Exception:
+            with self._lock:
+                self._active_by_user.pop(user_id, None)
+                self._queued -= 1
+            raise
+        self._executor.submit(
+            self._run, job_id, user_id, response_url, time.monotonic()
+        )
+        return job_id
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queued,
+                "running": self._running,
+                "done": self._done,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "wait_seconds_total": self._wait_total,
+                "wait_seconds_max": self._wait_max,
+                "run_seconds_total": self._run_total,
+                "run_seconds_max": self._run_max,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job_id, user_id, response_url, submitted_at):
+        started_at = time.monotonic()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._wait_total += started_at - submitted_at
+            self._wait_max = max(self._wait_max, started_at - submitted_at)
+
+        status, error = JobStatus.DONE, None
+        message = None
+        try:
+            self._set_status(job_id, JobStatus.RUNNING, started_at=datetime.now())
+            user_info = self.app.client.users_info(user=user_id)
+            first_name = user_info["user"]["profile"]["first_name"]
+            if self.streaming:
+                message = self._placeholder(user_id)
+                message.finish(
+                    generate_cv(user_id, first_name, on_text=message.update)
+                )
+            else:
+                self._post_result(
+                    user_id, response_url, generate_cv(user_id, first_name)
+                )
+        except Exception as e:
+            status, error = JobStatus.FAILED, str(e)
+            self.logger.error(f"CV job {job_id} for {user_id} failed: {e}")
+            if not self._fail_placeholder(user_id, message):
+                self._post_result(user_id, response_url, FAILED_TEXT)
+        finally:
+            run_time = time.monotonic() - started_at
+            with self._lock:
+                self._running -= 1
+                self._active_by_user.pop(user_id, None)
+                self._run_total += run_time
+                self._run_max = max(self._run_max, run_time)
+                if status == JobStatus.DONE:
+                    self._done += 1
+                else:
+                    self._failed += 1
+            self.logger.info(f"CV job {job_id} {status.value} in {run_time:.1f}s")
+            try:
+                self._set_status(
+                    job_id, status, error=error, finished_at=datetime.now()
+                )
+            except Exception as e:
+                self.logger.error(f"Error recording CV job {job_id}: {e}")
+
+    def _placeholder(self, user_id):
+        message = StreamingMessage(
+            self.app,
+            channel=get_private_chat(self.app, {"id": user_id}),
+            interval=Config.CV_STREAM_UPDATE_INTERVAL,
+        )
+        message.post("Genererar din CV post... :hourglass_flowing_sand:")
+        return message
+
+    def _fail_placeholder(self, user_id, message):
+        """Replace a posted placeholder or partial text with FAILED_TEXT.
+
+        Returns False if there is no placeholder or it could not be edited,
+        in which case the failure is posted as a new message instead.
+        """
+        if message is None or message.ts is None:
+            return False
+        try:
+            message.finish(FAILED_TEXT)
+            return True
+        except Exception as e:
+            self.logger.error(f"Error updating CV placeholder for {user_id}: {e}")
+            return False
+
+    def _post_result(self, user_id, response_url, text):
+        try:
+            if response_url:
+                response = WebhookClient(response_url).send(
+                    text=text, response_type="in_channel"
+                )
+                if response.status_code == 200:
+                    return
+            self.app.client.chat_postMessage(
+                channel=get_private_chat(self.app, {"id": user_id}), text=text
+            )
+        except Exception as e:
+            self.logger.error(f"Error posting CV result to {user_id}: {e}")
+
+    def _set_status(self, job_id, status, **columns):
+        query(*_status_update(job_id, status, columns))
+
+    def __init__(
+        self,
+        logger: Logger,
+        app: App,
+        workers=Config.CV_JOB_WORKERS,
+        max_queued=Config.CV_JOB_MAX_QUEUED,
+        streaming=Config.CV_STREAMING,
+    ):
+        self.logger = logger
+        self.app = app
+        self.workers = workers
+        self.max_queued = max_queued
+        self.streaming = streaming
+        self._executor = ContextThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="cv-job"
+        )
+        self._active_by_user = {}
+        self._queued = 0
+        self._running = 0
+        self._done = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+        self._run_max = 0.0
+        self._lock = threading.Lock()
+
+
+class AsyncCvJobQueue:
+    """CvJobQueue for the async runtime.
+
+    Jobs are asyncio tasks on the serving event loop instead of threads; a
+    semaphore keeps at most `workers` of them generating at once, with the
+    same queue limit, per-user dedupe, cv_jobs bookkeeping and counters.
+    Results are not streamed.
+    """
+
+    logger: Logger
+    app: "AsyncApp"
+
+    COUNTERS = CvJobQueue.COUNTERS
+
+    async def submit(self, user_id, response_url=None):
+        """Queue a CV generation job and return its id, or None if the queue is full."""
+        if user_id in self._active_by_user:
+            return self._active_by_user[user_id]
+        if self._queued >= self.max_queued:
+            self._rejected += 1
+            return None
+        job_id = str(uuid.uuid4())
+        self._active_by_user[user_id] = job_id
+        self._queued += 1
+
+        try:
+            await async_db.query(
+                "INSERT INTO cv_jobs (job_id,user_id,status,created_at) VALUES (%s,%s,%s,%s)",
+                (job_id, user_id, JobStatus.QUEUED.value, datetime.now()),
+            )
+        except Exception:
+            self._active_by_user.pop(user_id, None)
+            self._queued -= 1
+            raise
+        task = asyncio.create_task(
+            self._run(job_id, user_id, response_url, time.monotonic())
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job_id
+
+    def metrics(self):
+        return {
+            "queue_depth": self._queued,
+            "running": self._running,
+            "done": self._done,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "wait_seconds_total": self._wait_total,
+            "wait_seconds_max": self._wait_max,
+            "run_seconds_total": self._run_total,
+            "run_seconds_max": self._run_max,
+        }
+
+    async def shutdown(self):
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, job_id, user_id, response_url, submitted_at):
+        async with self._semaphore:
+            started_at = time.monotonic()
+            self._queued -= 1
+            self._running += 1
+            self._wait_total += started_at - submitted_at
+            self._wait_max = max(self._wait_max, started_at - submitted_at)
+
+            status, error = JobStatus.DONE, None
+            try:
+                await self._set_status(
+                    job_id, JobStatus.RUNNING, started_at=datetime.now()
+                )
+                user_info = await self.app.client.users_info(user=user_id)
+                first_name = user_info["user"]["profile"]["first_name"]
+                await self._post_result(
+                    user_id, response_url, await generate_cv_async(user_id, first_name)
+                )
+            except Exception as e:
+                status, error = JobStatus.FAILED, str(e)
+                self.logger.error(f"CV job {job_id} for {user_id} failed: {e}")
+                await self._post_result(user_id, response_url, FAILED_TEXT)
+            finally:
+                run_time = time.monotonic() - started_at
+                self._running -= 1
+                self._active_by_user.pop(user_id, None)
+                self._run_total += run_time
+                self._run_max = max(self._run_max, run_time)
+                if status == JobStatus.DONE:
+                    self._done += 1
+                else:
+                    self._failed += 1
+                self.logger.info(f"CV job {job_id} {status.value} in {run_time:.1f}s")
+                try:
+                    await self._set_status(
+                        job_id, status, error=error, finished_at=datetime.now()
+                    )
+                except Exception as e:
+                    self.logger.error(f"Error recording CV job {job_id}: {e}")
+
+    async def _post_result(self, user_id, response_url, text):
+        from slack_sdk.webhook.async_client import AsyncWebhookClient
+
+        try:
+            if response_url:
+                response = await AsyncWebhookClient(response_url).send(
+                    text=text, response_type="in_channel"
+                )
+                if response.status_code == 200:
+                    return
+            conv = await self.app.client.conversations_open(users=user_id)
+            await self.app.client.chat_postMessage(
+                channel=conv["channel"]["id"], text=text
+            )
+        except Exception as e:
+            self.logger.error(f"Error posting CV result to {user_id}: {e}")
+
+    async def _set_status(self, job_id, status, **columns):
+        await async_db.query(*_status_update(job_id, status, columns))
+
+    def __init__(
+        self,
+        logger: Logger,
+        app: "AsyncApp",
+        workers=Config.CV_JOB_WORKERS,
+        max_queued=Config.CV_JOB_MAX_QUEUED,
+    ):
+        self.logger = logger
+        self.app = app
+        self.workers = workers
+        self.max_queued = max_queued
+        self._semaphore = asyncio.Semaphore(workers)
+        self._tasks = set()
+        self._active_by_user = {}
+        self._queued = 0
+        self._running = 0
+        self._done = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+        self._run_max = 0.0
+
+
+def _status_update(job_id, status, columns):
+    assignments = "".join(f",{column}=%s" for column in columns)
+    return (
+        UPDATE_STATUS.format(columns=assignments),
+        (status.value, *columns.values(), job_id),
+    )
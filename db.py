@@ -1,42 +1,193 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 
 from config import Config
+from instrumentation import db_queries, sql_labels
+from migrations import migrate
 
 
-def setup_db():
-    """Initialize database schema."""
-    conn = get_db_connection()
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became available in time."""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of PostgreSQL connections.
+
+    Connections are handed out with `connection()` and returned when the
+    block exits. Callers wait up to `timeout` seconds when all `max_size`
+    connections are in use, and connections that have been idle for longer
+    than `recycle` seconds are closed and replaced on the next checkout.
+    """
+
+    COUNTERS = ("checkouts",)
+
+    def __init__(self, min_size, max_size, timeout, recycle):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pid = os.getpid()
+
+        self._idle = []  # (connection, returned_at)
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._cond = threading.Condition()
+
+    def warm(self):
+        """Open connections until `min_size` of them are available."""
+        with self._cond:
+            while self._size < self.min_size:
+                self._idle.append((get_db_connection(), time.monotonic()))
+                self._size += 1
+
+    def metrics(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+            }
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection, committing on success and rolling back on error."""
+        conn = self._checkout()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            self._rollback(conn)
+            raise
+        finally:
+            self._checkin(conn)
+
+    def close(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                _close_quietly(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout}s "
+                            f"({self._in_use}/{self.max_size} in use)"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+            conn = None
+            while self._idle:
+                candidate, returned_at = self._idle.pop()
+                if candidate.closed or time.monotonic() - returned_at > self.recycle:
+                    _close_quietly(candidate)
+                    self._size -= 1
+                    continue
+                conn = candidate
+                break
+
+            if conn is None:
+                # Reserve the slot before releasing the lock to connect.
+                self._size += 1
+
+            self._in_use += 1
+            self._checkouts += 1
+
+        if conn is None:
+            try:
+                conn = get_db_connection()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def _checkin(self, conn):
+        with self._cond:
+            self._in_use -= 1
+            if conn.closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _rollback(self, conn):
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            _close_quietly(conn)
+
+
+def _close_quietly(conn):
     try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS cv_entries (
-                id SERIAL PRIMARY KEY,
-                user_id VARCHAR(255) NOT NULL,
-                text TEXT NOT NULL,
-                timestamp TIMESTAMP NOT NULL
-            )
-        """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS scheduled_posts (
-                id SERIAL PRIMARY KEY,
-                post_id VARCHAR(255) NOT NULL,
-                type VARCHAR(255) NOT NULL,
-                text TEXT NOT NULL,
-                added_by VARCHAR(255) NOT NULL
-            )
-        """
-        )
-        conn.commit()
-    finally:
         conn.close()
+    except psycopg2.Error:
+        pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Pools inherited from a parent process. Their sockets belong to the parent, so
+# they are kept referenced here and never closed (closing would terminate the
+# parent's sessions).
+_inherited_pools = []
+
+
+def get_pool():
+    """Return this process' connection pool, creating a fresh one after fork."""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+
+    with _pool_lock:
+        if _pool is not None and _pool.pid != os.getpid():
+            _inherited_pools.append(_pool)
+            _pool = None
+        if _pool is None:
+            _pool = ConnectionPool(
+                min_size=Config.DB_POOL_MIN_SIZE,
+                max_size=Config.DB_POOL_MAX_SIZE,
+                timeout=Config.DB_POOL_TIMEOUT,
+                recycle=Config.DB_POOL_RECYCLE,
+            )
+        return _pool
 
 
-def get_db_connection():
-    """Get a PostgreSQL database connection."""
+def pool_metrics():
+    """Return in-use, waiting and total checkout counters for this process' pool."""
+    return get_pool().metrics()
+
+
+def setup_db():
+    """Bring the database schema up to date and warm the connection pool."""
+    pool = get_pool()
+    with pool.connection() as conn:
+        migrate(conn)
+    pool.warm()
+
+
+def get_db_connection(**options):
+    """Get a PostgreSQL database connection; `options` are extra libpq parameters."""
     return psycopg2.connect(
         host=Config.DB_HOST,
         port=Config.DB_PORT,
@@ -44,15 +195,28 @@ def get_db_connection():
         user=Config.DB_USERNAME,
         password=Config.DB_PASSWORD,
         sslmode=Config.DB_SSL_MODE,
+        **options,
     )
 
 
 def query(query_text, parameters=()):
     """Execute a database query and return results."""
-    with get_db_connection() as conn:
+    with db_queries.track(*sql_labels(query_text)), get_pool().connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(query_text, parameters)
-            if query_text.strip().upper().startswith("SELECT"):
+            if cur.description is not None:  # SELECT or ... RETURNING
                 return cur.fetchall()
             else:
                 return None
+
+
+def insert_many(query_text, rows, page_size=500, fetch=False):
+    """Insert many rows with a single multi-row statement per page.
+
+    With `fetch`, returns the rows of the statement's RETURNING clause.
+    """
+    with db_queries.track(*sql_labels(query_text)), get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            return execute_values(
+                cur, query_text, rows, page_size=page_size, fetch=fetch
+            )
@@ -0,0 +1,49 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class RecentKeys:
+    """Bounded set of recently seen keys, for dropping duplicate deliveries.
+
+    `add()` records a key and reports whether it was new. A key is forgotten
+    after `ttl` seconds or when more than `max_size` newer keys have been
+    added, so memory stays bounded however many deliveries arrive.
+    """
+
+    COUNTERS = ("duplicates",)
+
+    def add(self, key):
+        """Record `key`; return False if it was already seen within the TTL."""
+        now = time.monotonic()
+        with self._lock:
+            seen_at = self._keys.get(key)
+            if seen_at is not None and now - seen_at <= self.ttl:
+                self._duplicates += 1
+                return False
+            self._keys[key] = now
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+            while self._keys:
+                oldest = next(iter(self._keys))
+                if now - self._keys[oldest] <= self.ttl:
+                    break
+                del self._keys[oldest]
+            return True
+
+    def discard(self, key):
+        """Forget `key`, so a later delivery of it is accepted again."""
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def metrics(self):
+        with self._lock:
+            return {"keys": len(self._keys), "duplicates": self._duplicates}
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._keys = OrderedDict()
+        self._duplicates = 0
+        self._lock = threading.Lock()
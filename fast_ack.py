@@ -0,0 +1,144 @@
+"""
+Support for acknowledging Slack requests quickly.
+
+Handlers that do slow work are split into an ack function that only calls
+ack() and lazy listeners that do the work afterwards on a shared executor
+(asyncio tasks in the async runtime). Events API retries that Slack sends
+when an ack was late are dropped by event_id, and the time every request
+took to be acknowledged is recorded per handler in metrics.ack_latency.
+"""
+
+import logging
+import time
+
+from slack_bolt import App, BoltResponse
+from slack_bolt.middleware.authorization import SingleTeamAuthorization
+from slack_bolt.logger.messages import warning_client_prioritized_and_token_skipped
+
+from config import Config
+from dedup import RecentKeys
+from instrumentation import ContextThreadPoolExecutor, span
+from metrics import ack_latency
+from slack_client import InstrumentedWebClient, client_settings
+
+# Slack retries a request it did not see acknowledged within this many seconds
+SLACK_ACK_TIMEOUT = 3
+
+logger = logging.getLogger(__name__)
+
+# Runs ack functions and lazy listeners for every handler of the sync app
+listener_executor = ContextThreadPoolExecutor(
+    max_workers=Config.LISTENER_WORKERS, thread_name_prefix="listener"
+)
+
+event_ids = RecentKeys(max_size=Config.EVENT_DEDUP_MAX_KEYS, ttl=Config.EVENT_DEDUP_TTL)
+
+
+class ClientTokenWarningFilter(logging.Filter):
+    """Drops Bolt's warning that `token` is unused because `client` was given.
+
+    Bolt falls back to SLACK_BOT_TOKEN from the environment even when the
+    apps pass only an instrumented client, which carries that same token, so
+    the warning would otherwise be logged on every start.
+    """
+
+    def filter(self, record):
+        return record.getMessage() != warning_client_prioritized_and_token_skipped()
+
+
+for bolt_logger in ("slack_bolt.App", "slack_bolt.AsyncApp"):
+    logging.getLogger(bolt_logger).addFilter(ClientTokenWarningFilter())
+
+
+def request_name(body):
+    """Name a request after the handler it is routed to, e.g. `command:/cv`."""
+    if body.get("type") == "event_callback":
+        return f"event:{body.get('event', {}).get('type')}"
+    if "command" in body:
+        return f"command:{body['command']}"
+    if body.get("type") in ("view_submission", "view_closed"):
+        return f"view:{body.get('view', {}).get('callback_id')}"
+    if body.get("type") == "block_actions" and body.get("actions"):
+        return f"action:{body['actions'][0].get('action_id')}"
+    return body.get("type", "unknown")
+
+
+def record_ack(body, elapsed):
+    name = request_name(body)
+    ack_latency.labels(name).observe(elapsed)
+    if elapsed > SLACK_ACK_TIMEOUT * 0.8:
+        logger.warning(f"Slow ack for {name}: {elapsed:.2f}s")
+
+
+def is_duplicate_delivery(body, request):
+    """Return True for an event that this process has already received."""
+    event_id = body.get("event_id")
+    if event_id is None or event_ids.add(event_id):
+        return False
+    retry_num = request.headers.get("x-slack-retry-num", ["-"])[0]
+    retry_reason = request.headers.get("x-slack-retry-reason", ["-"])[0]
+    logger.info(
+        f"Dropping duplicate delivery of {event_id} (retry {retry_num}, {retry_reason})"
+    )
+    return True
+
+
+# BoltContext utilities that capture the client when first built
+CLIENT_BOUND_UTILITIES = ("say", "complete", "fail")
+
+
+def dedupe_event_retries(body, request, next):
+    """Global middleware that acknowledges duplicate events without handling them."""
+    if is_duplicate_delivery(body, request):
+        return BoltResponse(status=200, body="")
+    next()
+
+
+def use_instrumented_client(context, next):
+    """Global middleware that gives listeners a client recording slack_api metrics.
+
+    Bolt builds a plain WebClient for every request. This replaces it with an
+    InstrumentedWebClient with the same token and settings, and drops the
+    utilities Bolt has already bound to the old client (argument injection
+    builds `say` for every middleware) so they are rebuilt with the new one.
+    """
+    context["client"] = InstrumentedWebClient(
+        **client_settings(context.client), team_id=context.team_id
+    )
+    for name in CLIENT_BOUND_UTILITIES:
+        context.pop(name, None)
+    next()
+
+
+class TimedApp(App):
+    """App that records how long each request took to be acknowledged.
+
+    dispatch() returns as soon as the matching listener has called ack(), so
+    its duration is the ack latency Slack sees, minus network time. Global
+    middleware runs before listeners are matched, so it cannot time this.
+    Each request opens the span its listeners' spans nest under.
+
+    Construct it with token_verification_enabled=False so that importing the
+    app makes no network call, and call verify_token() from the entrypoint.
+    """
+
+    def verify_token(self):
+        """Check the bot token with auth.test, as App() does by default.
+
+        The result is handed to the authorization middleware, so the first
+        request does not make the call again.
+        """
+        result = self.client.auth_test()
+        for middleware in self._middleware_list:
+            if isinstance(middleware, SingleTeamAuthorization):
+                middleware.auth_test_result = result
+        return result
+
+    def dispatch(self, req):
+        started = time.monotonic()
+        try:
+            with span(f"slack {request_name(req.body)}"):
+                return super().dispatch(req)
+        finally:
+            record_ack(req.body, time.monotonic() - started)
+
@@ -1,75 +1,284 @@
 import datetime
+import json
+import os
 import sys
-from apiclient import discovery
-import httplib2
-from oauth2client.service_account import ServiceAccountCredentials
+import threading
 from logging import Logger
 
+from config import Config
+from instrumentation import Operation
+
+STORE_FORMAT = 1
+
+google_calendar_calls = Operation("google_calendar", ("operation",))
+
+
+def event_start(event):
+    """Start of an event as an aware datetime; all-day events start at midnight UTC."""
+    start = event.get("start", {})
+    if "dateTime" in start:
+        return datetime.datetime.fromisoformat(start["dateTime"])
+    return datetime.datetime.fromisoformat(start["date"]).replace(
+        tzinfo=datetime.timezone.utc
+    )
+
+
+def event_end(event):
+    end = event.get("end") or event.get("start", {})
+    if "dateTime" in end:
+        return datetime.datetime.fromisoformat(end["dateTime"])
+    return datetime.datetime.fromisoformat(end["date"]).replace(
+        tzinfo=datetime.timezone.utc
+    )
+
 
 class GoogleApi:
+    """Google Calendar client that keeps a local copy of one calendar's events.
+
+    Credentials and the built service are created once and reused; the service
+    is built from the discovery document bundled with google-api-python-client,
+    so no network call is needed before the first request. The first sync
+    lists the calendar's upcoming events; later syncs pass the `nextSyncToken`
+    of the previous one, so each poll only transfers events that changed. When
+    Google expires the sync token (410 Gone), the store catches up with
+    `updatedMin` from the newest `updated` time it has seen, and only falls back
+    to a full listing when that is too old as well. Past events are pruned, and
+    the store is saved to `store_dir` so a restart continues from its token.
+
+    The Google client libraries are imported when the service is first built,
+    so importing this module stays cheap while the integration is unused.
+    """
+
     logger: Logger
 
     # A single auth scope is used for the zero-touch enrollment customer API.
     SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
-    SERVICE_ACCOUNT_KEY_FILE = "service_account_key.json"
+    PAGE_SIZE = 250
 
     def get_credential(self):
         """Creates a Credential object with the correct OAuth2 authorization.
 
-        Uses the service account key stored in SERVICE_ACCOUNT_KEY_FILE.
+        Uses the service account key stored in `key_file`. The credential is
+        created once and refreshes its own access token.
 
         Returns:
           Credentials, the user's credential.
         """
-        credential = ServiceAccountCredentials.from_json_keyfile_name(
-            self.SERVICE_ACCOUNT_KEY_FILE, self.SCOPES
-        )
+        if self._credential is None:
+            from oauth2client.service_account import ServiceAccountCredentials
+
+            credential = ServiceAccountCredentials.from_json_keyfile_name(
+                self.key_file, self.SCOPES
+            )
 
-        if not credential or credential.invalid:
-            self.logger.info("Unable to authenticate using service account key.")
-            sys.exit()
-        return credential
+            if not credential or credential.invalid:
+                self.logger.info("Unable to authenticate using service account key.")
+                sys.exit()
+            self._credential = credential
+        return self._credential
 
     def get_service(self):
-        http_auth = self.get_credential()  # .authorize(httplib2.Http())
-        return discovery.build("calendar", "v3", credentials=http_auth)
-        # return discovery.build("androiddeviceprovisioning", "v1", http=http_auth)
+        with self._lock:
+            if self._service is None:
+                import httplib2
+                from googleapiclient import discovery
 
-    def get_events(self):
-        # Create a zero-touch enrollment API service endpoint.
-        service = self.get_service()
+                options = (
+                    {"api_endpoint": self.api_endpoint} if self.api_endpoint else None
+                )
+                auth = (
+                    {"credentials": self.get_credential()}
+                    if self.key_file
+                    else {"http": httplib2.Http()}  # e.g. a local fake Calendar API
+                )
+                self._service = discovery.build(
+                    "calendar",
+                    "v3",
+                    static_discovery=True,
+                    cache_discovery=False,
+                    client_options=options,
+                    **auth,
+                )
+            return self._service
 
-        # Call the Calendar API
-        now = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
-        self.logger.info("Getting the upcoming 10 events")
+    def get_events(self, max_results=10):
+        """Sync the store and return the next `max_results` upcoming events."""
         try:
-            events_result = (
-                service.events()
-                .list(
-                    calendarId="hejare.se_jp7m0s7indk7f68rlotj5s9lg0@group.calendar.google.com",
-                    timeMin=now,
-                    maxResults=10,
+            self.sync()
+        except Exception as e:
+            self.logger.error(f"Google Calendar sync failed: {e}")
+        return self.upcoming_events(max_results)
+
+    def upcoming_events(self, max_results=10):
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        with self._lock:
+            timeline = self._timeline
+        events = []
+        for _, end, event in timeline:
+            if end > now:
+                events.append(event)
+                if len(events) == max_results:
+                    break
+        return events
+
+    def sync(self):
+        """Apply the calendar's changes since the last sync to the store.
+
+        Returns:
+          int, the number of changed (including cancelled) events received.
+        """
+        with self._sync_lock:
+            if self._sync_token is None and not self._events:
+                self._load()
+
+            changes = None
+            if self._sync_token is not None:
+                changes = self._list_or_expired(syncToken=self._sync_token)
+                if changes is None:
+                    self.logger.info("Google Calendar sync token expired")
+                    self._sync_token = None
+            if changes is None and self._updated is not None:
+                changes = self._list_or_expired(updatedMin=self._updated)
+            if changes is None:
+                now = datetime.datetime.now(tz=datetime.timezone.utc)
+                self.logger.info("Running a full Google Calendar sync")
+                items, sync_token = self._list(timeMin=now.isoformat())
+                with self._lock:
+                    self._events = {}
+                    self._timeline = []
+                    self._sync_token = None
+                self._apply(items, sync_token)
+                return len(items)
+
+            items, sync_token = changes
+            self._apply(items, sync_token)
+            return len(items)
+
+    def metrics(self):
+        with self._lock:
+            return {"events": len(self._events)}
+
+    def _list_or_expired(self, **params):
+        from googleapiclient.errors import HttpError
+
+        try:
+            return self._list(**params)
+        except HttpError as e:
+            if e.resp.status == 410:
+                return None
+            raise
+
+    def _list(self, **params):
+        """List every page of events; returns (items, nextSyncToken)."""
+        operation = "full" if "timeMin" in params else "incremental"
+        events = self.get_service().events()
+        items, page_token = [], None
+        while True:
+            with google_calendar_calls.track(operation):
+                result = events.list(
+                    calendarId=self.calendar_id,
                     singleEvents=True,
-                    orderBy="startTime",
-                )
-                .execute()
-            )
-            events = events_result.get("items", [])
+                    maxResults=self.PAGE_SIZE,
+                    pageToken=page_token,
+                    **params,
+                ).execute()
+            items += result.get("items", [])
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                return items, result.get("nextSyncToken")
 
-            if not events:
-                self.logger.info("No upcoming events found.")
-                return []
+    def _apply(self, items, sync_token):
+        if not items and sync_token in (None, self._sync_token):
+            return
+        with self._lock:
+            for event in items:
+                if event.get("updated") and (
+                    self._updated is None or event["updated"] > self._updated
+                ):
+                    self._updated = event["updated"]
+                if event.get("status") == "cancelled":
+                    self._events.pop(event["id"], None)
+                else:
+                    self._events[event["id"]] = event
+            if sync_token:
+                self._sync_token = sync_token
+            self._index()
+        self._save()
 
-            # Prints the start and name of the next 10 events
-            for event in events:
-                start = event["start"].get("dateTime", event["start"].get("date"))
-                self.logger.info(start, event["summary"])
+    def _index(self):
+        """Drop past events and rebuild the start-ordered timeline (holding _lock)."""
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        timeline = [
+            (event_start(event), event_end(event), event)
+            for event in self._events.values()
+        ]
+        timeline = [entry for entry in timeline if entry[1] > now]
+        timeline.sort(key=lambda entry: entry[0])
+        self._events = {event["id"]: event for _, _, event in timeline}
+        self._timeline = timeline
 
-            return events
-        except Exception as e:
-            dir(e)
-            self.logger.error(e)
-            return []
+    def _store_path(self):
+        if not self.store_dir:
+            return None
+        return os.path.join(self.store_dir, f"{self.calendar_id}.json")
+
+    def _load(self):
+        path = self._store_path()
+        if path is None:
+            return
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data.get("format") != STORE_FORMAT:
+                return
+            with self._lock:
+                self._events = data["events"]
+                self._sync_token = data.get("sync_token")
+                self._updated = data.get("updated")
+                self._index()
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.warning(f"Ignoring unreadable calendar store {path}: {e}")
+
+    def _save(self):
+        path = self._store_path()
+        if path is None:
+            return
+        with self._lock:
+            data = {
+                "format": STORE_FORMAT,
+                "sync_token": self._sync_token,
+                "updated": self._updated,
+                "events": self._events,
+            }
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.warning(f"Could not save calendar store {path}: {e}")
 
-    def __init__(self, logger: Logger):
+    def __init__(
+        self,
+        logger: Logger,
+        calendar_id=Config.GOOGLE_CALENDAR_ID,
+        key_file=Config.GOOGLE_SERVICE_ACCOUNT_KEY_FILE,
+        api_endpoint=Config.GOOGLE_CALENDAR_API_ENDPOINT,
+        store_dir=Config.GOOGLE_CALENDAR_STORE_DIR,
+    ):
         self.logger = logger
+        self.calendar_id = calendar_id
+        self.key_file = key_file
+        self.api_endpoint = api_endpoint
+        self.store_dir = store_dir
+        self._credential = None
+        self._service = None
+        self._events = {}
+        self._timeline = []
+        self._sync_token = None
+        self._updated = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
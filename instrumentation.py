@@ -0,0 +1,219 @@
+"""
+Latency histograms, error counters and in-flight gauges for Bolt listeners,
+database queries and OpenAI calls, served on /metrics. Slack Web API calls
+are tracked by slack_client, so importing this module (and db) does not load
+slack_sdk.
+
+With TRACING=true and OpenTelemetry installed, every tracked operation is
+also a span. Spans of one Slack request nest under the span opened when Bolt
+dispatched it, including work done later on ContextThreadPoolExecutor
+threads (lazy listeners and CV jobs), so a trace follows an event from ack
+through its queries and LLM calls. Exporters are configured the usual
+OpenTelemetry way, e.g. `opentelemetry-instrument python app.py`.
+"""
+
+import contextvars
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _tracer():
+    # OpenTelemetry takes a few ms to import, so it is only loaded when used
+    if not Config.TRACING:
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:  # tracing is optional
+        return None
+    return trace.get_tracer("hejbot")
+
+
+tracer = _tracer()
+
+SQL_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+(\w+)", re.IGNORECASE)
+
+
+def error_name(e):
+    return type(e).__name__
+
+
+class Operation:
+    """Duration histogram, error counter and in-flight gauge for one kind of call."""
+
+    def track(self, *labels):
+        return self._track(labels)
+
+    @contextmanager
+    def _track(self, labels):
+        in_flight = self.in_flight.labels(*labels)
+        in_flight.inc()
+        started = time.monotonic()
+        try:
+            with span(f"{self.subsystem} {' '.join(labels)}"):
+                yield
+        except Exception as e:
+            self.errors.labels(*labels, self.error_name(e)).inc()
+            raise
+        finally:
+            self.duration.labels(*labels).observe(time.monotonic() - started)
+            in_flight.dec()
+
+    def __init__(
+        self,
+        subsystem,
+        label_names,
+        buckets=metrics.LATENCY_BUCKETS,
+        error_name=error_name,
+    ):
+        self.subsystem = subsystem
+        self.error_name = error_name
+        self.duration = metrics.histogram(
+            f"hejbot_{subsystem}_duration_seconds",
+            f"Duration of {subsystem} calls.",
+            label_names,
+            buckets,
+        )
+        self.errors = metrics.counter(
+            f"hejbot_{subsystem}_errors_total",
+            f"{subsystem} calls that raised, by error.",
+            (*label_names, "error"),
+        )
+        self.in_flight = metrics.gauge(
+            f"hejbot_{subsystem}_in_flight",
+            f"{subsystem} calls in progress.",
+            label_names,
+        )
+
+
+listeners = Operation("listener", ("listener",))
+db_queries = Operation("db_query", ("operation", "table"))
+openai_calls = Operation("openai", ("operation",), metrics.LLM_BUCKETS)
+
+
+@contextmanager
+def span(name, **attributes):
+    """An OpenTelemetry span when tracing is enabled, otherwise nothing."""
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+@functools.lru_cache(maxsize=1024)
+def sql_labels(query_text):
+    """Label a statement by its verb and first table, e.g. ("SELECT", "cv_entries")."""
+    words = query_text.split(None, 1)
+    table = SQL_TABLE.search(query_text)
+    return (
+        words[0].upper() if words else "",
+        table.group(1).lower() if table else "",
+    )
+
+
+def instrument_listener(func):
+    """Wrap a Bolt listener function; Bolt still sees the original arguments."""
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(**kwargs):
+            with listeners.track(func.__name__):
+                return await func(**kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(**kwargs):
+        with listeners.track(func.__name__):
+            return func(**kwargs)
+
+    return wrapper
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that runs each task in the submitter's contextvars.
+
+    This carries the active span (and anything else kept in contextvars) from
+    the thread that handled a request to the thread that finishes its work.
+    `metrics()` reports how many tasks are waiting for a thread.
+    """
+
+    COUNTERS = ("submitted",)
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._counts_lock:
+            self._pending += 1
+            self._submitted += 1
+        try:
+            return super().submit(
+                self._run, contextvars.copy_context(), fn, *args, **kwargs
+            )
+        except Exception:
+            with self._counts_lock:
+                self._pending -= 1
+            raise
+
+    def metrics(self):
+        with self._counts_lock:
+            return {
+                "queued": self._pending - self._running,
+                "running": self._running,
+                "submitted": self._submitted,
+            }
+
+    def _run(self, context, fn, /, *args, **kwargs):
+        with self._counts_lock:
+            self._running += 1
+        try:
+            return context.run(fn, *args, **kwargs)
+        finally:
+            with self._counts_lock:
+                self._running -= 1
+                self._pending -= 1
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending = 0
+        self._running = 0
+        self._submitted = 0
+        self._counts_lock = threading.Lock()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep scrapes out of the application log
+
+
+def start_metrics_server(port=Config.METRICS_PORT):
+    """Serve /metrics on its own port from a daemon thread (0 disables it)."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    logger.info(f"Serving metrics on :{port}/metrics")
+    return server
@@ -0,0 +1,157 @@
+import threading
+import time
+from logging import Logger
+
+import psycopg2
+
+from config import Config
+from db import get_db_connection
+
+
+class LeaderElector:
+    """Elects one replica to run scheduled jobs using a Postgres advisory lock.
+
+    Every replica tries `pg_try_advisory_lock(lock_id)` on its own dedicated
+    connection; the one that gets it is the leader until that session ends.
+    The leader checks the connection every `retry_interval` seconds and steps
+    down as soon as the session is lost, or when checks have failed for
+    `lease_timeout` seconds. The session's
+    TCP keepalives are set from the same timeout so Postgres also drops a dead
+    leader's session, releasing the lock for another replica to take over.
+    """
+
+    logger: Logger
+
+    @property
+    def is_leader(self):
+        return self._is_leader
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="leader-elector", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Step down (if leading) and release the lock.
+
+        The elector's thread steps down itself; if a job is still running
+        after the wait, it keeps the lock until the job is done.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(self.retry_interval + 5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self._is_leader:
+                    self._heartbeat()
+                else:
+                    self._try_acquire()
+            except psycopg2.Error as e:
+                self.logger.warning(f"Leader election connection error: {e}")
+                if not self._is_leader:
+                    self._close()
+                elif (
+                    self._conn is None
+                    or self._conn.closed
+                    or time.monotonic() - self._last_ok > self.lease_timeout
+                ):
+                    # A lost session has already released the lock.
+                    self.logger.error("Leader lease lost, stepping down")
+                    self._demote()
+            self._stopping.wait(self.retry_interval)
+        self._demote()
+
+    def _try_acquire(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = self._connect()
+        with self._conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_id,))
+            acquired = cur.fetchone()[0]
+        if acquired:
+            self._is_leader = True
+            self._last_ok = time.monotonic()
+            self.logger.info(f"Elected leader (lock {self.lock_id})")
+            self._call(self.on_elected)
+
+    def _heartbeat(self):
+        with self._conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        self._last_ok = time.monotonic()
+
+    def _connect(self):
+        idle = max(1, int(self.lease_timeout / 3))
+        interval = max(1, int(self.lease_timeout / 6))
+        conn = get_db_connection(
+            connect_timeout=max(1, int(self.lease_timeout / 2)),
+            keepalives=1,
+            keepalives_idle=idle,
+            keepalives_interval=interval,
+            keepalives_count=3,
+            options=(
+                f"-c tcp_keepalives_idle={idle} "
+                f"-c tcp_keepalives_interval={interval} "
+                "-c tcp_keepalives_count=3 "
+                f"-c statement_timeout={int(self.lease_timeout * 500)}"
+            ),
+        )
+        conn.autocommit = True
+        return conn
+
+    def _demote(self):
+        """Stop leading, then end the session, which releases the lock.
+
+        on_demoted is called until it returns something other than False
+        (e.g. a JobEngine.stop that timed out), so the lock is only given up
+        once no job is still running here. If the session is already lost,
+        the lock has gone with it and this only waits for the job to finish.
+        """
+        was_leader = self._is_leader
+        self._is_leader = False
+        if was_leader:
+            self.logger.info("No longer leader")
+            while self._call(self.on_demoted) is False:
+                self.logger.warning(
+                    "Scheduled job still running, keeping the leader lock"
+                )
+        self._close()
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg2.Error:
+                pass
+            self._conn = None
+
+    def _call(self, callback):
+        try:
+            return callback()
+        except Exception as e:
+            self.logger.error(f"Error in leader election callback: {e}")
+
+    def __init__(
+        self,
+        logger: Logger,
+        on_elected,
+        on_demoted,
+        lock_id=Config.LEADER_LOCK_ID,
+        lease_timeout=Config.LEADER_LEASE_TIMEOUT,
+        retry_interval=Config.LEADER_RETRY_INTERVAL,
+    ):
+        self.logger = logger
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.lock_id = lock_id
+        self.lease_timeout = lease_timeout
+        self.retry_interval = retry_interval
+        self._conn = None
+        self._is_leader = False
+        self._last_ok = 0.0
+        self._stopping = threading.Event()
+        self._thread = None
@@ -0,0 +1,238 @@
+"""
+In-process metrics rendered in the Prometheus text format.
+
+Metric families are created once at import time with `counter()`, `gauge()`
+and `histogram()` and added to the module registry; `render()` produces the
+/metrics page from them and from any registered collectors, which turn the
+`metrics()` dictionaries of pools, buffers and caches into gauges and
+counters at scrape time.
+"""
+
+import math
+import threading
+from bisect import bisect_left
+
+# Upper bounds in seconds; Slack gives up on an ack after 3s.
+ACK_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0)
+
+# Database queries and Slack Web API calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# LLM calls take seconds to minutes
+LLM_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class Counter:
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def samples(self):
+        with self._lock:
+            return [("", {}, self._value)]
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+
+class Gauge(Counter):
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+
+class Histogram:
+    """Cumulative histogram of observed values over fixed bucket bounds."""
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect_left(self.buckets, value)] += 1
+            self._count += 1
+            self._sum += value
+
+    def quantile(self, q):
+        """Estimate the q-quantile as the upper bound of the bucket it falls in."""
+        with self._lock:
+            if self._count == 0:
+                return None
+            rank = q * self._count
+            seen = 0
+            for bound, count in zip(self.buckets, self._counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+            return math.inf
+
+    def snapshot(self):
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets + (math.inf,), self._counts):
+                cumulative += count
+                buckets[bound] = cumulative
+            return {"buckets": buckets, "count": self._count, "sum": self._sum}
+
+    def samples(self):
+        snapshot = self.snapshot()
+        samples = [
+            ("_bucket", {"le": _format_value(bound)}, count)
+            for bound, count in snapshot["buckets"].items()
+        ]
+        samples.append(("_sum", {}, snapshot["sum"]))
+        samples.append(("_count", {}, snapshot["count"]))
+        return samples
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+
+class MetricFamily:
+    """A named metric with one child per combination of label values."""
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._factory()
+            return child
+
+    def snapshot(self):
+        """Return histogram snapshots (with p50 and p99) keyed by label values."""
+        with self._lock:
+            children = dict(self._children)
+        return {
+            values[0] if len(values) == 1 else values: {
+                **child.snapshot(),
+                "p50": child.quantile(0.5),
+                "p99": child.quantile(0.99),
+            }
+            for values, child in children.items()
+        }
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            for suffix, extra, value in child.samples():
+                labels = {**dict(zip(self.label_names, values)), **extra}
+                lines.append(
+                    f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}"
+                )
+        return lines
+
+    def __init__(self, name, documentation, kind, factory, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+
+_families = []
+_collectors = {}
+_registry_lock = threading.Lock()
+
+
+def _register(family):
+    with _registry_lock:
+        _families.append(family)
+    return family
+
+
+def counter(name, documentation, label_names=()):
+    return _register(MetricFamily(name, documentation, "counter", Counter, label_names))
+
+
+def gauge(name, documentation, label_names=()):
+    return _register(MetricFamily(name, documentation, "gauge", Gauge, label_names))
+
+
+def histogram(name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+    return _register(
+        MetricFamily(
+            name, documentation, "histogram", lambda: Histogram(buckets), label_names
+        )
+    )
+
+
+def register_collector(prefix, collect, counters=()):
+    """Export the numeric values of `collect()` as `<prefix>_<key>` metrics.
+
+    Keys listed in `counters` (usually the source's COUNTERS) and keys ending
+    in `_total` only ever grow, and are exported as counters named with a
+    `_total` suffix; everything else is a gauge.
+    """
+    with _registry_lock:
+        _collectors[prefix] = (collect, frozenset(counters))
+
+
+def render():
+    """Render every metric family and collector in the Prometheus text format."""
+    with _registry_lock:
+        families = list(_families)
+        collectors = dict(_collectors)
+    lines = []
+    for family in families:
+        lines += family.render()
+    for prefix, (collect, counters) in collectors.items():
+        try:
+            values = collect()
+        except Exception:
+            continue  # a collector must never break the scrape
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name, kind = f"{prefix}_{key}", "gauge"
+            if key in counters or key.endswith("_total"):
+                kind = "counter"
+                if not name.endswith("_total"):
+                    name += "_total"
+            lines += [
+                f"# TYPE {name} {kind}",
+                f"{name} {_format_value(value)}",
+            ]
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return f"{{{pairs}}}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# Seconds from a request reaching Bolt until it was acknowledged, per handler
+ack_latency = histogram(
+    "hejbot_slack_ack_latency_seconds",
+    "Time from a Slack request reaching Bolt until it was acknowledged.",
+    ("handler",),
+    ACK_BUCKETS,
+)
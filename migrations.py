@@ -0,0 +1,228 @@
+"""
+Versioned schema migrations.
+
+Each migration is applied once, in order, inside its own transaction and
+recorded in schema_migrations. Add new migrations to the end of MIGRATIONS;
+never edit one that has already been released.
+"""
+
+from psycopg2.extras import RealDictCursor
+
+# Serialises migrations when several replicas start at the same time.
+MIGRATION_LOCK_ID = 72345
+
+MIGRATIONS = [
+    (
+        1,
+        "initial schema",
+        [
+            # CREATE TABLE IF NOT EXISTS so databases created before
+            # migrations existed are adopted as they are.
+            """
+            CREATE TABLE IF NOT EXISTS cv_entries (
+                id SERIAL PRIMARY KEY,
+                user_id VARCHAR(255) NOT NULL,
+                text TEXT NOT NULL,
+                timestamp TIMESTAMP NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS scheduled_posts (
+                id SERIAL PRIMARY KEY,
+                post_id VARCHAR(255) NOT NULL,
+                type VARCHAR(255) NOT NULL,
+                text TEXT NOT NULL,
+                added_by VARCHAR(255) NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS dm_channels (
+                user_id VARCHAR(255) PRIMARY KEY,
+                channel_id VARCHAR(255) NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS cv_jobs (
+                job_id VARCHAR(255) PRIMARY KEY,
+                user_id VARCHAR(255) NOT NULL,
+                status VARCHAR(32) NOT NULL,
+                error TEXT,
+                created_at TIMESTAMP NOT NULL,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS cv_summaries (
+                user_id VARCHAR(255) PRIMARY KEY,
+                summary TEXT NOT NULL,
+                last_entry_id INTEGER NOT NULL,
+                updated_at TIMESTAMP NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS scheduled_post_deliveries (
+                post_id VARCHAR(255) NOT NULL,
+                user_id VARCHAR(255) NOT NULL,
+                status VARCHAR(32) NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                claimed_at TIMESTAMP,
+                updated_at TIMESTAMP NOT NULL DEFAULT now(),
+                PRIMARY KEY (post_id, user_id)
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "index hot query columns",
+        [
+            # /cv generate reads one user's entries in time order
+            """
+            CREATE INDEX IF NOT EXISTS cv_entries_user_id_timestamp_idx
+                ON cv_entries (user_id, timestamp, id)
+            """,
+            # Cheap time-range scans for retention and compaction
+            """
+            CREATE INDEX IF NOT EXISTS cv_entries_timestamp_brin_idx
+                ON cv_entries USING brin (timestamp)
+            """,
+            # post_id must be unique before it can be constrained
+            """
+            DELETE FROM scheduled_posts a USING scheduled_posts b
+            WHERE a.post_id = b.post_id AND a.id > b.id
+            """,
+            """
+            ALTER TABLE scheduled_posts
+                ADD CONSTRAINT scheduled_posts_post_id_key UNIQUE (post_id)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS scheduled_posts_type_idx
+                ON scheduled_posts (type)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS scheduled_post_deliveries_open_idx
+                ON scheduled_post_deliveries (post_id)
+                WHERE status IN ('pending', 'sending')
+            """,
+        ],
+    ),
+    (
+        3,
+        "cv entry digests",
+        [
+            # Rows written by the compaction job that stand for a whole month
+            """
+            ALTER TABLE cv_entries
+                ADD COLUMN IF NOT EXISTS digest BOOLEAN NOT NULL DEFAULT FALSE
+            """,
+        ],
+    ),
+    (
+        4,
+        "idempotent cv entry ingestion",
+        [
+            # Slack's message identity; NULL for digests and older rows
+            """
+            ALTER TABLE cv_entries ADD COLUMN IF NOT EXISTS event_key TEXT
+            """,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS cv_entries_event_key_idx
+                ON cv_entries (event_key)
+            """,
+        ],
+    ),
+    (
+        5,
+        "keyset pagination of scheduled posts",
+        [
+            # /admin list posts pages by id within a type or author filter
+            """
+            CREATE INDEX IF NOT EXISTS scheduled_posts_type_id_idx
+                ON scheduled_posts (type, id)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS scheduled_posts_added_by_id_idx
+                ON scheduled_posts (added_by, id)
+            """,
+            # Covered by scheduled_posts_type_id_idx
+            """
+            DROP INDEX IF EXISTS scheduled_posts_type_idx
+            """,
+        ],
+    ),
+    (
+        6,
+        "mark cv entries folded into the summary",
+        [
+            # Replaces cv_summaries.last_entry_id as the incremental watermark
+            """
+            ALTER TABLE cv_entries
+                ADD COLUMN IF NOT EXISTS folded BOOLEAN NOT NULL DEFAULT FALSE
+            """,
+            # Entries up to the old watermark, and digests once a summary
+            # existed, were already treated as folded
+            """
+            UPDATE cv_entries e SET folded = TRUE
+            FROM cv_summaries s
+            WHERE s.user_id = e.user_id AND (e.id <= s.last_entry_id OR e.digest)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS cv_entries_unfolded_idx
+                ON cv_entries (user_id, timestamp, id) WHERE NOT folded
+            """,
+        ],
+    ),
+    (
+        7,
+        "delivery retry backoff",
+        [
+            # A failed recipient is not claimed again before this time
+            """
+            ALTER TABLE scheduled_post_deliveries
+                ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP NOT NULL
+                DEFAULT now()
+            """,
+        ],
+    ),
+]
+
+
+def migrate(conn):
+    """Apply every migration that has not been applied yet. Returns the applied versions."""
+    applied_now = []
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT now()
+                )
+                """
+            )
+            conn.commit()
+
+            cur.execute("SELECT version FROM schema_migrations")
+            applied = {row["version"] for row in cur.fetchall()}
+            for version, name, statements in MIGRATIONS:
+                if version in applied:
+                    continue
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version,name) VALUES (%s,%s)",
+                    (version, name),
+                )
+                conn.commit()
+                applied_now.append(version)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    return applied_now
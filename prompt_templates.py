@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+import time
+from logging import Logger
+from string import Template
+
+from config import Config
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+# Prompts the application cannot run without.
+REQUIRED_PROMPTS = ("cv_instructions", "cv_summary_instructions")
+
+
+class PromptError(Exception):
+    """Raised when required prompt assets are missing or an asset includes itself."""
+
+
+class AssetTemplate(Template):
+    """Only `${name}` and `$$` are special; any other `$` is literal text.
+
+    Assets are mostly prose and examples, so "$2M" or "$HOME" must pass
+    through unchanged instead of failing validation.
+    """
+
+    pattern = r"""
+    \$(?:
+      (?P<escaped>\$) |
+      \{(?P<braced>[_a-z][_a-z0-9]*)\} |
+      (?P<named>(?!)) |
+      (?P<invalid>(?!))
+    )
+    """
+
+
+class PromptRegistry:
+    """Prompt assets loaded once and rendered ahead of time.
+
+    Every `<name>.txt` or `<name>.<variant>.txt` file in the prompts directory
+    is an asset. An asset may embed another with `${other_name}`; it is filled
+    in with the same variant of that asset when one exists and with the
+    default variant otherwise. `${...}` naming no asset is left as it is, and
+    `$$` is a literal `$`. Rendering and validation happen at load time, so
+    `get()` is a dictionary lookup. A watcher thread reloads the assets when a
+    file's mtime changes; a reload that fails validation keeps the previous set.
+    """
+
+    logger: Logger
+
+    def get(self, name, *variants):
+        """Return a rendered prompt, preferring the given variants in order."""
+        if self._prompts is None:
+            self.load()
+        for variant in variants:
+            if variant and (name, variant) in self._prompts:
+                return self._prompts[(name, variant)]
+        return self._prompts[(name, None)]
+
+    def variants(self, name):
+        if self._prompts is None:
+            self.load()
+        return sorted(v for n, v in self._prompts if n == name and v is not None)
+
+    def load(self):
+        with self._lock:
+            mtimes = self._scan()
+            raw = {}
+            for filename in mtimes:
+                name, _, variant = filename[: -len(".txt")].partition(".")
+                with open(os.path.join(self.directory, filename), "r") as f:
+                    raw[(name, variant or None)] = f.read().rstrip("\n")
+            self._prompts = _render(raw, self.required)
+            self._mtimes = mtimes
+        self.logger.info(f"Loaded {len(raw)} prompt assets from {self.directory}")
+
+    def start_watching(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._watch, name="prompt-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                if self._scan() != self._mtimes:
+                    self.load()
+            except Exception as e:
+                self.logger.error(f"Keeping previous prompts, reload failed: {e}")
+
+    def _scan(self):
+        return {
+            entry.name: entry.stat().st_mtime_ns
+            for entry in os.scandir(self.directory)
+            if entry.is_file() and entry.name.endswith(".txt")
+        }
+
+    def __init__(
+        self,
+        logger: Logger,
+        directory=PROMPTS_DIR,
+        required=REQUIRED_PROMPTS,
+        reload_interval=Config.PROMPT_RELOAD_INTERVAL,
+    ):
+        self.logger = logger
+        self.directory = directory
+        self.required = required
+        self.reload_interval = reload_interval
+        self._prompts = None
+        self._mtimes = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+
+def _render(raw, required):
+    missing = [name for name in required if (name, None) not in raw]
+    if missing:
+        raise PromptError(f"Missing prompt assets: {', '.join(missing)}")
+
+    rendered = {}
+
+    def render(key, seen):
+        if key in rendered:
+            return rendered[key]
+        if key in seen:
+            raise PromptError(f"Prompt asset {key[0]} includes itself")
+        name, variant = key
+        template = AssetTemplate(raw[key])
+        values = {}
+        for other in template.get_identifiers():
+            other_key = (other, variant) if (other, variant) in raw else (other, None)
+            if other_key in raw:
+                values[other] = render(other_key, seen | {key})
+        rendered[key] = template.safe_substitute(values)
+        return rendered[key]
+
+    for key in raw:
+        render(key, frozenset())
+    return rendered
+
+
+prompts = PromptRegistry(logger=logging.getLogger(__name__))
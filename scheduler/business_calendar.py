@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import threading
+from datetime import date, timedelta
+from importlib import metadata
+from logging import Logger
+
+from config import Config
+
+CACHE_FORMAT = 1
+
+DAY_OFF = 1  # weekend or holiday
+HOLIDAY = 2  # listed by the holidays package, whatever the weekday
+
+
+class YearTable:
+    """Working-day facts for one year, indexed by day of the year.
+
+    `ordinals[i]` is the day's ordinal among the working days of its month
+    (0 for days off), `flags[i]` holds DAY_OFF/HOLIDAY bits and
+    `working_days[m - 1]` is the number of working days in month m.
+    """
+
+    def index(self, day):
+        return day.toordinal() - self.first_ordinal
+
+    def as_dict(self):
+        return {
+            "year": self.year,
+            "ordinals": list(self.ordinals),
+            "flags": list(self.flags),
+            "working_days": list(self.working_days),
+        }
+
+    @classmethod
+    def build(cls, year, holiday_dates):
+        ordinals, flags = bytearray(), bytearray()
+        working_days = [0] * 12
+        day = date(year, 1, 1)
+        while day.year == year:
+            flag = HOLIDAY if day in holiday_dates else 0
+            if flag or day.weekday() >= 5:
+                flag |= DAY_OFF
+                ordinals.append(0)
+            else:
+                working_days[day.month - 1] += 1
+                ordinals.append(working_days[day.month - 1])
+            flags.append(flag)
+            day += timedelta(days=1)
+        return cls(year, bytes(ordinals), bytes(flags), tuple(working_days))
+
+    def __init__(self, year, ordinals, flags, working_days):
+        self.year = year
+        self.ordinals = ordinals
+        self.flags = flags
+        self.working_days = working_days
+        self.first_ordinal = date(year, 1, 1).toordinal()
+
+
+class BusinessCalendar:
+    """O(1) working-day lookups for a country, from precomputed year tables.
+
+    A working day is a weekday that is not a holiday in any of `categories`
+    of the holidays package ("de_facto" adds Midsommarafton, Julafton and
+    Nyårsafton to Sweden's public holidays). Each year's table is built once,
+    kept in memory and written to `cache_dir`, so later runs load it instead
+    of evaluating the holiday rules again. The cache file name includes the
+    holidays package version, so an upgrade rebuilds the tables.
+    """
+
+    logger: Logger
+
+    def is_working_day(self, day):
+        table = self.table(day.year)
+        return not table.flags[table.index(day)] & DAY_OFF
+
+    def is_holiday(self, day):
+        table = self.table(day.year)
+        return bool(table.flags[table.index(day)] & HOLIDAY)
+
+    def working_day_ordinal(self, day):
+        """Return n if `day` is the nth working day of its month, else 0."""
+        table = self.table(day.year)
+        return table.ordinals[table.index(day)]
+
+    def working_days_in_month(self, year, month):
+        return self.table(year).working_days[month - 1]
+
+    def is_nth_working_day(self, day, n):
+        """Is `day` the nth working day of its month? Negative n counts from the end."""
+        ordinal = self.working_day_ordinal(day)
+        if ordinal == 0:
+            return False
+        if n < 0:
+            n += self.working_days_in_month(day.year, day.month) + 1
+        return ordinal == n
+
+    def is_last_working_day(self, day):
+        return self.is_nth_working_day(day, -1)
+
+    def nth_working_day(self, year, month, n):
+        """Return the nth (or with negative n, nth from last) working day, or None."""
+        count = self.working_days_in_month(year, month)
+        if n < 0:
+            n += count + 1
+        if not 1 <= n <= count:
+            return None
+        table = self.table(year)
+        start = table.index(date(year, month, 1))
+        return date(year, month, 1) + timedelta(
+            days=table.ordinals.index(n, start) - start
+        )
+
+    def last_working_day(self, year, month):
+        return self.nth_working_day(year, month, -1)
+
+    def table(self, year):
+        table = self._tables.get(year)
+        if table is None:
+            with self._lock:
+                table = self._tables.get(year)
+                if table is None:
+                    table = self._tables[year] = self._load(year)
+        return table
+
+    def _load(self, year):
+        path = self._cache_path(year)
+        if path is not None:
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+                return YearTable(
+                    year,
+                    bytes(data["ordinals"]),
+                    bytes(data["flags"]),
+                    tuple(data["working_days"]),
+                )
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError) as e:
+                self.logger.warning(f"Rebuilding unreadable calendar cache {path}: {e}")
+
+        import holidays  # slow to import; cached years never need it
+
+        table = YearTable.build(
+            year,
+            holidays.country_holidays(
+                self.country, years=year, categories=self.categories
+            ),
+        )
+        if path is not None:
+            self._save(path, table)
+        return table
+
+    def _save(self, path, table):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(table.as_dict(), f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.warning(
+                f"Could not cache business calendar for {table.year}: {e}"
+            )
+
+    def _cache_path(self, year):
+        if not self.cache_dir:
+            return None
+        categories = "+".join(sorted(self.categories))
+        return os.path.join(
+            self.cache_dir,
+            f"{self.country}-{year}-{categories}-holidays{metadata.version('holidays')}"
+            f"-v{CACHE_FORMAT}.json",
+        )
+
+    def __init__(
+        self,
+        logger: Logger,
+        country="SE",
+        categories=Config.BUSINESS_CALENDAR_CATEGORIES,
+        cache_dir=Config.BUSINESS_CALENDAR_CACHE_DIR,
+    ):
+        self.logger = logger
+        self.country = country
+        self.categories = tuple(categories)
+        self.cache_dir = cache_dir
+        self._tables = {}
+        self._lock = threading.Lock()
+
+
+business_calendar = BusinessCalendar(logger=logging.getLogger(__name__))
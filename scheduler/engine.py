@@ -0,0 +1,238 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+from logging import Logger
+
+import pytz
+
+from scheduler.business_calendar import business_calendar
+
+STOCKHOLM = pytz.timezone("Europe/Stockholm")
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+class Every:
+    """Runs every `seconds`, counted from the end of the previous run."""
+
+    def next_after(self, now):
+        return now + timedelta(seconds=self.seconds)
+
+    def __repr__(self):
+        return f"every {self.seconds:g}s"
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+
+class Daily:
+    """Runs every day (or on the given weekdays) at a local wall-clock time."""
+
+    def next_after(self, now):
+        """Return the first run strictly after the aware datetime `now`, in UTC."""
+        local_now = now.astimezone(self.tz)
+        day = local_now.date()
+        while True:
+            if self.runs_on(day):
+                # localize() picks the right UTC offset for that date, so the
+                # wall-clock time stays put across DST changes.
+                candidate = self.tz.normalize(
+                    self.tz.localize(datetime.combine(day, self.at))
+                )
+                if candidate > local_now:
+                    return candidate.astimezone(pytz.utc)
+            day += timedelta(days=1)
+
+    def runs_on(self, day):
+        return self.weekdays is None or day.weekday() in self.weekdays
+
+    def __repr__(self):
+        days = "daily" if self.weekdays is None else ",".join(
+            WEEKDAYS[d] for d in sorted(self.weekdays)
+        )
+        return f"{days} at {self.at:%H:%M} {self.tz.zone}"
+
+    def __init__(self, at, weekdays=None, tz=STOCKHOLM):
+        self.at = datetime.strptime(at, "%H:%M").time()
+        self.weekdays = None if weekdays is None else {
+            WEEKDAYS.index(day) if isinstance(day, str) else day for day in weekdays
+        }
+        self.tz = tz
+
+
+class Weekly(Daily):
+    """Runs once a week on `weekday` at a local wall-clock time."""
+
+    def __init__(self, weekday, at, tz=STOCKHOLM):
+        super().__init__(at, weekdays=[weekday], tz=tz)
+
+
+class WorkingDay(Daily):
+    """Runs on the nth working day of every month (-1 is the last one).
+
+    Working days come from the business calendar, so weekends and Swedish
+    holidays such as Midsommarafton and Julafton are skipped.
+    """
+
+    def runs_on(self, day):
+        return self.calendar.is_nth_working_day(day, self.n)
+
+    def __repr__(self):
+        return f"working day {self.n} at {self.at:%H:%M} {self.tz.zone}"
+
+    def __init__(self, at, n, tz=STOCKHOLM, calendar=business_calendar):
+        super().__init__(at, tz=tz)
+        self.n = n
+        self.calendar = calendar
+
+
+class Job:
+    name: str
+
+    def timings(self):
+        return {
+            "name": self.name,
+            "rule": repr(self.rule),
+            "next_run": self.next_run,
+            "last_run": self.last_run,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+    def __init__(self, name, rule, func):
+        self.name = name
+        self.rule = rule
+        self.func = func
+        self.next_run = None
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+
+
+class JobEngine:
+    """Runs registered jobs at their next due time without polling.
+
+    Next-run times are kept in a heap and the engine sleeps until the earliest
+    one, waking early only when a job is registered or the engine is stopped.
+    Jobs run one at a time on the engine's thread.
+    """
+
+    logger: Logger
+
+    def register(self, name, rule, func):
+        job = Job(name, rule, func)
+        with self._cond:
+            self._jobs[name] = job
+            self._schedule(job, _utcnow())
+            self._cond.notify()
+        return job
+
+    def jobs(self):
+        """Return next-run and last-run timings for every registered job."""
+        with self._cond:
+            return [job.timings() for job in self._jobs.values()]
+
+    def start(self):
+        """Run the engine on a daemon thread in this process.
+
+        Each start gets its own stop event. If a previous run is still
+        finishing a job after stop() timed out, the new thread waits for it
+        before running anything, so two loops never fire the same jobs.
+
+        Next runs are recomputed from now, so runs that fell due while the
+        engine was stopped (e.g. while another replica was leading) are
+        dropped rather than all fired at once.
+        """
+        with self._cond:
+            if self._stop_event is not None and not self._stop_event.is_set():
+                return
+            now = _utcnow()
+            self._heap = []
+            for job in self._jobs.values():
+                self._schedule(job, now)
+            self._stop_event = stopping = threading.Event()
+            previous = self._thread
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(stopping, previous),
+                name="scheduler",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the current run; returns False if a job is still finishing."""
+        with self._cond:
+            if self._stop_event is not None:
+                self._stop_event.set()
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is None:
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def _run(self, stopping, previous):
+        if previous is not None:
+            previous.join()
+        while True:
+            with self._cond:
+                while True:
+                    if stopping.is_set():
+                        return
+                    job, delay = self._next_due()
+                    if job is not None:
+                        break
+                    self._cond.wait(delay)
+            self._execute(job)
+
+    def _next_due(self):
+        """Pop the next due job, or return how long to wait for one."""
+        while self._heap:
+            run_at, _, job = self._heap[0]
+            if self._jobs.get(job.name) is not job or job.next_run != run_at:
+                heapq.heappop(self._heap)  # replaced or rescheduled
+                continue
+            delay = (run_at - _utcnow()).total_seconds()
+            if delay > 0:
+                return None, delay
+            heapq.heappop(self._heap)
+            return job, 0
+        return None, None
+
+    def _execute(self, job):
+        started_at = _utcnow()
+        started = time.monotonic()
+        try:
+            job.func()
+            job.last_error = None
+        except Exception as e:
+            job.last_error = str(e)
+            self.logger.error(f"Scheduled job {job.name} failed: {e}")
+        with self._cond:
+            job.last_run = started_at
+            job.last_duration = time.monotonic() - started
+            if self._jobs.get(job.name) is job:
+                self._schedule(job, _utcnow())
+        self.logger.info(
+            f"Scheduled job {job.name} ran in {job.last_duration:.1f}s, next run {job.next_run}"
+        )
+
+    def _schedule(self, job, now):
+        job.next_run = job.rule.next_after(now)
+        heapq.heappush(self._heap, (job.next_run, next(self._sequence), job))
+
+    def __init__(self, logger: Logger):
+        self.logger = logger
+        self._jobs = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._stop_event = None
+        self._thread = None
+        self._cond = threading.Condition()
+
+
+def _utcnow():
+    return datetime.now(pytz.utc)
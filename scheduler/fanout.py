@@ -0,0 +1,218 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from urllib.error import URLError
+
+from slack_bolt import App
+from slack_sdk.errors import SlackApiError
+
+from chat_helper import (
+    forget_private_chat,
+    get_cached_private_chat,
+    remember_private_chat,
+)
+from config import Config
+
+# Requests per minute for Slack's Web API rate-limit tiers.
+# https://api.slack.com/apis/rate-limits
+TIER_RATES = {1: 1, 2: 20, 3: 50, 4: 100}
+
+# chat.postMessage is not tiered; Slack allows about one message per second per
+# channel, and every recipient gets their own DM channel.
+METHOD_RATES = {
+    "conversations.open": TIER_RATES[3],
+    "users.list": TIER_RATES[2],
+    "chat.postMessage": 600,
+}
+
+
+class RateLimiter:
+    """Token bucket shared by all workers calling the same Web API method."""
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    self._tokens = min(
+                        self.burst,
+                        self._tokens + (now - self._updated_at) * self.per_second,
+                    )
+                    self._updated_at = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.per_second
+                else:
+                    wait = self._paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds`, e.g. after a 429 Retry-After."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+    def __init__(self, per_minute, burst=None):
+        self.per_second = per_minute / 60
+        self.burst = burst if burst is not None else max(1, per_minute // 10)
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+
+class BroadcastStats:
+    sent: int
+    retried: int
+    failed: int
+    wall_time: float
+
+    def as_dict(self):
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "wall_time": round(self.wall_time, 3),
+        }
+
+    def __repr__(self):
+        return f"BroadcastStats({self.as_dict()})"
+
+    def __init__(self):
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.wall_time = 0.0
+        self._lock = threading.Lock()
+
+    def _add(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+
+class FanOut:
+    """Sends one message as a DM to many users concurrently.
+
+    A bounded worker pool posts to each user's DM channel, opening it only when
+    the channel id is not cached yet. Calls go through a per-method token bucket sized to Slack's rate-limit
+    tiers, and a 429 response pauses that method for every worker for the
+    `Retry-After` period before the call is retried.
+    """
+
+    logger: Logger
+    app: App
+
+    def broadcast(self, users, on_result=None, **message):
+        """Send `message` to every user and return a BroadcastStats.
+
+        `on_result(user, ok, error)` is called from the worker thread once a
+        user's delivery has succeeded or finally failed.
+        """
+        stats = BroadcastStats()
+        started_at = time.monotonic()
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="fanout"
+        ) as executor:
+            for user in users:
+                executor.submit(self._deliver, user, message, stats, on_result)
+
+        stats.wall_time = time.monotonic() - started_at
+        self.logger.info(f"Broadcast finished: {stats}")
+        return stats
+
+    def call(self, method, stats=None, **kwargs):
+        """Call a Web API method, waiting for rate limits and retrying 429s."""
+        limiter = self._limiter(method)
+        client_method = getattr(self.app.client, method.replace(".", "_"))
+        attempt = 0
+        while True:
+            limiter.acquire()
+            try:
+                return client_method(**kwargs)
+            except SlackApiError as e:
+                status = e.response.status_code
+                if attempt >= self.max_retries or (status != 429 and status < 500):
+                    raise
+                if status == 429:
+                    limiter.pause(_retry_after(e.response))
+                else:
+                    time.sleep(2**attempt)
+            except (URLError, ConnectionError):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(2**attempt)
+
+            attempt += 1
+            if stats is not None:
+                stats._add(retried=1)
+
+    def _deliver(self, user, message, stats, on_result):
+        try:
+            channel_id = get_cached_private_chat(user["id"])
+            try:
+                if channel_id is None:
+                    channel_id = self._open_private_chat(user, stats)
+                self.call("chat.postMessage", stats=stats, channel=channel_id, **message)
+            except SlackApiError as e:
+                if e.response.get("error") != "channel_not_found":
+                    raise
+                # The cached channel is gone; open a fresh one and retry once.
+                forget_private_chat(user["id"])
+                channel_id = self._open_private_chat(user, stats)
+                stats._add(retried=1)
+                self.call("chat.postMessage", stats=stats, channel=channel_id, **message)
+        except Exception as e:
+            stats._add(failed=1)
+            self.logger.error(f"Error sending message to {user['id']}: {e}")
+            if on_result is not None:
+                on_result(user, False, e)
+            return
+
+        stats._add(sent=1)
+        if on_result is not None:
+            on_result(user, True, None)
+
+    def _open_private_chat(self, user, stats):
+        conv = self.call("conversations.open", stats=stats, users=user["id"])
+        channel_id = conv["channel"]["id"]
+        remember_private_chat(user["id"], channel_id)
+        return channel_id
+
+    def _limiter(self, method):
+        with self._lock:
+            if method not in self._limiters:
+                self._limiters[method] = RateLimiter(
+                    self.rates.get(method, TIER_RATES[3])
+                )
+            return self._limiters[method]
+
+    def __init__(
+        self,
+        logger: Logger,
+        app: App,
+        workers=Config.FANOUT_WORKERS,
+        max_retries=Config.FANOUT_MAX_RETRIES,
+        rates=METHOD_RATES,
+    ):
+        self.logger = logger
+        self.app = app
+        self.workers = workers
+        self.max_retries = max_retries
+        self.rates = rates
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+
+def _retry_after(response):
+    headers = response.headers or {}
+    value = headers.get("Retry-After", headers.get("retry-after", 1))
+    if isinstance(value, list):
+        value = value[0] if value else 1
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 1.0
@@ -1,21 +1,3 @@
-from datetime import date
-
-import holidays
-from dateutil import relativedelta
-
-
-def is_last_day_of_month():
-    se_holidays = holidays.country_holidays("SE")
-    date_today = date.today()
-    date_last = date_today + relativedelta.relativedelta(day=31)
-    while True:
-        if date_last.weekday() < 5 and date_last not in se_holidays:
-            break
-        date_last = date_last + relativedelta.relativedelta(days=-1)
-
-    return date_today == date_last
-
-
 def get_register_time_message():
     return {
         "text": "Påminnelse! Nu är det sista dagen i månaden att tidsrapportera! Var en snäll hejare och rapportera i tid!",
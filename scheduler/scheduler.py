@@ -1,17 +1,22 @@
-import time
+import threading
 from enum import Enum
 from logging import Logger
-from multiprocessing import Process
 from typing import Dict, Optional, Sequence, Union
 
-import schedule
 from slack_bolt import App
 from slack_sdk.models.attachments import Attachment
 from slack_sdk.models.blocks import Block
 
-from chat_helper import all_users, get_private_chat
-from db import query
-from scheduler.register_time import get_register_time_message, is_last_day_of_month
+import async_db
+from chat_helper import all_users
+from config import Config
+from cv_compaction import CvCompactor
+from db import insert_many, query
+from scheduler.engine import Daily, Every, JobEngine, Weekly, WorkingDay
+from scheduler.fanout import FanOut
+
+# Ledger rows deleted per statement by the nightly cleanup
+LEDGER_PURGE_BATCH_SIZE = 1000
 
 
 class PostTypes(Enum):
@@ -38,9 +43,179 @@ def consume_scheduled_post(post_id):
     return query("DELETE FROM scheduled_posts WHERE post_id=%s", (post_id,))
 
 
+# ============================================================================
+# Keyset-paginated listing (/admin list posts)
+#
+# Pages are addressed by the id of the last post shown (`after_id`) or the
+# first one (`before_id`), so every page is one index range scan of at most
+# `limit + 1` rows whatever its position. Filters use the (type, id) and
+# (added_by, id) indexes.
+# ============================================================================
+
+
+def scheduled_posts_page_query(
+    post_type=None, added_by=None, after_id=None, before_id=None, limit=10
+):
+    conditions, parameters = [], []
+    if post_type is not None:
+        conditions.append("type=%s")
+        parameters.append(post_type)
+    if added_by is not None:
+        conditions.append("added_by=%s")
+        parameters.append(added_by)
+    if before_id is not None:
+        conditions.append("id<%s")
+        parameters.append(before_id)
+    elif after_id is not None:
+        conditions.append("id>%s")
+        parameters.append(after_id)
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    order = "DESC" if before_id is not None else "ASC"
+    return (
+        f"SELECT id,post_id,type,text,added_by FROM scheduled_posts {where}"
+        f"ORDER BY id {order} LIMIT %s",
+        (*parameters, limit + 1),
+    )
+
+
+def scheduled_posts_page(rows, after_id=None, before_id=None, limit=10):
+    """Return (posts, has_previous, has_next) for rows from scheduled_posts_page_query."""
+    more = len(rows) > limit
+    posts = list(rows[:limit])
+    if before_id is not None:
+        return posts[::-1], more, True
+    return posts, after_id is not None, more
+
+
+def get_scheduled_posts_page(after_id=None, before_id=None, limit=10, **filters):
+    rows = query(
+        *scheduled_posts_page_query(
+            after_id=after_id, before_id=before_id, limit=limit, **filters
+        )
+    )
+    return scheduled_posts_page(rows, after_id, before_id, limit)
+
+
+async def get_scheduled_posts_page_async(
+    after_id=None, before_id=None, limit=10, **filters
+):
+    rows = await async_db.query(
+        *scheduled_posts_page_query(
+            after_id=after_id, before_id=before_id, limit=limit, **filters
+        )
+    )
+    return scheduled_posts_page(rows, after_id, before_id, limit)
+
+
+# ============================================================================
+# Delivery ledger
+#
+# One scheduled_post_deliveries row per post and recipient moves from pending
+# to sending (claimed) to sent, or back to pending after a failed attempt until
+# DELIVERY_MAX_ATTEMPTS is reached and it is marked failed. A failed recipient
+# is not claimed again before next_attempt_at, DELIVERY_RETRY_BACKOFF seconds
+# later and doubling with each attempt; the delivery_retries job picks it up
+# once that has passed. Rows are claimed with FOR UPDATE SKIP
+# LOCKED so several schedulers can share one broadcast, and a claim whose
+# lease expires (the sender died) is picked up again. Rows of posts that have
+# been consumed are purged nightly.
+# ============================================================================
+
+
+def enqueue_deliveries(post_id, user_ids):
+    """Create pending ledger rows; recipients already in the ledger are kept as is."""
+    insert_many(
+        "INSERT INTO scheduled_post_deliveries (post_id,user_id) VALUES %s "
+        "ON CONFLICT (post_id,user_id) DO NOTHING",
+        [(post_id, user_id) for user_id in user_ids],
+    )
+
+
+def claim_deliveries(post_id, limit, lease_seconds):
+    rows = query(
+        """
+        UPDATE scheduled_post_deliveries
+        SET status='sending', claimed_at=now(), attempts=attempts+1, updated_at=now()
+        WHERE (post_id,user_id) IN (
+            SELECT post_id,user_id FROM scheduled_post_deliveries
+            WHERE post_id=%s AND (
+                (status='pending' AND next_attempt_at <= now())
+                OR (status='sending' AND claimed_at < now() - make_interval(secs => %s))
+            )
+            ORDER BY user_id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING user_id
+        """,
+        (post_id, lease_seconds, limit),
+    )
+    return [row["user_id"] for row in rows]
+
+
+def record_delivery(post_id, user_id, error=None, max_attempts=1, backoff=0):
+    if error is None:
+        query(
+            "UPDATE scheduled_post_deliveries SET status='sent',last_error=NULL,"
+            "updated_at=now() WHERE post_id=%s AND user_id=%s",
+            (post_id, user_id),
+        )
+        return
+    query(
+        "UPDATE scheduled_post_deliveries SET "
+        "status=CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,"
+        "next_attempt_at=now() + make_interval(secs => %s * power(2, attempts - 1)),"
+        "last_error=%s,updated_at=now() WHERE post_id=%s AND user_id=%s",
+        (max_attempts, backoff, str(error), post_id, user_id),
+    )
+
+
+def purge_consumed_deliveries(batch_size=LEDGER_PURGE_BATCH_SIZE):
+    """Delete ledger rows of posts that no longer exist; returns the row count."""
+    total = 0
+    while True:
+        rows = query(
+            """
+            DELETE FROM scheduled_post_deliveries WHERE (post_id,user_id) IN (
+                SELECT d.post_id,d.user_id FROM scheduled_post_deliveries d
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM scheduled_posts p WHERE p.post_id=d.post_id
+                )
+                LIMIT %s
+            )
+            RETURNING post_id
+            """,
+            (batch_size,),
+        )
+        total += len(rows)
+        if len(rows) < batch_size:
+            return total
+
+
+def count_open_deliveries(post_id):
+    rows = query(
+        "SELECT count(*) AS open FROM scheduled_post_deliveries "
+        "WHERE post_id=%s AND status IN ('pending','sending')",
+        (post_id,),
+    )
+    return rows[0]["open"]
+
+
+def get_interrupted_posts():
+    """Posts that still exist and have recipients left to send to now."""
+    return query(
+        "SELECT post_id,type,text,added_by FROM scheduled_posts p WHERE EXISTS ("
+        "SELECT 1 FROM scheduled_post_deliveries d WHERE d.post_id=p.post_id "
+        "AND (d.status='sending' OR "
+        "(d.status='pending' AND d.next_attempt_at <= now())))"
+    )
+
+
 class Scheduler:
     logger: Logger
     app: App
+    fanout: FanOut
+    engine: JobEngine
 
     def event_monday_morning(self):
         self._send_scheduled_post(PostTypes.MondayMorning)
@@ -49,38 +224,111 @@ class Scheduler:
         self._send_scheduled_post(PostTypes.FridayMorning)
 
     def event_morning_check_in(self):
-        #if is_last_day_of_month():
-        #    self._send_message(**get_register_time_message())
+        # Registered for the last working day of the month only; disabled
+        # for now. To enable it, uncomment both lines:
+        # from scheduler.register_time import get_register_time_message
+        # self._send_message(**get_register_time_message())
         pass
 
-    def start(self):
-        schedule.every().monday.at("09:00", "Europe/Stockholm").do(
-            self.event_monday_morning
-        )
+    def event_ledger_cleanup(self):
+        purged = purge_consumed_deliveries()
+        self.logger.info(f"Purged {purged} delivery ledger rows of consumed posts")
 
-        schedule.every().friday.at("09:00", "Europe/Stockholm").do(
-            self.event_friday_morning
-        )
+    def register(self, name, rule, func):
+        """Register a job; `rule` is a scheduler.engine rule such as Weekly."""
+        return self.engine.register(name, rule, func)
 
-        schedule.every().day.at("08:30", "Europe/Stockholm").do(
-            self.event_morning_check_in
+    def register_default_jobs(self):
+        self.register(
+            "monday_morning", Weekly("monday", "09:00"), self.event_monday_morning
+        )
+        self.register(
+            "friday_morning", Weekly("friday", "09:00"), self.event_friday_morning
+        )
+        self.register(
+            "morning_check_in", WorkingDay("08:30", n=-1), self.event_morning_check_in
+        )
+        self.register(
+            "cv_entry_compaction", Daily("03:00"), CvCompactor(logger=self.logger).run
+        )
+        self.register(
+            "delivery_ledger_cleanup", Daily("03:00"), self.event_ledger_cleanup
+        )
+        self.register(
+            "delivery_retries",
+            Every(max(Config.DELIVERY_RETRY_BACKOFF, 1)),
+            self.resume_interrupted_posts,
         )
 
-        p = Process(target=self.run)
-        p.start()
+    def jobs(self):
+        return self.engine.jobs()
 
-    def run(self):
-        while True:
-            schedule.run_pending()
-            time.sleep(10)
+    def start(self):
+        """Run registered jobs on a background thread in this process."""
+        self.engine.start()
+        threading.Thread(
+            target=self.resume_interrupted_posts, name="resume-posts", daemon=True
+        ).start()
+
+    def resume_interrupted_posts(self):
+        """Finish broadcasts left half-sent by a previous run or failed sends."""
+        try:
+            for scheduled_post in get_interrupted_posts():
+                self.logger.info(f"Resuming delivery of post {scheduled_post['post_id']}")
+                self._deliver_post(scheduled_post)
+        except Exception as e:
+            self.logger.error(f"Error resuming scheduled posts: {e}")
+
+    def stop(self, timeout=None):
+        """Stop running jobs; a job already in progress finishes on its own.
+
+        Returns False if that job was still running after `timeout` seconds.
+        """
+        return self.engine.stop(timeout)
 
     def _send_scheduled_post(self, post_type: PostTypes):
         posts = get_scheduled_posts_by_type(post_type)
+        if not posts:
+            return
 
+        user_ids = [user["id"] for user in all_users(self.app)]
         for scheduled_post in posts:
-            self._send_message(text=scheduled_post["text"])
+            enqueue_deliveries(scheduled_post["post_id"], user_ids)
+            self._deliver_post(scheduled_post)
+
+    def _deliver_post(self, scheduled_post):
+        """Send a post to its due recipients, claiming them in batches.
+
+        Recipients whose send failed are left pending until their backoff has
+        passed, for the delivery_retries job; the post is consumed once no
+        recipient is left pending or being sent.
+        """
+        post_id = scheduled_post["post_id"]
 
-            consume_scheduled_post(scheduled_post["post_id"])
+        def record(user, ok, error):
+            record_delivery(
+                post_id,
+                user["id"],
+                error,
+                max_attempts=Config.DELIVERY_MAX_ATTEMPTS,
+                backoff=Config.DELIVERY_RETRY_BACKOFF,
+            )
+
+        while True:
+            user_ids = claim_deliveries(
+                post_id, Config.DELIVERY_BATCH_SIZE, Config.DELIVERY_LEASE_SECONDS
+            )
+            if not user_ids:
+                break
+            self.fanout.broadcast(
+                [{"id": user_id} for user_id in user_ids],
+                on_result=record,
+                text=scheduled_post["text"],
+            )
+
+        # Other schedulers may still hold claims; the last one out consumes it.
+        if count_open_deliveries(post_id) == 0:
+            consume_scheduled_post(post_id)
 
     def _send_message(
         self,
@@ -88,14 +336,15 @@ class Scheduler:
         attachments: Optional[Union[str, Sequence[Union[Dict, Attachment]]]] = None,
         blocks: Optional[Union[str, Sequence[Union[Dict, Block]]]] = None,
     ):
-        for user in all_users(self.app):
-            self.app.client.chat_postMessage(
-                channel=get_private_chat(self.app, user),
-                text=text,
-                attachments=attachments,
-                blocks=blocks,
-            )
+        return self.fanout.broadcast(
+            all_users(self.app),
+            text=text,
+            attachments=attachments,
+            blocks=blocks,
+        )
 
     def __init__(self, logger: Logger, app: App):
         self.logger = logger
         self.app = app
+        self.fanout = FanOut(logger=logger, app=app)
+        self.engine = JobEngine(logger=logger)
@@ -0,0 +1,41 @@
+"""
+Slack Web API client that records every call in the slack_api metrics.
+
+Kept apart from instrumentation so that modules which only talk to the
+database (db, seeder.py, migrations) do not import slack_sdk.
+"""
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web import WebClient
+
+from instrumentation import Operation
+
+
+def slack_error_name(e):
+    """Label a failed call by Slack's error code, e.g. "channel_not_found"."""
+    if isinstance(e, SlackApiError):
+        return e.response.get("error") or type(e).__name__
+    return type(e).__name__
+
+
+slack_api = Operation("slack_api", ("method",), error_name=slack_error_name)
+
+
+def client_settings(client):
+    """Constructor arguments that rebuild `client` as another client class."""
+    return {
+        "token": client.token,
+        "base_url": client.base_url,
+        "timeout": client.timeout,
+        "ssl": client.ssl,
+        "proxy": client.proxy,
+        "headers": client.headers,
+        "logger": client.logger,
+        "retry_handlers": list(client.retry_handlers or []),
+    }
+
+
+class InstrumentedWebClient(WebClient):
+    def api_call(self, api_method, **kwargs):
+        with slack_api.track(api_method):
+            return super().api_call(api_method, **kwargs)
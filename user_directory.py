@@ -0,0 +1,137 @@
+import threading
+import time
+from logging import Logger
+
+from slack_bolt import App
+
+from config import Config
+
+# Only the fields the bot reads are kept for each member.
+USER_FIELDS = ("id", "name", "real_name", "is_bot", "deleted")
+
+
+class UserDirectory:
+    """In-memory snapshot of the workspace's members.
+
+    `refresh()` pages through users.list and swaps in a new snapshot, indexed
+    by user id and by name. Between refreshes the snapshot is kept current
+    from user_change and team_join events via `apply_user()`; events that
+    arrive while a refresh is paging are replayed onto its snapshot too. Only
+    one refresh runs at a time, so concurrent first lookups load it once.
+    """
+
+    logger: Logger
+    app: App
+
+    def members(self):
+        """Return all members, refreshing first if nothing has been loaded."""
+        self._ensure_loaded()
+        return list(self._by_id.values())
+
+    def get(self, user_id):
+        return self._by_id.get(user_id)
+
+    def get_by_name(self, name):
+        self._ensure_loaded()
+        user_id = self._id_by_name.get(name)
+        return self._by_id.get(user_id) if user_id else None
+
+    def refresh(self):
+        """Reload every member, following users.list's pagination cursor."""
+        with self._refresh_lock:
+            self._refresh()
+
+    def apply_user(self, member):
+        """Add or update a single member from a user_change or team_join event."""
+        user = _compact(member)
+        with self._lock:
+            if self._applied_during_refresh is not None:
+                self._applied_during_refresh.append(user)
+            by_id = dict(self._by_id)
+            id_by_name = dict(self._id_by_name)
+            _apply(by_id, id_by_name, user)
+            self._by_id = by_id
+            self._id_by_name = id_by_name
+
+    def _ensure_loaded(self):
+        if self._refreshed_at is None:
+            with self._refresh_lock:
+                if self._refreshed_at is None:
+                    self._refresh()
+
+    def _refresh(self):
+        with self._lock:
+            self._applied_during_refresh = []
+        try:
+            by_id = {}
+            cursor = None
+            while True:
+                response = self.app.client.users_list(
+                    limit=self.page_size, cursor=cursor
+                )
+                for member in response["members"]:
+                    by_id[member["id"]] = _compact(member)
+                cursor = response.get("response_metadata", {}).get("next_cursor")
+                if not cursor:
+                    break
+
+            with self._lock:
+                id_by_name = {user["name"]: user["id"] for user in by_id.values()}
+                # The pages may predate these events, so they win
+                for user in self._applied_during_refresh:
+                    _apply(by_id, id_by_name, user)
+                self._by_id = by_id
+                self._id_by_name = id_by_name
+                self._refreshed_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._applied_during_refresh = None
+        self.logger.info(f"User directory refreshed with {len(by_id)} members")
+
+    def start(self):
+        """Refresh the directory in the background every `refresh_interval` seconds."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="user-directory", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                self.logger.error(f"Error refreshing user directory: {e}")
+            time.sleep(self.refresh_interval)
+
+    def __init__(
+        self,
+        logger: Logger,
+        app: App,
+        refresh_interval=Config.USER_DIRECTORY_REFRESH_INTERVAL,
+        page_size=200,
+    ):
+        self.logger = logger
+        self.app = app
+        self.refresh_interval = refresh_interval
+        self.page_size = page_size
+        self._by_id = {}
+        self._id_by_name = {}
+        self._refreshed_at = None
+        self._applied_during_refresh = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+
+def _apply(by_id, id_by_name, user):
+    previous = by_id.get(user["id"])
+    by_id[user["id"]] = user
+    if previous is not None:
+        id_by_name.pop(previous["name"], None)
+    id_by_name[user["name"]] = user["id"]
+
+
+def _compact(member):
+    return {field: member.get(field) for field in USER_FIELDS}
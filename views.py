@@ -0,0 +1,198 @@
+"""
+Block Kit payloads shared by the sync and async Slack apps.
+"""
+
+import json
+import re
+
+from config import Config
+from scheduler.scheduler import PostTypes, get_post_type_display_text
+
+
+def demo_button_blocks():
+    return [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": "Click the button below to see an interactive response!",
+            },
+        },
+        {
+            "type": "actions",
+            "elements": [
+                {
+                    "type": "button",
+                    "text": {"type": "plain_text", "text": "Click Me"},
+                    "action_id": "button_click",
+                    "style": "primary",
+                }
+            ],
+        },
+    ]
+
+
+# Slack renders at most 50 blocks per message and 3000 characters per section
+MAX_BLOCKS = 50
+MAX_SECTION_CHARS = 3000
+BLOCKS_PER_POST = 2
+# Header and pagination buttons
+PAGE_CHROME_BLOCKS = 2
+POST_PREVIEW_CHARS = 500
+
+MENTION = re.compile(r"^<@([A-Z0-9]+)(?:\|[^>]*)?>$")
+# Sent instead of MENTION unless the command escapes channels, users and links
+PLAIN_MENTION = re.compile(r"^@(\S+)$")
+
+
+def posts_page_size(requested=Config.ADMIN_POSTS_PAGE_SIZE):
+    """Clamp the page size so a full page stays within the block budget."""
+    return max(1, min(requested, (MAX_BLOCKS - PAGE_CHROME_BLOCKS) // BLOCKS_PER_POST))
+
+
+def parse_post_filters(text, find_user=None):
+    """Parse `[<post type>] [@author]` after `list posts`.
+
+    The author is an escaped mention, or a plain `@name` looked up with
+    `find_user` (e.g. UserDirectory.get_by_name). Raises ValueError for
+    anything that is neither a post type nor a known author.
+    """
+    types = {post_type.value.lower(): post_type.value for post_type in PostTypes}
+    filters = {}
+    for token in text.split():
+        mention = MENTION.match(token)
+        plain = PLAIN_MENTION.match(token)
+        if mention:
+            filters["added_by"] = mention.group(1)
+        elif plain and find_user is not None:
+            user = find_user(plain.group(1))
+            if user is None:
+                raise ValueError(token)
+            filters["added_by"] = user["id"]
+        elif token.lower() in types:
+            filters["post_type"] = types[token.lower()]
+        else:
+            raise ValueError(token)
+    return filters
+
+
+def truncate(text, limit):
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+def scheduled_posts_message(posts, filters, has_previous, has_next):
+    """One page of scheduled posts with previous/next buttons, as say() kwargs.
+
+    Button values carry the filters and the keyset cursor for the page they
+    lead to, so paging needs no server-side state.
+    """
+    description = "Schemalagda poster"
+    if "post_type" in filters:
+        post_type = get_post_type_display_text(PostTypes(filters["post_type"]))
+        description += f" ({post_type})"
+    if "added_by" in filters:
+        description += f" skapade av <@{filters['added_by']}>"
+    if not posts:
+        description += ": inga fler poster"
+
+    blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": description}}]
+    for post in posts:
+        blocks += [
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": truncate(
+                        post["text"], min(POST_PREVIEW_CHARS, MAX_SECTION_CHARS)
+                    ),
+                },
+            },
+            {
+                "type": "context",
+                "elements": [
+                    {
+                        "type": "mrkdwn",
+                        "text": f"Skapad av: <@{post['added_by']}>\nTidpunkt: {get_post_type_display_text(PostTypes[post['type']])}\nId: {post['post_id']}",
+                    }
+                ],
+            },
+        ]
+
+    buttons = []
+    if has_previous and posts:
+        buttons.append(
+            page_button(
+                "Föregående", "list_posts_previous", filters, before_id=posts[0]["id"]
+            )
+        )
+    if has_next and posts:
+        buttons.append(
+            page_button("Nästa", "list_posts_next", filters, after_id=posts[-1]["id"])
+        )
+    if buttons:
+        blocks.append({"type": "actions", "elements": buttons})
+    return {"text": description, "blocks": blocks}
+
+
+def page_button(text, action_id, filters, **cursor):
+    return {
+        "type": "button",
+        "text": {"type": "plain_text", "text": text},
+        "action_id": action_id,
+        "value": json.dumps({"filters": filters, **cursor}),
+    }
+
+
+def create_post_modal():
+    return {
+        "type": "modal",
+        "callback_id": "create_post_dialog",
+        "title": {"type": "plain_text", "text": "Skapa en ny post"},
+        "submit": {"type": "plain_text", "text": "Skapa"},
+        "blocks": [
+            {
+                "type": "input",
+                "block_id": "text_block",
+                "element": {
+                    "type": "plain_text_input",
+                    "action_id": "text",
+                    "multiline": True,
+                },
+                "label": {"type": "plain_text", "text": "Meddelande"},
+            },
+            {
+                "type": "input",
+                "block_id": "type_block",
+                "element": {
+                    "type": "static_select",
+                    "action_id": "type",
+                    "options": [
+                        {
+                            "text": {
+                                "type": "plain_text",
+                                "text": get_post_type_display_text(post_type),
+                            },
+                            "value": post_type.value,
+                        }
+                        for post_type in PostTypes
+                    ],
+                },
+                "label": {"type": "plain_text", "text": "Tidpunkt"},
+            },
+        ],
+    }
+
+
+def home_view():
+    return {
+        "type": "home",
+        "blocks": [
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": "Hej hej! Jag är HejBot :hej: :robot_face:\n\nJag kommer hjälpa dig med lite smått o gott. Mer info kommer! :star-struck:\n\nOm du är nyfiken kan du prata med @jennifer, @malin, @ellen, @kevin eller @john .",
+                },
+            }
+        ],
+    }